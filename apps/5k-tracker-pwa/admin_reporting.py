@@ -0,0 +1,128 @@
+"""
+Admin reporting: per-user activity for the /admin page.
+
+One statement per page: the page of user ids is selected first, and race,
+workout and photo aggregates (counts, latest activity, photo bytes on disk
+from ``RacePhoto.size_bytes``) are grouped only over those users and
+left-joined back, so the cost follows ``per_page`` rather than the number of
+signups. Site totals are a single statement of scalar subqueries.
+
+Results are plain tuples cached per process for ``ADMIN_REPORT_CACHE_SECONDS``;
+admin actions call ``invalidate`` so their own changes show immediately.
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import func, select
+
+import pagination
+
+ADMIN_REPORT_CACHE_SECONDS = float(os.environ.get('ADMIN_REPORT_CACHE_SECONDS', '30'))
+ADMIN_USERS_PER_PAGE = int(os.environ.get('ADMIN_USERS_PER_PAGE', '24'))
+
+UserActivity = namedtuple('UserActivity', [
+    'id', 'email', 'username', 'first_name', 'last_name', 'is_admin', 'created_at',
+    'race_count', 'last_race_date', 'workout_count', 'photo_count', 'storage_bytes', 'last_activity',
+])
+
+Totals = namedtuple('Totals', ['users', 'admins', 'races', 'workouts', 'photos', 'storage_bytes'])
+
+
+def _latest(*stamps):
+    stamps = [s for s in stamps if s is not None]
+    return max(stamps) if stamps else None
+
+
+class AdminReport:
+    """Cached per-user activity pages and site totals."""
+
+    def __init__(self, db, user, race, workout, photo, ttl=ADMIN_REPORT_CACHE_SECONDS):
+        self.db = db
+        self.User, self.Race, self.Workout, self.Photo = user, race, workout, photo
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            hit = self._data.get(key)
+            if hit and now - hit[1] < self.ttl:
+                return hit[0]
+        value = loader()
+        with self._lock:
+            self._data[key] = (value, now)
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._data.clear()
+
+    # --- Queries ---
+    def _totals(self):
+        User, Race, Workout, Photo = self.User, self.Race, self.Workout, self.Photo
+        row = self.db.session.execute(select(
+            select(func.count(User.id)).scalar_subquery(),
+            select(func.count(User.id)).where(User.is_admin.is_(True)).scalar_subquery(),
+            select(func.count(Race.id)).scalar_subquery(),
+            select(func.count(Workout.id)).scalar_subquery(),
+            select(func.count(Photo.id)).scalar_subquery(),
+            select(func.coalesce(func.sum(Photo.size_bytes), 0)).scalar_subquery(),
+        )).one()
+        return Totals(*(int(v or 0) for v in row))
+
+    def _user_rows(self, page, per_page):
+        User, Race, Workout, Photo = self.User, self.Race, self.Workout, self.Photo
+        order = (User.created_at.desc(), User.id.desc())
+        paged = (select(User.id).order_by(*order)
+                 .limit(per_page).offset((page - 1) * per_page).subquery())
+        in_page = select(paged.c.id)
+        races = (select(Race.user_id,
+                        func.count(Race.id).label('n'),
+                        func.max(Race.race_date).label('last_date'),
+                        func.max(Race.created_at).label('last_at'))
+                 .where(Race.user_id.in_(in_page)).group_by(Race.user_id).subquery())
+        workouts = (select(Workout.user_id,
+                           func.count(Workout.id).label('n'),
+                           func.max(Workout.created_at).label('last_at'))
+                    .where(Workout.user_id.in_(in_page)).group_by(Workout.user_id).subquery())
+        photos = (select(Race.user_id,
+                         func.count(Photo.id).label('n'),
+                         func.coalesce(func.sum(Photo.size_bytes), 0).label('bytes'),
+                         func.max(Photo.uploaded_at).label('last_at'))
+                  .join(Race, Race.id == Photo.race_id)
+                  .where(Race.user_id.in_(in_page)).group_by(Race.user_id).subquery())
+        stmt = (select(User.id, User.email, User.username, User.first_name, User.last_name,
+                       User.is_admin, User.created_at,
+                       races.c.n, races.c.last_date, races.c.last_at,
+                       workouts.c.n, workouts.c.last_at,
+                       photos.c.n, photos.c.bytes, photos.c.last_at)
+                .join(paged, paged.c.id == User.id)
+                .outerjoin(races, races.c.user_id == User.id)
+                .outerjoin(workouts, workouts.c.user_id == User.id)
+                .outerjoin(photos, photos.c.user_id == User.id)
+                .order_by(*order))
+        rows = []
+        for (uid, email, username, first, last, is_admin, created_at,
+             race_n, last_race_date, race_at, workout_n, workout_at,
+             photo_n, photo_bytes, photo_at) in self.db.session.execute(stmt):
+            rows.append(UserActivity(
+                uid, email, username, first, last, bool(is_admin), created_at,
+                race_n or 0, last_race_date, workout_n or 0, photo_n or 0, int(photo_bytes or 0),
+                _latest(race_at, workout_at, photo_at),
+            ))
+        return rows
+
+    # --- Public API ---
+    def totals(self):
+        return self._cached(('totals',), self._totals)
+
+    def users_page(self, page=1, per_page=ADMIN_USERS_PER_PAGE):
+        """``pagination.Page`` of ``UserActivity`` rows, newest signups first."""
+        total = self.totals().users
+        pages = max(1, -(-total // per_page))
+        page = min(max(1, page or 1), pages)
+        rows = self._cached(('users', page, per_page), lambda: self._user_rows(page, per_page))
+        return pagination.Page(rows, page, per_page, total)
@@ -1,11 +1,13 @@
 # --- Imports ---
 import os
 import sys
+import time
 import uuid
-from datetime import datetime, timedelta
+import json
+from datetime import date, datetime, timedelta
 import requests
 import math
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory, stream_with_context, abort, g
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -14,8 +16,22 @@ from dotenv import load_dotenv
 import re
 from werkzeug.middleware.proxy_fix import ProxyFix
 import traceback
-from sqlalchemy import desc
+from sqlalchemy import desc, event, func, and_, or_
+from sqlalchemy.orm import selectinload
 from typing import Any, cast
+import photo_pipeline
+import jobs
+import uploads
+import weather
+import pagination
+import healthkit
+import data_export
+import static_assets
+import db_engine
+import durations
+import auth
+import admin_reporting
+import fragments
 
 # --- Helper to select weather icon ---
 def weather_icon(weather_str):
@@ -43,18 +59,25 @@ def weather_icon(weather_str):
 
 
 app = Flask(__name__)
+app.request_class = uploads.StreamingRequest
 app.config['APPLICATION_ROOT'] = '/'
 app.config['PREFERRED_URL_SCHEME'] = 'https'
 app.config['SECRET_KEY'] = os.environ.get('TRACKER_SECRET_KEY', 'changeme-please-set-TRACKER_SECRET_KEY')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('TRACKER_DATABASE_URI', 'sqlite:///race_tracker.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Pool sizing / timeouts per backend (see db_engine.py)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_engine.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('UPLOAD_MAX_REQUEST_BYTES', str(16 * 1024 * 1024)))  # per-request budget; per-file is PHOTO_MAX_FILE_BYTES
 # Secure/persistent session settings
 app.config['SESSION_COOKIE_SECURE'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 app.config['REMEMBER_COOKIE_DURATION'] = timedelta(days=30)
 app.config['REMEMBER_COOKIE_SECURE'] = True
+# Reverse proxies in front of the app (nginx); their X-Forwarded-For gives the client address
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', '1'))
+if TRUSTED_PROXY_HOPS > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
 
 # Development toggles for hot reload
 if os.environ.get('FLASK_ENV') == 'development' or os.environ.get('FLASK_DEBUG') == '1':
@@ -82,19 +105,43 @@ def inject_env_flags():
 
 
 # --- Template context processor: asset_version for cache-busting ---
+# Content hashes of everything under static/ (built into the image, see static_assets.py)
+asset_manifest = static_assets.AssetManifest(app.static_folder)
+
 def _get_asset_version():
-    try:
-        # short git hash, fall back to timestamp
-        import subprocess
-        sha = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(__file__)).decode().strip()
-        return sha
-    except Exception:
-        return str(int(datetime.utcnow().timestamp()))
+    # Digest of the asset manifest: stable across requests and workers, changes when any asset does
+    return asset_manifest.version
+
+# {% cache %} blocks in dashboard/races/statistics; backend and scope are set up below the models
+app.jinja_env.add_extension(fragments.FragmentCacheExtension)
 
 @app.context_processor
 def inject_asset_version():
     return {'asset_version': _get_asset_version()}
 
+@app.template_global()
+def asset_url(filename):
+    """Fingerprinted, immutable URL for a static file (plain static URL in development)."""
+    hashed = asset_manifest.hashed(filename)
+    if hashed is None or _is_dev_runtime():
+        return url_for('static', filename=filename)
+    return url_for('hashed_asset', filename=hashed)
+
+@app.after_request
+def add_conditional_headers(response):
+    """Strong ETag and 304 handling for buffered JSON/HTML GET responses."""
+    if (request.method in ('GET', 'HEAD') and response.status_code == 200
+            and not response.is_streamed and not response.direct_passthrough
+            and response.mimetype in ('application/json', 'text/html')):
+        if 'ETag' not in response.headers:
+            response.add_etag()
+        if 'Cache-Control' not in response.headers:
+            # Per-user content: browsers may keep it but must revalidate
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+        response.make_conditional(request)
+    return response
+
 # --- Flask-Login Manager ---
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -133,12 +180,16 @@ class PrefixMiddleware:
 try:
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'photos'), exist_ok=True)
+    os.makedirs(photo_pipeline.derived_dir(os.path.join(app.config['UPLOAD_FOLDER'], 'photos')), exist_ok=True)
 except PermissionError:
     # Directory might already exist with proper permissions from Dockerfile
     pass
 
 # --- Database setup ---
 db = SQLAlchemy(app)
+with app.app_context():
+    # SQLite WAL/synchronous/mmap pragmas on connect, slow-query logging everywhere
+    db_engine.install(db.engine)
 
 
 
@@ -164,11 +215,21 @@ class User(UserMixin, db.Model):
     reset_token = db.Column(db.String(100), nullable=True)
     reset_token_expiry = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped on password change; part of the session id, so older sessions stop loading
+    auth_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     # Relationship to races
     races = db.relationship('Race', backref='runner', lazy=True, cascade='all, delete-orphan')
 
+    __table_args__ = (
+        db.Index('uq_user_reset_token', 'reset_token', unique=True),
+    )
+
+    def get_id(self):
+        return auth.session_token(self.id, self.auth_version)
+
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
+        self.auth_version = (self.auth_version or 0) + 1
 
     def check_password(self, password):
         if not isinstance(self.password_hash, str):
@@ -196,6 +257,16 @@ class User(UserMixin, db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
+# Session user snapshots keyed (id, auth_version), see auth.py
+user_cache = auth.UserCache()
+# Password checks and reset-token requests, per client address and per email
+auth_limiter = auth.TokenBucket()
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_invalidate_cache(mapper, connection, target):
+    user_cache.invalidate(target.id)
+
 class Race(db.Model):
     def __init__(self, user_id, race_name, race_type, race_date, race_time, finish_time, location=None, weather=None, start_weather=None, finish_weather=None, notes=None, race_page_url=None, created_at=None):
         self.user_id = user_id
@@ -224,17 +295,47 @@ class Race(db.Model):
     finish_weather = db.Column(db.String(100))  # cached weather at finish
     notes = db.Column(db.Text)
     race_page_url = db.Column(db.String(500))  # URL to race results page
+    finish_seconds = db.Column(db.Float)  # finish_time parsed to seconds; kept in sync on insert/update
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     # Photo relationships
     photos = db.relationship('RacePhoto', backref='race', lazy=True, cascade='all, delete-orphan')
 
+    __table_args__ = (
+        db.Index('ix_race_user_type_seconds', 'user_id', 'race_type', 'finish_seconds'),
+        # Keyset pagination of the race list, with and without a type filter
+        db.Index('ix_race_user_date', 'user_id', 'race_date', 'id'),
+        db.Index('ix_race_user_type_date', 'user_id', 'race_type', 'race_date', 'id'),
+    )
+
     def time_to_seconds(self):
         """Convert finish time to seconds (float). Supports mm:ss.cc, mm:ss, hh:mm:ss(.cc), and 5K-only mm:ss:cc."""
+        if self.finish_seconds is not None:
+            return self.finish_seconds
         return _parse_duration_seconds(self.finish_time or '', (self.race_type or '').strip())
 
+    def refresh_finish_seconds(self):
+        """Recompute the cached finish_seconds column from finish_time/race_type."""
+        self.finish_seconds = _parse_duration_seconds(self.finish_time or '', (self.race_type or '').strip())
+        return self.finish_seconds
+
     def __repr__(self):
         return f'<Race {self.race_name} - {self.finish_time}>'
 
+@event.listens_for(Race, 'before_insert')
+@event.listens_for(Race, 'before_update')
+def _race_sync_finish_seconds(mapper, connection, target):
+    # Every write path (forms, quick add, imports) goes through the ORM, so this keeps PR queries exact
+    target.refresh_finish_seconds()
+
+# Cached per-user list totals for /races and /workouts
+list_counts = pagination.CountCache(ttl=int(os.environ.get('LIST_COUNT_CACHE_SECONDS', '60')))
+
+@event.listens_for(Race, 'after_insert')
+@event.listens_for(Race, 'after_update')
+@event.listens_for(Race, 'after_delete')
+def _race_invalidate_counts(mapper, connection, target):
+    list_counts.invalidate('race', target.user_id)
+
 class RacePhoto(db.Model):
     def __init__(self, race_id, filename, original_filename, photo_type, caption=None):
         self.race_id = race_id
@@ -243,21 +344,66 @@ class RacePhoto(db.Model):
         self.photo_type = photo_type
         self.caption = caption
     id = db.Column(db.Integer, primary_key=True)
-    race_id = db.Column(db.Integer, db.ForeignKey('race.id'), nullable=False)
+    race_id = db.Column(db.Integer, db.ForeignKey('race.id'), nullable=False, index=True)
     filename = db.Column(db.String(255), nullable=False)
     original_filename = db.Column(db.String(255), nullable=False)
     photo_type = db.Column(db.String(50), nullable=False)  # 'finish', 'medal', 'bib', 'other'
     caption = db.Column(db.String(500))
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # JSON description of generated derivatives (see photo_pipeline); NULL until processed
+    variant = db.Column(db.Text)
+    # Original plus derivatives on disk, for admin storage reporting
+    size_bytes = db.Column(db.BigInteger)
+
+    @property
+    def variant_info(self):
+        """Parsed derivative variant, or None while pending / if processing failed."""
+        if not self.variant:
+            return None
+        try:
+            info = json.loads(self.variant)
+        except ValueError:
+            return None
+        return info if info.get('widths') else None
+
+    @property
+    def derivatives_pending(self):
+        """True if derivatives still need building: never processed, or a failed run is due a retry."""
+        if not self.variant:
+            return True
+        try:
+            info = json.loads(self.variant)
+        except ValueError:
+            return True
+        if not info.get('failed'):
+            return False
+        attempts = info.get('attempts') or 1
+        return (attempts < PHOTO_MAX_ATTEMPTS
+                and time.time() - (info.get('failed_at') or 0) >= PHOTO_RETRY_SECONDS * attempts)
 
     def __repr__(self):
         return f'<RacePhoto {self.filename}>'
 
+class WeatherCache(db.Model):
+    """Hourly weather observation shared by every race at a (rounded) location"""
+    __tablename__ = 'weather_cache'
+    id = db.Column(db.Integer, primary_key=True)
+    location_key = db.Column(db.String(200), nullable=False)  # weather.location_key(place)
+    hour = db.Column(db.DateTime, nullable=False)  # local time truncated to the hour
+    provider = db.Column(db.String(30), nullable=False)
+    summary = db.Column(db.String(200), nullable=False)
+    payload = db.Column(db.Text)  # JSON observation as returned by the provider
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('location_key', 'hour', name='uq_weather_cache_location_hour'),
+    )
+
 class Workout(db.Model):
     """Training workout model - different from formal races"""
     def __init__(self, user_id, workout_type, duration, distance=None, pace=None, calories=None, 
                  heart_rate_avg=None, heart_rate_max=None, notes=None, location=None, 
-                 weather=None, workout_date=None, created_at=None):
+                 weather=None, workout_date=None, created_at=None, started_at=None, source=None):
         self.user_id = user_id
         self.workout_type = workout_type
         self.duration = duration
@@ -271,6 +417,8 @@ class Workout(db.Model):
         self.weather = weather
         self.workout_date = workout_date or datetime.utcnow().date()
         self.created_at = created_at or datetime.utcnow()
+        self.started_at = started_at
+        self.source = source
         
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -286,9 +434,17 @@ class Workout(db.Model):
     weather = db.Column(db.String(100))
     workout_date = db.Column(db.Date, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)  # UTC start, set for imported workouts
+    source = db.Column(db.String(100))  # importing app/device (HealthKit sourceApp)
     
     # Relationship to user
     user = db.relationship('User', backref=db.backref('workouts', lazy=True, cascade='all, delete-orphan'))
+
+    __table_args__ = (
+        db.Index('ix_workout_user_date', 'user_id', 'workout_date', 'id'),
+        # Natural key for imports: re-syncing the same HealthKit workout updates it instead of duplicating
+        db.Index('uq_workout_natural_key', 'user_id', 'started_at', 'duration', 'source', unique=True),
+    )
     
     def duration_to_seconds(self):
         """Convert duration to seconds for calculations"""
@@ -297,17 +453,279 @@ class Workout(db.Model):
     def calculate_pace(self):
         """Calculate pace if distance and duration are available"""
         if self.distance and self.duration:
-            seconds = self.duration_to_seconds()
-            if seconds > 0:
-                pace_seconds = seconds / self.distance
-                minutes = int(pace_seconds // 60)
-                seconds = int(pace_seconds % 60)
-                return f"{minutes:02d}:{seconds:02d}"
+            return durations.pace(self.duration_to_seconds(), self.distance)
         return None
     
     def __repr__(self):
         return f'<Workout {self.workout_type} - {self.duration}>'
 
+@event.listens_for(Workout, 'after_insert')
+@event.listens_for(Workout, 'after_update')
+@event.listens_for(Workout, 'after_delete')
+def _workout_invalidate_counts(mapper, connection, target):
+    list_counts.invalidate('workout', target.user_id)
+
+# --- Materialized race statistics ---
+class UserRaceStats(db.Model):
+    """Per-user, per-race-type summary maintained on every race write (see _maintain_race_stats)"""
+    __tablename__ = 'user_race_stats'
+    # No FK to user: rows are derived data and are removed with the user's races
+    user_id = db.Column(db.Integer, primary_key=True)
+    race_type = db.Column(db.String(50), primary_key=True)
+    race_count = db.Column(db.Integer, nullable=False, default=0)
+    total_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    best_seconds = db.Column(db.Float)
+    best_race_id = db.Column(db.Integer)
+    first_race_id = db.Column(db.Integer)
+    first_seconds = db.Column(db.Float)
+    last_race_id = db.Column(db.Integer)
+    last_seconds = db.Column(db.Float)
+    recent_race_ids = db.Column(db.String(100))  # JSON list, newest first (max 5)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def average_seconds(self):
+        return self.total_seconds / self.race_count if self.race_count else 0
+
+    @property
+    def overall_trend(self):
+        """Improvement from first to latest race in percent (positive = faster)."""
+        if self.first_race_id == self.last_race_id or not self.first_seconds:
+            return None
+        return ((self.first_seconds - (self.last_seconds or 0)) / self.first_seconds) * 100
+
+    @property
+    def recent_ids(self):
+        try:
+            return json.loads(self.recent_race_ids or '[]')
+        except ValueError:
+            return []
+
+class UserRaceMonthly(db.Model):
+    """Monthly rollup per user and race type, for trend charts"""
+    __tablename__ = 'user_race_monthly'
+    user_id = db.Column(db.Integer, primary_key=True)
+    race_type = db.Column(db.String(50), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)  # first day of the month
+    race_count = db.Column(db.Integer, nullable=False, default=0)
+    total_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    best_seconds = db.Column(db.Float)
+
+_STATS_ATTRS = ('user_id', 'race_type', 'race_date', 'finish_time', 'finish_seconds')
+
+def _month_start(d):
+    return d.replace(day=1) if d else None
+
+def _race_stats_keys(obj, include_old: bool):
+    """(user_id, race_type, month) keys a race contributes to, before and after the change."""
+    keys = {(obj.user_id, obj.race_type, _month_start(obj.race_date))}
+    if include_old:
+        state = db.inspect(obj)
+        old = {}
+        for attr in ('user_id', 'race_type', 'race_date'):
+            hist = state.attrs[attr].history
+            old[attr] = hist.deleted[0] if hist.deleted else getattr(obj, attr)
+        keys.add((old['user_id'], old['race_type'], _month_start(old['race_date'])))
+    return keys
+
+def refresh_race_stats(connection, keys):
+    """Recompute the summary and monthly rows for the given (user_id, race_type, month) keys.
+
+    Each key is a handful of indexed lookups scoped to one user and type, so
+    the cost does not depend on how many races the runner has elsewhere.
+    """
+    race = Race.__table__
+    stats = UserRaceStats.__table__
+    monthly = UserRaceMonthly.__table__
+    now = datetime.utcnow()
+    for user_id, race_type in {(u, t) for u, t, _ in keys if u is not None and t is not None}:
+        scope = and_(race.c.user_id == user_id, race.c.race_type == race_type)
+        count, total, best = connection.execute(
+            db.select(func.count(race.c.id), func.coalesce(func.sum(race.c.finish_seconds), 0.0),
+                      func.min(race.c.finish_seconds)).where(scope)
+        ).one()
+        connection.execute(stats.delete().where(and_(stats.c.user_id == user_id, stats.c.race_type == race_type)))
+        if not count:
+            continue
+        pick = lambda *order: connection.execute(
+            db.select(race.c.id, race.c.finish_seconds).where(scope).order_by(*order).limit(1)).one()
+        best_row = pick(race.c.finish_seconds.asc(), race.c.race_date.asc(), race.c.id.asc())
+        first_row = pick(race.c.race_date.asc(), race.c.id.asc())
+        last_row = pick(race.c.race_date.desc(), race.c.id.desc())
+        recent = connection.execute(
+            db.select(race.c.id).where(scope).order_by(race.c.race_date.desc(), race.c.id.desc()).limit(5)
+        ).scalars().all()
+        connection.execute(stats.insert().values(
+            user_id=user_id, race_type=race_type, race_count=count, total_seconds=float(total or 0),
+            best_seconds=best, best_race_id=best_row.id,
+            first_race_id=first_row.id, first_seconds=first_row.finish_seconds,
+            last_race_id=last_row.id, last_seconds=last_row.finish_seconds,
+            recent_race_ids=json.dumps(list(recent)), updated_at=now,
+        ))
+    for user_id, race_type, month in keys:
+        if user_id is None or race_type is None or month is None:
+            continue
+        next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+        scope = and_(race.c.user_id == user_id, race.c.race_type == race_type,
+                     race.c.race_date >= month, race.c.race_date < next_month)
+        count, total, best = connection.execute(
+            db.select(func.count(race.c.id), func.coalesce(func.sum(race.c.finish_seconds), 0.0),
+                      func.min(race.c.finish_seconds)).where(scope)
+        ).one()
+        connection.execute(monthly.delete().where(and_(
+            monthly.c.user_id == user_id, monthly.c.race_type == race_type, monthly.c.month == month)))
+        if count:
+            connection.execute(monthly.insert().values(
+                user_id=user_id, race_type=race_type, month=month, race_count=count,
+                total_seconds=float(total or 0), best_seconds=best))
+
+@event.listens_for(db.session, 'after_flush')
+def _maintain_race_stats(session, flush_context):
+    """Keep user_race_stats/user_race_monthly in step with race writes, in the same transaction."""
+    keys = set()
+    for obj in session.new:
+        if isinstance(obj, Race):
+            keys |= _race_stats_keys(obj, include_old=False)
+    for obj in session.deleted:
+        if isinstance(obj, Race):
+            keys |= _race_stats_keys(obj, include_old=True)
+    for obj in session.dirty:
+        if isinstance(obj, Race) and any(db.inspect(obj).attrs[a].history.has_changes() for a in _STATS_ATTRS):
+            keys |= _race_stats_keys(obj, include_old=True)
+    if keys:
+        refresh_race_stats(session.connection(), keys)
+
+def rebuild_race_stats(user_id=None):
+    """Recompute all summary rows (e.g. after a bulk SQL change); returns keys refreshed."""
+    query = db.session.query(Race.user_id, Race.race_type, Race.race_date).distinct()
+    if user_id is not None:
+        query = query.filter(Race.user_id == user_id)
+    keys = {(u, t, _month_start(d)) for u, t, d in query.all()}
+    stale = db.session.query(UserRaceStats.user_id, UserRaceStats.race_type)
+    if user_id is not None:
+        stale = stale.filter(UserRaceStats.user_id == user_id)
+    keys |= {(u, t, None) for u, t in stale.all()}
+    stale_months = db.session.query(UserRaceMonthly.user_id, UserRaceMonthly.race_type, UserRaceMonthly.month)
+    if user_id is not None:
+        stale_months = stale_months.filter(UserRaceMonthly.user_id == user_id)
+    keys |= set(stale_months.all())
+    refresh_race_stats(db.session.connection(), keys)
+    db.session.commit()
+    return len(keys)
+
+# --- Offline sync change log ---
+class SyncChange(db.Model):
+    """One row per race/workout/photo write; the row id is the /api/sync cursor"""
+    __tablename__ = 'sync_change'
+    id = db.Column(db.Integer, primary_key=True)
+    # No FK to user: tombstones must outlive the rows they describe
+    user_id = db.Column(db.Integer, nullable=False)
+    entity = db.Column(db.String(20), nullable=False)  # 'race', 'workout', 'photo'
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)  # 'upsert' or 'delete' (tombstone)
+    client_ref = db.Column(db.String(64))  # offline client's mutation id, makes queued creates idempotent
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_sync_change_user_seq', 'user_id', 'id'),
+        db.Index('ix_sync_change_entity', 'user_id', 'entity', 'entity_id'),
+    )
+
+def _fragment_scope():
+    """Cache scope for template fragments: user, data version, script root (None = don't cache)."""
+    if g.get('skip_fragment_cache') or not current_user.is_authenticated:
+        return None
+    if 'data_version' not in g:
+        # Newest change-log id for this user: moves on every race/workout/photo write, in any worker
+        g.data_version = (db.session.query(func.max(SyncChange.id))
+                          .filter(SyncChange.user_id == current_user.id).scalar() or 0)
+    return (current_user.id, g.data_version, request.script_root)
+
+app.jinja_env.fragment_cache = fragments.FragmentCache(fragments.make_backend(), _fragment_scope)
+
+SYNC_MODELS = {'race': Race, 'workout': Workout, 'photo': RacePhoto}
+_SYNC_ENTITY_NAMES = {model: name for name, model in SYNC_MODELS.items()}
+
+def record_sync_changes(connection, user_id: int, entity: str, ids, op: str = 'upsert'):
+    """Append change-log rows for writes made outside the ORM session (bulk SQL)."""
+    now = datetime.utcnow()
+    rows = [{'user_id': user_id, 'entity': entity, 'entity_id': i, 'op': op, 'changed_at': now} for i in ids]
+    if rows:
+        connection.execute(SyncChange.__table__.insert(), rows)
+
+@event.listens_for(db.session, 'after_flush')
+def _record_sync_changes(session, flush_context):
+    """Log every race/workout/photo insert, update and delete for delta sync."""
+    deleted_users = {obj.id for obj in session.deleted if isinstance(obj, User)}
+    changes = []
+    for obj in session.new:
+        if type(obj) in _SYNC_ENTITY_NAMES:
+            changes.append((obj, 'upsert'))
+    for obj in session.dirty:
+        if type(obj) in _SYNC_ENTITY_NAMES and session.is_modified(obj, include_collections=False):
+            changes.append((obj, 'upsert'))
+    for obj in session.deleted:
+        if type(obj) in _SYNC_ENTITY_NAMES:
+            changes.append((obj, 'delete'))
+    if not changes:
+        return
+    # Photos belong to users through their race
+    race_owner = {obj.id: obj.user_id for obj, _ in changes if isinstance(obj, Race)}
+    unknown = {obj.race_id for obj, _ in changes if isinstance(obj, RacePhoto) and obj.race_id not in race_owner}
+    if unknown:
+        race_owner.update(session.connection().execute(
+            db.select(Race.id, Race.user_id).where(Race.id.in_(unknown))).all())
+    now = datetime.utcnow()
+    rows = []
+    for obj, op in changes:
+        user_id = race_owner.get(obj.race_id) if isinstance(obj, RacePhoto) else obj.user_id
+        if user_id is None or user_id in deleted_users:
+            continue
+        rows.append({'user_id': user_id, 'entity': _SYNC_ENTITY_NAMES[type(obj)],
+                     'entity_id': obj.id, 'op': op, 'changed_at': now})
+    if rows:
+        session.connection().execute(SyncChange.__table__.insert(), rows)
+
+def compact_sync_changes():
+    """Drop change rows superseded by a newer row for the same entity; returns rows removed.
+
+    Deltas only ever need the latest change per entity, so this keeps the
+    log bounded by the number of entities while every old cursor stays valid.
+    Rows carrying a ``client_ref`` are kept: they are how a replayed offline
+    create is recognised (see ``_apply_sync_mutation``).
+    """
+    newer = db.aliased(SyncChange)
+    superseded = (db.session.query(SyncChange.id)
+                  .join(newer, and_(newer.user_id == SyncChange.user_id,
+                                    newer.entity == SyncChange.entity,
+                                    newer.entity_id == SyncChange.entity_id,
+                                    newer.id > SyncChange.id))
+                  .filter(SyncChange.client_ref.is_(None)))
+    removed = (SyncChange.query.filter(SyncChange.id.in_(superseded.scalar_subquery()))
+               .delete(synchronize_session=False))
+    db.session.commit()
+    return removed
+
+# Compaction runs in the background after sync pushes, at most this often per process
+SYNC_COMPACT_INTERVAL_SECONDS = int(os.environ.get('SYNC_COMPACT_INTERVAL_SECONDS', str(6 * 3600)))
+_sync_compacted_at = None
+
+def _compact_sync_changes_job():
+    with app.app_context():
+        try:
+            return {'removed': compact_sync_changes()}
+        finally:
+            db.session.remove()
+
+def queue_sync_compaction():
+    """Queue ``compact_sync_changes`` unless this process ran it within the interval."""
+    global _sync_compacted_at
+    now = time.monotonic()
+    if _sync_compacted_at is not None and now - _sync_compacted_at < SYNC_COMPACT_INTERVAL_SECONDS:
+        return None
+    _sync_compacted_at = now
+    return jobs.submit('sync_compaction', _compact_sync_changes_job, key='sync_compaction')
+
 # --- Top-level function to add test races for a runner ---
 def add_test_races(runner, race_types, locations):
     from random import choice, randint
@@ -333,9 +751,52 @@ def add_test_races(runner, race_types, locations):
 # --- Flask-Login user loader ---
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    parsed = auth.parse_session_token(user_id)
+    if parsed is None:
+        return None
+    values = user_cache.get(parsed)
+    if values is not None:
+        # Re-attach the cached row to this request's session without a query
+        return db.session.merge(auth.restore(User, values), load=False)
+    user = db.session.get(User, parsed[0])
+    if user is None or (user.auth_version or 0) != parsed[1]:
+        return None
+    user_cache.put(parsed, auth.snapshot(user))
+    return user
+
+def _email_key(scope, email):
+    return (scope, 'email', email.strip().lower())
+
+def _auth_throttled(scope, email=None):
+    """Seconds to wait if this client (or account) is over its attempt budget, else 0.
+
+    Every attempt is charged to the client address. The account's bucket is
+    only checked here and is charged by ``_auth_failed``.
+    """
+    retry_after = auth_limiter.consume((scope, 'ip', request.remote_addr or ''))
+    if not retry_after and email:
+        retry_after = auth_limiter.wait(_email_key(scope, email))
+    if retry_after:
+        print(f'[AUTH_THROTTLED] scope={scope} ip={request.remote_addr} retry_after={retry_after:.0f}s', file=sys.stderr)
+    return retry_after
+
+def _auth_failed(scope, email):
+    """Charge a failed password check to the account's bucket."""
+    auth_limiter.consume(_email_key(scope, email))
+
+def _auth_succeeded(scope, email):
+    auth_limiter.reset(_email_key(scope, email))
+
+def _throttled_response(template, retry_after, **context):
+    flash(f'Too many attempts. Please try again in {math.ceil(retry_after)} seconds.')
+    response = app.make_response((render_template(template, **context), 429))
+    response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response
 
 # --- Admin Routes ---
+# Per-user activity and site totals for /admin, aggregated in SQL (see admin_reporting.py)
+admin_report = admin_reporting.AdminReport(db, User, Race, Workout, RacePhoto)
+
 @app.route('/admin')
 @login_required
 def admin_users():
@@ -343,17 +804,15 @@ def admin_users():
         flash('Access denied. Admin privileges required.')
         return redirect(url_for('dashboard'))
     
-    users = User.query.all()
-    # Provide summary metrics expected by the template
-    total_users = User.query.count()
-    admin_users_count = User.query.filter_by(is_admin=True).count()
-    total_races = Race.query.count()
+    totals = admin_report.totals()
+    users = admin_report.users_page(request.args.get('page', 1, type=int))
     return render_template(
         'admin_users.html',
         users=users,
-        total_users=total_users,
-        admin_users=admin_users_count,
-        total_races=total_races
+        totals=totals,
+        total_users=totals.users,
+        admin_users=totals.admins,
+        total_races=totals.races
     )
 
 def reset_user_password(user, new_password):
@@ -411,6 +870,7 @@ def admin_toggle_admin(user_id):
     
     user.is_admin = not user.is_admin
     db.session.commit()
+    admin_report.invalidate()
     status = 'granted' if user.is_admin else 'revoked'
     flash(f'Admin privileges {status} for {user.email}')
     return redirect(url_for('admin_users'))
@@ -430,6 +890,7 @@ def admin_delete_user(user_id):
     # Delete user and associated races (cascade handles this)
     db.session.delete(user)
     db.session.commit()
+    admin_report.invalidate()
     flash(f'User {user.email} deleted successfully')
     return redirect(url_for('admin_users'))
 
@@ -438,6 +899,9 @@ def admin_delete_user(user_id):
 def forgot_password():
     if request.method == 'POST':
         email = request.form['email']
+        retry_after = _auth_throttled('forgot_password')
+        if retry_after:
+            return _throttled_response('forgot_password.html', retry_after)
         user = User.query.filter_by(email=email).first()
         
         if user:
@@ -457,6 +921,12 @@ def forgot_password():
 
 @app.route('/reset_password/<token>', methods=['GET', 'POST'])
 def reset_password(token):
+    if request.method == 'POST':
+        # Before the token lookup, so guessing tokens is throttled too
+        retry_after = _auth_throttled('reset_password')
+        if retry_after:
+            return _throttled_response('reset_password.html', retry_after, token=token)
+
     user = User.query.filter_by(reset_token=token).first()
     
     if not user or not user.verify_reset_token(token):
@@ -474,6 +944,7 @@ def reset_password(token):
         user.set_password(password)
         user.clear_reset_token()
         db.session.commit()
+        _auth_succeeded('login', user.email)
         flash('Password reset successfully')
         return redirect(url_for('login'))
     
@@ -535,14 +1006,19 @@ def login():
         email = request.form['email']
         password = request.form['password']
         remember = bool(request.form.get('remember'))
+        retry_after = _auth_throttled('login', email)
+        if retry_after:
+            return _throttled_response('login.html', retry_after)
         user = User.query.filter_by(email=email).first()
         if user and user.check_password(password):
+            _auth_succeeded('login', email)
             login_user(user, remember=remember)
             next_page = request.args.get('next')
             if next_page:
                 return redirect(next_page)
             return redirect(url_for('dashboard'))
         else:
+            _auth_failed('login', email)
             flash('Invalid email or password')
     return render_template('login.html')
 
@@ -555,7 +1031,7 @@ def profile():
 @login_required
 def settings():
     """Settings page with app configuration options"""
-    return render_template('settings.html')
+    return render_template('settings.html', export_job=_current_export_job())
 
 @app.route('/photos')
 @login_required
@@ -575,6 +1051,9 @@ def photos():
                        .order_by(desc(race_date_col), desc(photo_uploaded_col))
                        .all())
         
+        # Photos uploaded before the derivative pipeline existed are processed lazily
+        queue_photo_derivatives([photo for photo, _ in photos_query if photo.derivatives_pending])
+
         # Format photos with race information
         photos_data = []
         for photo, race in photos_query:
@@ -591,50 +1070,124 @@ def photos():
         flash('Error loading photos. Please try again.', 'warning')
         return redirect(url_for('dashboard'))
 
+# Archives with more photos than this are built by a background job
+EXPORT_INLINE_MAX_PHOTOS = int(os.environ.get('EXPORT_INLINE_MAX_PHOTOS', '25'))
+
+def _export_rows(kind: str, user_id: int):
+    """(streamed rows, field spec) for one exportable table."""
+    if kind == 'races':
+        query = (Race.query.filter_by(user_id=user_id)
+                 .order_by(desc(Race.race_date), desc(Race.id)))
+        return query.yield_per(data_export.BATCH_ROWS), data_export.RACE_FIELDS
+    query = (Workout.query.filter_by(user_id=user_id)
+             .order_by(desc(Workout.workout_date), desc(Workout.id)))
+    return query.yield_per(data_export.BATCH_ROWS), data_export.WORKOUT_FIELDS
+
+def _export_tables(user_id: int) -> list:
+    tables = []
+    for kind in ('races', 'workouts'):
+        for fmt, encode in data_export.ENCODERS.items():
+            rows, fields = _export_rows(kind, user_id)
+            tables.append((f'{kind}.{fmt}', encode(rows, fields)))
+    return tables
+
+def _export_photos(user_id: int):
+    """(archive name, path) for every original photo of the user's races."""
+    photos_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'photos')
+    rows = (db.session.query(RacePhoto.filename, Race.id, Race.race_date)
+            .join(Race, RacePhoto.race_id == Race.id)
+            .filter(Race.user_id == user_id)
+            .order_by(Race.id, RacePhoto.id)
+            .yield_per(data_export.BATCH_ROWS))
+    for filename, race_id, race_date in rows:
+        yield f'photos/{race_date.isoformat()}_{race_id}/{filename}', os.path.join(photos_dir, filename)
+
+def _export_filename(ext: str) -> str:
+    return f'tracker_export_{datetime.utcnow().strftime("%Y%m%d_%H%M%S")}.{ext}'
+
+def _build_export_archive(user_id: int, filename: str) -> dict:
+    """Background job: write the user's full archive to their export directory."""
+    with app.app_context():
+        directory = data_export.export_dir(app.config['UPLOAD_FOLDER'], user_id)
+        size = data_export.write_archive_file(directory, filename, _export_tables(user_id), _export_photos(user_id))
+        return {'filename': filename, 'bytes': size}
+
+def _current_export_job():
+    """State of the current user's most recent archive (named in the session), if still on disk."""
+    filename = session.get('export_filename')
+    if not filename:
+        return None
+    return data_export.archive_status(data_export.export_dir(app.config['UPLOAD_FOLDER'], current_user.id),
+                                      filename)
+
 @app.route('/export_races')
 @login_required
 def export_races():
     """Export user's race data as CSV"""
-    try:
-        import csv
-        import io
-        from flask import make_response
-        
-        # Get user's races
-        race_date_col = getattr(Race, 'race_date')
-        races = Race.query.filter_by(user_id=current_user.id).order_by(desc(race_date_col)).all()
-        
-        # Create CSV content
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow(['Date', 'Race Name', 'Type', 'Start Time', 'Finish Time', 'Location', 'Weather', 'Notes'])
-        
-        # Write race data
-        for race in races:
-            writer.writerow([
-                race.race_date.strftime('%Y-%m-%d') if race.race_date else '',
-                race.race_name or '',
-                race.race_type or '',
-                race.race_time or '',
-                race.finish_time or '',
-                race.location or '',
-                race.weather or '',
-                race.notes or ''
-            ])
-        
-        # Create response
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'text/csv'
-        response.headers['Content-Disposition'] = f'attachment; filename=race_data_{current_user.email}_{datetime.utcnow().strftime("%Y%m%d")}.csv'
-        
-        return response
-        
-    except Exception as e:
-        print(f'[EXPORT_ERROR] user_id={current_user.id} error={e}', file=sys.stderr)
-        flash('Error exporting race data. Please try again.', 'error')
+    return export_data('races', 'csv')
+
+@app.route('/export/<kind>.<fmt>')
+@login_required
+def export_data(kind, fmt):
+    """Stream races or workouts as CSV or JSON Lines."""
+    if kind not in ('races', 'workouts') or fmt not in data_export.FORMATS:
+        abort(404)
+    mimetype, ext = data_export.FORMATS[fmt]
+    rows, fields = _export_rows(kind, current_user.id)
+    filename = f'{kind[:-1]}_data_{current_user.email}_{datetime.utcnow().strftime("%Y%m%d")}.{ext}'
+    return Response(
+        stream_with_context(data_export.ENCODERS[fmt](rows, fields)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'},
+    )
+
+@app.route('/export/archive', methods=['POST'])
+@login_required
+def export_archive():
+    """Zip of all races, workouts and photos.
+
+    Small accounts get the archive streamed back directly; larger ones are
+    built in the background and offered for download on the settings page.
+    """
+    user_id = current_user.id
+    photo_count = (db.session.query(func.count(RacePhoto.id))
+                   .join(Race, RacePhoto.race_id == Race.id)
+                   .filter(Race.user_id == user_id).scalar())
+    if photo_count <= EXPORT_INLINE_MAX_PHOTOS:
+        return Response(
+            stream_with_context(data_export.iter_archive(_export_tables(user_id), _export_photos(user_id))),
+            mimetype='application/zip',
+            headers={'Content-Disposition': f'attachment; filename={_export_filename("zip")}'},
+        )
+    if jobs.pending(f'export:{user_id}'):
+        flash('Your archive is already being prepared.')
         return redirect(url_for('settings'))
+    filename = _export_filename('zip')
+    data_export.start_archive(data_export.export_dir(app.config['UPLOAD_FOLDER'], user_id), filename)
+    jobs.submit('export_archive', _build_export_archive, user_id, filename, key=f'export:{user_id}')
+    session['export_filename'] = filename
+    flash('Your archive is being prepared. A download link will appear on this page when it is ready.')
+    return redirect(url_for('settings'))
+
+@app.route('/export/status/<path:filename>')
+@login_required
+def export_job_status(filename):
+    # Read from the export directory, not the job queue: the job may be running in another worker
+    status = data_export.archive_status(data_export.export_dir(app.config['UPLOAD_FOLDER'], current_user.id),
+                                        filename)
+    if status is None:
+        return jsonify({'state': 'missing'}), 404
+    body = {'state': status['state']}
+    if status['state'] == 'done':
+        body['download_url'] = url_for('export_download', filename=status['filename'])
+        body['bytes'] = status['bytes']
+    return jsonify(body)
+
+@app.route('/export/download/<path:filename>')
+@login_required
+def export_download(filename):
+    directory = data_export.export_dir(app.config['UPLOAD_FOLDER'], current_user.id)
+    return send_from_directory(directory, filename, as_attachment=True)
 
 @app.route('/logout')
 @login_required
@@ -694,23 +1247,10 @@ def add_race():
     )
     db.session.add(race)
     db.session.commit()
-    # Handle up to 10 photo uploads, each with its own type and caption
-    for i in range(1, 11):
-        file = request.files.get(f'photo{i}')
-        if file and file.filename != '' and allowed_file(file.filename):
-            if file.filename and '.' in file.filename:
-                filename = str(uuid.uuid4()) + '.' + file.filename.rsplit('.', 1)[1].lower()
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], 'photos', filename))
-                photo = RacePhoto(
-                    race_id=race.id,
-                    filename=filename,
-                    original_filename=file.filename,
-                    photo_type=request.form.get(f'photo_type{i}', 'other'),
-                    caption=request.form.get(f'photo_caption{i}', '')
-                )
-                db.session.add(photo)
+    new_photos = _save_uploaded_photos(race.id, request.files, request.form)
     pasted_saved = _save_pasted_images_from_form(race.id, request.form)
     db.session.commit()
+    queue_photo_derivatives(new_photos)
     flash(f'Race added successfully! {pasted_saved} pasted image(s) saved.' if pasted_saved else 'Race added successfully!')
     return redirect(url_for('races'))
 
@@ -730,22 +1270,10 @@ def edit_race(race_id):
     race.notes = request.form.get('notes', '')
     race.race_page_url = request.form.get('race_page_url', '')
 
-    for i in range(1, 11):
-        file = request.files.get(f'photo{i}')
-        if file and file.filename != '' and allowed_file(file.filename):
-            if file.filename and '.' in file.filename:
-                filename = str(uuid.uuid4()) + '.' + file.filename.rsplit('.', 1)[1].lower()
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], 'photos', filename))
-                photo = RacePhoto(
-                    race_id=race.id,
-                    filename=filename,
-                    original_filename=file.filename,
-                    photo_type=request.form.get(f'photo_type{i}', 'other'),
-                    caption=request.form.get(f'photo_caption{i}', '')
-                )
-                db.session.add(photo)
+    new_photos = _save_uploaded_photos(race.id, request.files, request.form)
     pasted_saved = _save_pasted_images_from_form(race.id, request.form)
     db.session.commit()
+    queue_photo_derivatives(new_photos)
     flash(f'Race updated successfully! {pasted_saved} pasted image(s) saved.' if pasted_saved else 'Race updated successfully!')
     return redirect(url_for('races'))
 
@@ -753,19 +1281,113 @@ def edit_race(race_id):
 @login_required
 def delete_race(race_id):
     race = Race.query.filter_by(id=race_id, user_id=current_user.id).first_or_404()
-    # Delete associated photos from filesystem
-    for photo in race.photos:
-        photo_path = os.path.join(app.config['UPLOAD_FOLDER'], 'photos', photo.filename)
-        if os.path.exists(photo_path):
-            os.remove(photo_path)
+    _remove_race_photo_files(race)
     db.session.delete(race)
     db.session.commit()
     flash('Race deleted successfully!')
     return redirect(url_for('races'))
 
+def _remove_race_photo_files(race):
+    """Delete a race's photo files and derivatives from disk (rows go with the race)."""
+    for photo in race.photos:
+        photo_path = os.path.join(app.config['UPLOAD_FOLDER'], 'photos', photo.filename)
+        if os.path.exists(photo_path):
+            os.remove(photo_path)
+        try:
+            photo_pipeline.remove_derivatives(photo.filename, _derived_photos_dir(), photo.variant_info)
+        except OSError as e:
+            print(f'[PHOTO_PIPELINE_ERROR] cleanup photo_id={photo.id} error={e}', file=sys.stderr)
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    limit_mb = uploads.PHOTO_MAX_FILE_BYTES // (1024 * 1024)
+    total_mb = (app.config.get('MAX_CONTENT_LENGTH') or 0) // (1024 * 1024)
+    flash(f'Upload too large: photos are limited to {limit_mb}MB each and {total_mb}MB per submission.', 'warning')
+    return redirect(request.referrer or url_for('races'))
+
+PHOTO_CACHE_MAX_AGE = 31536000
+# Failed derivative runs are retried with a growing delay until this many attempts
+PHOTO_MAX_ATTEMPTS = int(os.environ.get('PHOTO_MAX_ATTEMPTS', '5'))
+PHOTO_RETRY_SECONDS = int(os.environ.get('PHOTO_RETRY_SECONDS', '600'))
+
 @app.route('/uploads/photos/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(os.path.join(app.config['UPLOAD_FOLDER'], 'photos'), filename)
+    # Originals are rewritten in place once the pipeline strips EXIF/GPS and auto-orients
+    # them, so clients must revalidate (the ETag changes with the file) instead of caching
+    return send_from_directory(os.path.join(app.config['UPLOAD_FOLDER'], 'photos'), filename,
+                               max_age=0)
+
+@app.route('/uploads/photos/derived/<filename>')
+def photo_derivative(filename):
+    # Derivative names embed the photo UUID and never change content, so cache them hard
+    resp = send_from_directory(_derived_photos_dir(), filename, max_age=PHOTO_CACHE_MAX_AGE)
+    resp.cache_control.immutable = True
+    return resp
+
+# --- Photo derivatives (thumbnails / WebP / AVIF) ---
+def _derived_photos_dir():
+    return photo_pipeline.derived_dir(os.path.join(app.config['UPLOAD_FOLDER'], 'photos'))
+
+def _process_photo_job(photo_id: int, filename: str):
+    """Background worker: build derivatives for one photo and record the variant."""
+    src = os.path.join(app.config['UPLOAD_FOLDER'], 'photos', filename)
+    try:
+        variant = photo_pipeline.process_photo(src, _derived_photos_dir())
+    except Exception as e:
+        print(f'[PHOTO_PIPELINE_ERROR] photo_id={photo_id} file={filename} error={e}', file=sys.stderr)
+        variant = None
+    try:
+        with app.app_context():
+            if variant is None:
+                # Count the attempt so derivatives_pending can schedule a retry (or give up)
+                previous = db.session.query(RacePhoto.variant).filter(RacePhoto.id == photo_id).scalar()
+                try:
+                    info = json.loads(previous) if previous else None
+                except ValueError:
+                    info = None
+                attempts = info.get('attempts', 1) if isinstance(info, dict) and info.get('failed') else 0
+                variant = {'failed': True, 'attempts': attempts + 1, 'failed_at': time.time()}
+            size = photo_pipeline.disk_usage(src, _derived_photos_dir(), variant)
+            RacePhoto.query.filter_by(id=photo_id).update({'variant': json.dumps(variant), 'size_bytes': size})
+            owner = (db.session.query(Race.user_id).join(RacePhoto, RacePhoto.race_id == Race.id)
+                     .filter(RacePhoto.id == photo_id).scalar())
+            if owner is not None:
+                # Bulk update skips the flush hook; sync clients and cached fragments need the new variant
+                record_sync_changes(db.session.connection(), owner, 'photo', [photo_id])
+            db.session.commit()
+    except Exception as e:
+        print(f'[PHOTO_PIPELINE_ERROR] photo_id={photo_id} could not store variant: {e}', file=sys.stderr)
+
+def queue_photo_derivatives(photos) -> int:
+    """Schedule derivative generation for committed photos that have none yet (or are due a retry)."""
+    queued = 0
+    for photo in photos:
+        if not photo.derivatives_pending or photo.id is None or jobs.pending(f'photo:{photo.id}'):
+            continue
+        jobs.submit('photo_derivatives', _process_photo_job, photo.id, photo.filename, key=f'photo:{photo.id}')
+        queued += 1
+    return queued
+
+@app.template_global()
+def photo_url(photo, width=None, fmt='jpg'):
+    """URL of the derivative closest to ``width`` (falls back to the original)."""
+    info = photo.variant_info
+    if not info or fmt not in info['formats']:
+        return url_for('uploaded_file', filename=photo.filename)
+    widths = info['widths']
+    chosen = next((w for w in widths if width is not None and w >= width), widths[-1])
+    return url_for('photo_derivative', filename=photo_pipeline.derivative_name(photo.filename, chosen, fmt))
+
+@app.template_global()
+def photo_srcset(photo, fmt='jpg'):
+    """``srcset`` value listing every derivative width of ``photo`` in ``fmt``."""
+    info = photo.variant_info
+    if not info or fmt not in info['formats']:
+        return ''
+    return ', '.join(
+        f"{url_for('photo_derivative', filename=photo_pipeline.derivative_name(photo.filename, w, fmt))} {w}w"
+        for w in info['widths']
+    )
 
 # --- PWA assets: manifest and service worker ---
 @app.route('/manifest.json')
@@ -777,49 +1399,287 @@ def serve_manifest():
     resp.headers['Cache-Control'] = 'no-cache'
     return resp
 
+@app.route('/assets/<path:filename>')
+def hashed_asset(filename):
+    """Fingerprinted static file from the asset manifest, cached for a year."""
+    original = asset_manifest.original(filename)
+    if original is None:
+        # A URL from another deploy: serve today's file, but never as immutable
+        stem, ext = os.path.splitext(filename)
+        resp = send_from_directory(app.static_folder, os.path.splitext(stem)[0] + ext, max_age=0)
+        resp.cache_control.no_cache = True
+        return resp
+    resp = send_from_directory(app.static_folder, original, max_age=31536000)
+    resp.cache_control.immutable = True
+    return resp
+
+# Static files the service worker precaches (fingerprinted URLs)
+SW_PRECACHE_PREFIXES = ('css/', 'js/')
+
 @app.route('/sw.js')
 def serve_sw():
-    # Service worker for PWA
+    # Service worker for PWA; its precache list and cache version come from the asset manifest
     root_dir = os.path.dirname(__file__)
-    resp = send_from_directory(root_dir, 'sw.js', mimetype='application/javascript')
+    with open(os.path.join(root_dir, 'sw.js')) as f:
+        source = f.read()
+    assets = {name: url_for('hashed_asset', filename=hashed)
+              for name, hashed in asset_manifest.files.items() if name.startswith(SW_PRECACHE_PREFIXES)}
+    body = (f'self.__ASSET_VERSION = {json.dumps(asset_manifest.version)};\n'
+            f'self.__PRECACHE_ASSETS = {json.dumps(assets, sort_keys=True)};\n' + source)
+    resp = Response(body, mimetype='application/javascript')
     resp.headers['Cache-Control'] = 'no-cache'
     # Ensure the SW can control the subpath
     resp.headers['Service-Worker-Allowed'] = app.config.get('APPLICATION_ROOT', '/') or '/'
-    return resp
+    resp.add_etag()
+    return resp.make_conditional(request)
 
 @app.route('/statistics')
 @login_required
 def statistics():
-    # Only show stats for the logged-in user
-    races = Race.query.filter_by(user_id=current_user.id).all()
-    # Group by race type
-    race_types = {}
-    for race in races:
-        if race.race_type not in race_types:
-            race_types[race.race_type] = []
-        race_types[race.race_type].append(race)
-    # Calculate statistics
+    # Only show stats for the logged-in user; summaries are maintained on write
+    rows = (UserRaceStats.query
+            .filter_by(user_id=current_user.id)
+            .order_by(UserRaceStats.first_race_id)
+            .all())
+    recent_ids = [rid for row in rows for rid in row.recent_ids]
+    races_by_id = {r.id: r for r in Race.query.filter(Race.id.in_(recent_ids)).all()} if recent_ids else {}
     stats = {}
-    for race_type, type_races in race_types.items():
-        times = [r.time_to_seconds() for r in type_races]
-        sorted_races = sorted(type_races, key=lambda x: x.race_date)
-        first_race = sorted_races[0] if sorted_races else None
-        last_race = sorted_races[-1] if sorted_races else None
-        overall_trend = None
-        if first_race and last_race and first_race != last_race:
-            first_time = first_race.time_to_seconds()
-            last_time = last_race.time_to_seconds()
-            if first_time > 0:
-                overall_trend = ((first_time - last_time) / first_time) * 100
-        stats[race_type] = {
-            'count': len(type_races),
-            'best_time': min(times) if times else 0,
-            'average_time': sum(times) / len(times) if times else 0,
-            'recent_races': sorted(type_races, key=lambda x: x.race_date, reverse=True)[:5],
-            'overall_trend': overall_trend
+    for row in rows:
+        stats[row.race_type] = {
+            'count': row.race_count,
+            'best_time': row.best_seconds or 0,
+            'average_time': row.average_seconds,
+            'recent_races': [races_by_id[rid] for rid in row.recent_ids if rid in races_by_id],
+            'overall_trend': row.overall_trend
         }
     return render_template('statistics.html', stats=stats)
 
+@app.route('/api/stats')
+@login_required
+def api_stats():
+    """Precomputed race statistics and monthly rollup for client-side trend charts."""
+    race_type = request.args.get('type', '').strip()
+    summaries = UserRaceStats.query.filter_by(user_id=current_user.id)
+    months = UserRaceMonthly.query.filter_by(user_id=current_user.id)
+    if race_type:
+        summaries = summaries.filter_by(race_type=race_type)
+        months = months.filter_by(race_type=race_type)
+    return jsonify({
+        'summary': {
+            row.race_type: {
+                'count': row.race_count,
+                'best_seconds': row.best_seconds,
+                'average_seconds': row.average_seconds,
+                'best_race_id': row.best_race_id,
+                'overall_trend': row.overall_trend,
+                'updated_at': row.updated_at.isoformat() if row.updated_at else None,
+            }
+            for row in summaries.order_by(UserRaceStats.first_race_id).all()
+        },
+        'monthly': [
+            {
+                'race_type': row.race_type,
+                'month': row.month.strftime('%Y-%m'),
+                'count': row.race_count,
+                'best_seconds': row.best_seconds,
+                'average_seconds': row.total_seconds / row.race_count if row.race_count else None,
+            }
+            for row in months.order_by(UserRaceMonthly.month, UserRaceMonthly.race_type).all()
+        ],
+    })
+
+# --- Offline sync API ---
+SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', '500'))
+
+# Fields sent to clients per entity; dates/datetimes are ISO strings
+_SYNC_FIELDS = {
+    'race': ('race_name', 'race_type', 'race_date', 'race_time', 'finish_time', 'finish_seconds',
+             'location', 'start_weather', 'finish_weather', 'notes', 'race_page_url'),
+    'workout': ('workout_type', 'workout_date', 'duration', 'distance', 'pace', 'calories',
+                'heart_rate_avg', 'heart_rate_max', 'location', 'weather', 'notes', 'started_at', 'source'),
+    'photo': ('race_id', 'photo_type', 'caption', 'uploaded_at'),
+}
+
+# Fields offline clients may write, with their parsers
+_SYNC_WRITABLE = {
+    'race': {
+        'race_name': str, 'race_type': str, 'race_date': date.fromisoformat, 'race_time': str,
+        'finish_time': str, 'location': str, 'notes': str, 'race_page_url': str,
+    },
+    'workout': {
+        'workout_type': str, 'workout_date': date.fromisoformat, 'duration': str, 'distance': float,
+        'calories': int, 'heart_rate_avg': int, 'heart_rate_max': int, 'location': str, 'notes': str,
+    },
+}
+_SYNC_REQUIRED = {
+    'race': ('race_name', 'race_type', 'race_date', 'finish_time'),
+    'workout': ('workout_type', 'duration'),
+}
+
+def _sync_query(entity: str, user_id: int):
+    """Query of the user's rows for one sync entity."""
+    if entity == 'photo':
+        return RacePhoto.query.join(Race, RacePhoto.race_id == Race.id).filter(Race.user_id == user_id)
+    return SYNC_MODELS[entity].query.filter_by(user_id=user_id)
+
+def _sync_versions(user_id: int, entity: str, ids=None) -> dict:
+    """Latest change sequence per entity id (the version clients send back as base_version)."""
+    query = (db.session.query(SyncChange.entity_id, func.max(SyncChange.id))
+             .filter(SyncChange.user_id == user_id, SyncChange.entity == entity))
+    if ids is not None:
+        query = query.filter(SyncChange.entity_id.in_(ids))
+    return dict(query.group_by(SyncChange.entity_id).all())
+
+def _sync_record(entity: str, obj, version) -> dict:
+    record = {'id': obj.id, 'version': version or 0}
+    for field in _SYNC_FIELDS[entity]:
+        value = getattr(obj, field)
+        record[field] = value.isoformat() if isinstance(value, (date, datetime)) else value
+    if entity == 'photo':
+        record['url'] = url_for('uploaded_file', filename=obj.filename)
+        record['thumb_url'] = photo_url(obj, 320)
+    return record
+
+def _sync_snapshot(user_id: int) -> dict:
+    """Everything the user has, with a cursor taken before reading so nothing is missed."""
+    cursor = db.session.query(func.max(SyncChange.id)).scalar() or 0
+    body = {'cursor': cursor, 'has_more': False, 'reset': True, 'user_id': user_id,
+            'deleted': {e: [] for e in SYNC_MODELS}}
+    for entity in SYNC_MODELS:
+        versions = _sync_versions(user_id, entity)
+        body[f'{entity}s'] = [_sync_record(entity, obj, versions.get(obj.id))
+                              for obj in _sync_query(entity, user_id).all()]
+    return body
+
+def _sync_delta(user_id: int, since: int) -> dict:
+    """Rows changed after ``since`` (latest state only) plus tombstones for deletions."""
+    changes = (db.session.query(SyncChange.id, SyncChange.entity, SyncChange.entity_id, SyncChange.op)
+               .filter(SyncChange.user_id == user_id, SyncChange.id > since)
+               .order_by(SyncChange.id)
+               .limit(SYNC_PAGE_SIZE + 1).all())
+    has_more = len(changes) > SYNC_PAGE_SIZE
+    changes = changes[:SYNC_PAGE_SIZE]
+    latest = {}
+    for seq, entity, entity_id, op in changes:
+        latest[(entity, entity_id)] = (seq, op)
+    body = {'cursor': changes[-1].id if changes else since, 'has_more': has_more, 'reset': False,
+            'user_id': user_id, 'deleted': {e: [] for e in SYNC_MODELS}}
+    for entity, model in SYNC_MODELS.items():
+        upserts = {eid: seq for (e, eid), (seq, op) in latest.items() if e == entity and op == 'upsert'}
+        rows = _sync_query(entity, user_id).filter(model.id.in_(upserts)).all() if upserts else []
+        body[f'{entity}s'] = [_sync_record(entity, obj, upserts[obj.id]) for obj in rows]
+        found = {obj.id for obj in rows}
+        body['deleted'][entity] = sorted(
+            [eid for (e, eid), (_, op) in latest.items() if e == entity and op == 'delete'] +
+            [eid for eid in upserts if eid not in found])
+    return body
+
+def _apply_sync_mutation(user_id: int, mutation: dict) -> dict:
+    """Apply one queued offline write; returns its result for the client.
+
+    Conflicts are detected with ``base_version`` (the version the client last
+    saw): if the row changed on the server since, the server copy wins and is
+    returned so the client can replace its local edit, unless ``force`` is set.
+    """
+    entity = mutation.get('entity')
+    op = mutation.get('op')
+    client_ref = str(mutation.get('client_id') or '')[:64] or None
+    result = {'client_id': mutation.get('client_id'), 'entity': entity}
+    if entity not in _SYNC_WRITABLE or op not in ('upsert', 'delete'):
+        return dict(result, status='error', error='unsupported entity or op')
+    model = SYNC_MODELS[entity]
+    entity_id = mutation.get('id')
+    obj = None
+    if entity_id is not None:
+        obj = model.query.filter_by(id=entity_id, user_id=user_id).first()
+        if obj is None:
+            return dict(result, status='missing', id=entity_id)
+        current = _sync_versions(user_id, entity, [obj.id]).get(obj.id, 0)
+        base = mutation.get('base_version')
+        if base is not None and current > int(base) and not mutation.get('force'):
+            return dict(result, status='conflict', id=obj.id, record=_sync_record(entity, obj, current))
+    elif client_ref:
+        done = SyncChange.query.filter_by(user_id=user_id, entity=entity, client_ref=client_ref).first()
+        if done is not None:
+            # Retried after a lost response: the create already happened
+            return dict(result, status='ok', id=done.entity_id, duplicate=True)
+
+    if op == 'delete':
+        if obj is None:
+            return dict(result, status='error', error='delete requires id')
+        if entity == 'race':
+            _remove_race_photo_files(obj)
+        db.session.delete(obj)
+        db.session.commit()
+        return dict(result, status='ok', id=entity_id, deleted=True)
+
+    data = mutation.get('data') or {}
+    try:
+        values = {k: (parse(data[k]) if data[k] not in (None, '') else None)
+                  for k, parse in _SYNC_WRITABLE[entity].items() if k in data}
+    except (TypeError, ValueError) as e:
+        return dict(result, status='error', error=f'invalid data: {e}')
+    if obj is None:
+        missing = [k for k in _SYNC_REQUIRED[entity] if values.get(k) is None]
+        if missing:
+            return dict(result, status='error', error=f'missing fields: {", ".join(missing)}')
+        if entity == 'race':
+            obj = Race(user_id=user_id, race_name=values.pop('race_name'), race_type=values.pop('race_type'),
+                       race_date=values.pop('race_date'), race_time=values.pop('race_time', None),
+                       finish_time=values.pop('finish_time'))
+        else:
+            obj = Workout(user_id=user_id, workout_type=values.pop('workout_type'), duration=values.pop('duration'))
+        db.session.add(obj)
+    for key, value in values.items():
+        setattr(obj, key, value)
+    if entity == 'workout' and obj.distance and obj.duration:
+        obj.pace = obj.calculate_pace()
+    db.session.flush()
+    if entity_id is None and client_ref:
+        (SyncChange.query.filter_by(user_id=user_id, entity=entity, entity_id=obj.id)
+         .update({'client_ref': client_ref}, synchronize_session=False))
+    db.session.commit()
+    version = _sync_versions(user_id, entity, [obj.id]).get(obj.id, 0)
+    return dict(result, status='ok', id=obj.id, record=_sync_record(entity, obj, version))
+
+@app.route('/api/sync', methods=['GET'])
+@login_required
+def api_sync():
+    """Delta feed for offline clients.
+
+    ``since`` is the ``cursor`` from the previous response; omit it (or pass
+    0) for a full snapshot. Each response carries changed races, workouts and
+    photo metadata at their latest state, ``deleted`` tombstone ids, and
+    ``has_more`` when the client should immediately ask again. ``user_id``
+    lets a client notice its local copy belongs to another account and start
+    over from ``since=0``.
+    """
+    since = request.args.get('since', default=0, type=int)
+    if since <= 0:
+        return jsonify(_sync_snapshot(current_user.id))
+    return jsonify(_sync_delta(current_user.id, since))
+
+@app.route('/api/sync', methods=['POST'])
+@login_required
+def api_sync_push():
+    """Apply a batch of queued offline writes (``{"mutations": [...]}``) in order."""
+    payload = request.get_json(silent=True) or {}
+    mutations = payload.get('mutations')
+    if not isinstance(mutations, list):
+        return jsonify({'error': 'expected a "mutations" list'}), 400
+    results = []
+    for mutation in mutations:
+        try:
+            results.append(_apply_sync_mutation(current_user.id, mutation if isinstance(mutation, dict) else {}))
+        except Exception as e:
+            db.session.rollback()
+            print(f'[SYNC_ERROR] user_id={current_user.id} mutation={mutation} error={e}', file=sys.stderr)
+            results.append({'client_id': mutation.get('client_id') if isinstance(mutation, dict) else None,
+                            'status': 'error', 'error': 'server error'})
+    if mutations:
+        queue_sync_compaction()
+    return jsonify({'results': results})
+
 @app.route('/health')
 def health_check():
     """Health check endpoint for Docker health monitoring"""
@@ -827,13 +1687,53 @@ def health_check():
 
 @app.route('/tracker/health')
 def tracker_health():
-    return jsonify({"service": "tracker", "status": "healthy", "timestamp": datetime.now().isoformat()})
+    """Liveness plus a database round trip and connection pool stats."""
+    body = {"service": "tracker", "status": "healthy", "timestamp": datetime.now().isoformat()}
+    start = datetime.now()
+    try:
+        db.session.execute(db.text('SELECT 1'))
+        body['database'] = {'ok': True, 'ping_ms': round((datetime.now() - start).total_seconds() * 1000, 2)}
+    except Exception as e:
+        print(f'[HEALTH_DB_ERROR] error={e}', file=sys.stderr)
+        body['status'] = 'degraded'
+        body['database'] = {'ok': False}
+    body['database']['pool'] = db_engine.pool_stats(db.engine)
+    return jsonify(body), (200 if body['status'] == 'healthy' else 503)
 
 def allowed_file(filename):
     """Check if uploaded file has allowed extension"""
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def _save_uploaded_photos(race_id: int, files, form_data) -> list:
+    """Move streamed photo<n> uploads (up to 10) into place and add RacePhoto rows.
+
+    Parts were already written to disk chunk by chunk while the request was
+    parsed; here they are only linked into uploads/photos. Returns the new
+    (uncommitted) photos.
+    """
+    photos_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'photos')
+    new_photos = []
+    for i in range(1, 11):
+        file = files.get(f'photo{i}')
+        if not file or not file.filename or not allowed_file(file.filename):
+            continue
+        filename = uploads.store_file(file, photos_dir, str(uuid.uuid4()))
+        if filename is None:
+            print(f'[UPLOAD_REJECTED] race_id={race_id} file={file.filename!r} not an image', file=sys.stderr)
+            continue
+        photo = RacePhoto(
+            race_id=race_id,
+            filename=filename,
+            original_filename=file.filename,
+            photo_type=form_data.get(f'photo_type{i}', 'other'),
+            caption=form_data.get(f'photo_caption{i}', '')
+        )
+        photo.size_bytes = os.path.getsize(os.path.join(photos_dir, filename))
+        db.session.add(photo)
+        new_photos.append(photo)
+    return new_photos
+
 def _save_pasted_images_from_form(race_id: int, form_data) -> int:
     """Persist any pasted images included as data URLs in hidden inputs.
 
@@ -841,52 +1741,43 @@ def _save_pasted_images_from_form(race_id: int, form_data) -> int:
       pasted_image_<n> (value = data URL)
       pasted_type_<n>
       pasted_caption_<n>
-    Returns number of images saved.
+    Each image is base64-decoded incrementally straight to disk and must fit
+    the per-file budget. Returns number of images saved.
     """
-    import base64, re
     saved = 0
-    data_url_re = re.compile(r'^data:image/(png|jpe?g|gif|webp|bmp);base64,(.+)$', re.IGNORECASE)
+    new_photos = []
+    photos_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'photos')
     for key, value in form_data.items():
         if not key.startswith('pasted_image_'):
             continue
-        m = data_url_re.match(value.strip())
-        if not m:
-            continue
-        ext = m.group(1).lower()
-        b64data = m.group(2)
         try:
-            binary = base64.b64decode(b64data)
-        except Exception:
+            filename = uploads.decode_data_url(value, photos_dir, str(uuid.uuid4()))
+        except uploads.UploadTooLarge:
+            print(f'[UPLOAD_REJECTED] race_id={race_id} field={key} exceeds per-file budget', file=sys.stderr)
+            continue
+        if filename is None:
             continue
         index = key.split('_')[-1]
         photo_type = form_data.get(f'pasted_type_{index}', 'other') or 'other'
         caption = form_data.get(f'pasted_caption_{index}', '') or ''
-        # Normalize extension
-        if ext == 'jpeg':
-            ext = 'jpg'
-        filename = f"{uuid.uuid4()}.{ext}"
-        photo_path = os.path.join(app.config['UPLOAD_FOLDER'], 'photos', filename)
-        try:
-            with open(photo_path, 'wb') as f:
-                f.write(binary)
-            photo = RacePhoto(
-                race_id=race_id,
-                filename=filename,
-                original_filename=f"pasted.{ext}",
-                photo_type=photo_type if photo_type in ['finish','medal','bib','other'] else 'other',
-                caption=caption[:500]
-            )
-            db.session.add(photo)
-            saved += 1
-        except Exception:
-            db.session.rollback()
-            continue
+        photo = RacePhoto(
+            race_id=race_id,
+            filename=filename,
+            original_filename=f"pasted.{filename.rsplit('.', 1)[1]}",
+            photo_type=photo_type if photo_type in ['finish','medal','bib','other'] else 'other',
+            caption=caption[:500]
+        )
+        photo.size_bytes = os.path.getsize(os.path.join(photos_dir, filename))
+        db.session.add(photo)
+        new_photos.append(photo)
+        saved += 1
     if saved:
         try:
             db.session.commit()
         except Exception:
             db.session.rollback()
-            return max(saved-1, 0)
+            return 0
+        queue_photo_derivatives(new_photos)
     return saved
 
 @app.route('/api/weather')
@@ -900,52 +1791,112 @@ def api_weather():
     
     try:
         # Parse the datetime
-        dt = datetime.fromisoformat(datetime_str.replace('Z', '+00:00'))
+        dt = datetime.fromisoformat(datetime_str.replace('Z', '+00:00')).replace(tzinfo=None)
         
-        # Use centralized mock for consistency
-        weather = _mock_weather_for(place, dt)
-        return jsonify({'weather': weather, 'location': {'name': place}})
+        # Served from the shared cache; the provider is only hit for unseen hours
+        observations = lookup_weather([(place, dt)])
+        data = observations.get((weather.location_key(place), weather.hour_bucket(dt)))
+        if not data:
+            return jsonify({'error': 'No weather data found for this place and time'}), 404
+        return jsonify({'weather': data, 'location': {'name': place}})
          
     except ValueError as e:
         return jsonify({'error': f'Invalid datetime format: {str(e)}'}), 400
     except Exception as e:
         return jsonify({'error': f'Weather service error: {str(e)}'}), 500
 
-def _mock_weather_for(place: str, dt: datetime) -> dict:
-    """Centralized mock weather generator (replace with real API later)."""
-    # Optionally vary slightly by hour to feel dynamic
-    hour = getattr(dt, 'hour', 7) or 7
-    base_temp = 68 + ((hour - 7) % 6) * 2
-    return {
-        'temperature': base_temp,
-        'wind_speed': 5,
-        'humidity': 60,
-        'weather_code': 0,
-        'description': 'Clear sky'
-    }
-
-def get_weather_for_datetime(place, dt):
-    """Fetch weather for a location and datetime string."""
-    # Avoid HTTP self-calls; use internal helper for reliability and speed
-    try:
-        data = _mock_weather_for(place, dt)
-        if data and 'temperature' in data:
-            desc = data.get('description') or ''
-            return f"{desc or 'Weather'}: {data.get('temperature', '?')}°F, wind {data.get('wind_speed', '?')} mph, humidity {data.get('humidity', '?')}%"
-    except Exception:
-        pass
-    return "Weather unavailable"
-
-def _is_missing_weather(value: str | None) -> bool:
-    if not value:
-        return True
-    v = value.strip().lower()
-    return v == '' or v == 'n/a' or v.startswith('weather unavailable')
+# --- Weather cache service ---
+WEATHER_BACKFILL_CHUNK = int(os.environ.get('WEATHER_BACKFILL_CHUNK', '100'))
+# Hours the provider could not resolve (unknown place, future date, gap) are not asked for again this long
+WEATHER_NEGATIVE_TTL_SECONDS = int(os.environ.get('WEATHER_NEGATIVE_TTL_SECONDS', str(6 * 3600)))
+
+def _hour_ranges(hours, max_gap=timedelta(days=2)):
+    """Group sorted hours into (start, end) ranges so each provider call stays small."""
+    ranges = []
+    for hour in sorted(hours):
+        if ranges and hour - ranges[-1][1] <= max_gap:
+            ranges[-1][1] = hour
+        else:
+            ranges.append([hour, hour])
+    return [(start, end) for start, end in ranges]
+
+def lookup_weather(points, fetch: bool = True) -> dict:
+    """Batched weather lookup for (place, datetime) pairs.
+
+    Returns ``{(location_key, hour): observation}``. Everything already in
+    ``weather_cache`` is read with one query; with ``fetch=True`` the provider
+    is asked once per location and contiguous hour range for the rest and the
+    new rows are committed together. Hours the provider has no data for are
+    stored as rows without a payload and not asked for again until
+    ``WEATHER_NEGATIVE_TTL_SECONDS`` have passed. With ``fetch=False`` this
+    never leaves the database.
+    """
+    wanted = {}
+    for place, dt in points:
+        entry = wanted.setdefault(weather.location_key(place), {'place': place, 'hours': set()})
+        entry['hours'].add(weather.hour_bucket(dt))
+    if not wanted:
+        return {}
+    all_hours = set().union(*(entry['hours'] for entry in wanted.values()))
+    rows = (WeatherCache.query
+            .filter(WeatherCache.location_key.in_(list(wanted)),
+                    WeatherCache.hour.in_(list(all_hours)))
+            .all())
+    found = {}
+    unavailable = set()  # negative rows still within their TTL
+    expired = {}  # negative rows to refresh in place
+    negative_cutoff = datetime.utcnow() - timedelta(seconds=WEATHER_NEGATIVE_TTL_SECONDS)
+    for row in rows:
+        key = (row.location_key, row.hour)
+        if not row.payload:
+            if row.fetched_at is not None and row.fetched_at >= negative_cutoff:
+                unavailable.add(key)
+            else:
+                expired[key] = row
+            continue
+        try:
+            found[key] = json.loads(row.payload)
+        except ValueError:
+            continue
+    if not fetch:
+        return found
+    provider = weather.get_provider()
+    now = datetime.utcnow()
+    new_rows = []
+    for key, entry in wanted.items():
+        missing = [h for h in entry['hours'] if (key, h) not in found and (key, h) not in unavailable]
+        for start, end in _hour_ranges(missing):
+            try:
+                fetched = provider.fetch_range(entry['place'], start, end)
+            except Exception as e:
+                print(f'[WEATHER_FETCH_ERROR] location={key!r} {start}..{end} error={e}', file=sys.stderr)
+                fetched = {}
+            for hour in missing:
+                if not start <= hour <= end:
+                    continue
+                data = fetched.get(hour)
+                if data:
+                    found[(key, hour)] = data
+                values = {'provider': provider.name, 'summary': weather.summarize(data),
+                          'payload': json.dumps(data) if data else None, 'fetched_at': now}
+                row = expired.get((key, hour))
+                if row is not None:
+                    for attr, value in values.items():
+                        setattr(row, attr, value)
+                else:
+                    new_rows.append(WeatherCache(location_key=key, hour=hour, **values))
+    if new_rows or expired:
+        try:
+            db.session.add_all(new_rows)
+            db.session.commit()
+        except Exception as e:
+            # Usually a concurrent insert of the same hour; the values are still returned
+            db.session.rollback()
+            print(f'[WEATHER_CACHE_ERROR] could not store {len(new_rows) + len(expired)} row(s): {e}', file=sys.stderr)
+    return found
 
-def cache_race_weather(race, force: bool = False):
-    """Cache weather for start and finish times; overwrite if force=True or values are missing."""
-    place = race.location or ''
-    # Start time
+def _race_weather_times(race):
+    """Local start and finish datetimes used to look up a race's weather."""
     date = getattr(race, 'race_date', None)
     if date is None:
         date = datetime.utcnow().date()
@@ -961,162 +1912,103 @@ def cache_race_weather(race, force: bool = False):
     # Finish time (duration added to start) with support for decimals and 5K-only mm:ss:cc
     finish_str = (getattr(race, 'finish_time', None) or "00:45:00").strip()  # default 45m
     dur = _parse_duration_timedelta(finish_str, (getattr(race, 'race_type', None) or '').strip())
-    dt_finish = dt_start + dur
-    # Cache start/finish weather if missing or placeholder
-    changed = False
-    if force or _is_missing_weather(getattr(race, 'start_weather', None)):
-        race.start_weather = get_weather_for_datetime(place, dt_start)
-        changed = True
-    if force or _is_missing_weather(getattr(race, 'finish_weather', None)):
-        race.finish_weather = get_weather_for_datetime(place, dt_finish)
-        changed = True
-    if changed:
+    return dt_start, dt_start + dur
+
+def race_weather_summaries(races, fetch: bool = False) -> dict:
+    """``{race.id: {'start': str, 'finish': str}}`` for many races with one cache query."""
+    times = {}
+    for race in races:
         try:
-            db.session.add(race)
-            db.session.commit()
-        except Exception:
-            db.session.rollback()
-    return race.start_weather, race.finish_weather
-
-# --- Duration parsing helpers ---
-def _parse_duration_seconds(value: str, race_type: str) -> float:
-    """Parse a duration string into seconds (float).
-    Supports:
-      - mm:ss.cc (dot), mm:ss
-      - hh:mm:ss(.cc)
-      - 5K-only mm:ss:cc (colon centiseconds)
-      - single number = minutes
-    """
-    s = (value or '').strip()
-    if not s:
-        return 45 * 60.0
-    try:
-        parts = s.split(':')
-        # 3-part ambiguous: either hh:mm:ss(.cc) or (5K-only) mm:ss:cc
-        if len(parts) == 3:
-            a, b, c = parts[0].strip(), parts[1].strip(), parts[2].strip()
-            # If 5K and third is integer <= 99 and no decimals, treat as mm:ss:cc
-            if race_type == '5K' and ('.' not in b) and ('.' not in c) and b.isdigit() and c.isdigit() and int(c) <= 99:
-                mm = int(a)
-                ss = int(b)
-                cs = int(c)
-                return mm * 60.0 + ss + (cs / 100.0)
-            # Otherwise parse as hh:mm:s(.fraction)
-            hh = int(a) if a else 0
-            mm = int(b) if b else 0
-            sec = float(c) if c else 0.0
-            return hh * 3600.0 + mm * 60.0 + sec
-        # 2-part: mm:ss(.cc)
-        if len(parts) == 2:
-            mm = int(parts[0]) if parts[0] else 0
-            sec = float(parts[1]) if parts[1] else 0.0
-            return mm * 60.0 + sec
-        # 4-part: hh:mm:ss:cc (rare); treat last as centiseconds
-        if len(parts) == 4:
-            hh = int(parts[0])
-            mm = int(parts[1])
-            ss = int(parts[2])
-            cs = int(parts[3])
-            return hh * 3600.0 + mm * 60.0 + ss + (cs / 100.0)
-        # Single number = minutes
-        if len(parts) == 1:
-            return float(parts[0]) * 60.0
-    except Exception:
-        pass
-    # Fallback 45 min
-    return 45 * 60.0
-
-def _parse_duration_timedelta(value: str, race_type: str) -> timedelta:
-    secs = _parse_duration_seconds(value, race_type)
-    # Build timedelta with microsecond precision from float seconds
-    whole = int(secs)
-    frac = secs - whole
-    micros = int(round(frac * 1_000_000))
-    # Normalize rounding overflow (e.g., 59.999999 -> +1s)
-    if micros >= 1_000_000:
-        whole += 1
-        micros -= 1_000_000
-    return timedelta(seconds=whole, microseconds=micros)
-
-# --- Time formatting helper ---
-def format_race_time(race_type: str | None, time_str: str | None) -> str:
-    """
-    Display finish time by rules:
-    - 5K ONLY: MM:SS.cc (two-digit centiseconds). Always show .cc; use .00 if missing.
-    - Others: show HH:MM:SS if >=1h; otherwise MM:SS. Include .cc only if provided in input.
-    Accepts inputs: mm:ss(.cc), hh:mm:ss(.cc), and (5K-only) mm:ss:cc.
+            times[race.id] = _race_weather_times(race)
+        except Exception as e:
+            print(f'[RACE_WEATHER_ERROR] race_id={race.id} finish_time={race.finish_time} error={e}', file=sys.stderr)
+    observations = lookup_weather(
+        [(race.location, dt) for race in races if race.id in times for dt in times[race.id]],
+        fetch=fetch,
+    )
+    out = {}
+    for race in races:
+        if race.id not in times:
+            continue
+        key = weather.location_key(race.location)
+        start, finish = times[race.id]
+        start_data = observations.get((key, weather.hour_bucket(start)))
+        finish_data = observations.get((key, weather.hour_bucket(finish)))
+        out[race.id] = {
+            'start': weather.summarize(start_data) if start_data else None,
+            'finish': weather.summarize(finish_data) if finish_data else None,
+        }
+    return out
+
+def _is_missing_weather(value: str | None) -> bool:
+    if not value:
+        return True
+    v = value.strip().lower()
+    return v == '' or v == 'n/a' or v.startswith('weather unavailable')
+
+def _missing_weather_clause(column):
+    """SQL equivalent of _is_missing_weather for a race weather column."""
+    return or_(column.is_(None),
+               func.trim(column) == '',
+               func.lower(column) == 'n/a',
+               func.lower(column).like('weather unavailable%'))
+
+def backfill_race_weather(user_id=None, force: bool = False, chunk_size: int = WEATHER_BACKFILL_CHUNK) -> int:
+    """Fill start/finish weather for races in id-ordered chunks, one commit per chunk.
+
+    Runs as a background job (see /backfill_weather and races()). Returns the
+    number of races updated.
     """
-    if not time_str:
-        return '—'
-    rt = (race_type or '').strip()
-    s_raw = time_str.strip()
-    had_dot = '.' in s_raw
-    secs = _parse_duration_seconds(s_raw, rt)
-
-    # Convert float seconds to h/m/s/centi
-    h = int(secs // 3600)
-    rem = secs - h * 3600
-    m = int(rem // 60)
-    s = int(rem - m * 60)
-    cs = int(round((secs - int(secs)) * 100))
-    if cs == 100:
-        cs = 0
-        s += 1
-    if s >= 60:
-        s -= 60
-        m += 1
-    if m >= 60:
-        m -= 60
-        h += 1
-
-    if rt == '5K':
-        total_minutes = h * 60 + m
-        return f"{total_minutes:02d}:{s:02d}.{cs:02d}"
-
-    # Non-5K
-    if h > 0:
-        base = f"{h:d}:{m:02d}:{s:02d}"
-        return base + (f".{cs:02d}" if (had_dot and cs) else '')
-    # Under 1 hour
-    base = f"{m:02d}:{s:02d}"
-    return base + (f".{cs:02d}" if (had_dot and cs) else '')
-
-# --- Time-of-day formatting for start times (12-hour clock) ---
-def to_12hr_time(time_str: str | None) -> str:
-    """Convert 'HH:MM' or 'HH:MM:SS' string to 'HH:MM AM/PM'. Returns 'N/A' if blank."""
-    if not time_str:
-        return 'N/A'
-    try:
-        s = time_str.strip()
-        if not s:
-            return 'N/A'
-        parts = [p for p in s.split(':') if p != '']
-        if len(parts) < 2:
-            return 'N/A'
-        h = int(parts[0])
-        m = int(parts[1])
-        mer = 'AM'
-        if h == 0:
-            hh = 12
-            mer = 'AM'
-        elif 1 <= h <= 11:
-            hh = h
-            mer = 'AM'
-        elif h == 12:
-            hh = 12
-            mer = 'PM'
-        else:
-            hh = h - 12
-            mer = 'PM'
-        return f"{hh:02d}:{m:02d} {mer}"
-    except Exception:
-        return time_str or 'N/A'
+    updated = 0
+    with app.app_context():
+        last_id = 0
+        while True:
+            query = Race.query.filter(Race.id > last_id)
+            if user_id is not None:
+                query = query.filter(Race.user_id == user_id)
+            if not force:
+                query = query.filter(or_(_missing_weather_clause(Race.start_weather),
+                                         _missing_weather_clause(Race.finish_weather)))
+            chunk = query.order_by(Race.id).limit(chunk_size).all()
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+            summaries = race_weather_summaries(chunk, fetch=True)
+            for race in chunk:
+                found = summaries.get(race.id) or {}
+                changed = False
+                if found.get('start') and (force or _is_missing_weather(race.start_weather)):
+                    race.start_weather = found['start']
+                    changed = True
+                if found.get('finish') and (force or _is_missing_weather(race.finish_weather)):
+                    race.finish_weather = found['finish']
+                    changed = True
+                updated += int(changed)
+            try:
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f'[WEATHER_BACKFILL_ERROR] chunk ending at race_id={last_id} error={e}', file=sys.stderr)
+        db.session.remove()
+    return updated
+
+def queue_weather_backfill(user_id, force: bool = False):
+    """Start (or join) the background weather backfill for one user."""
+    return jobs.submit('weather_backfill', backfill_race_weather, user_id, force,
+                       key=f'weather_backfill:{user_id}')
+
+# --- Duration parsing and time formatting (memoised, see durations.py) ---
+_parse_duration_seconds = durations.parse_seconds
+_parse_duration_timedelta = durations.parse_timedelta
+format_race_time = durations.format_race_time
+to_12hr_time = durations.to_12hr
+
 
 def init_db():
-    """Initialize the database with tables"""
-    with app.app_context():
-        db.create_all()
-        print("Database initialized successfully!")
+    """Create or upgrade the schema through the versioned migration runner"""
+    from migrations.runner import migrate
+    migrate()
+    print("Database initialized successfully!")
 
 def create_default_users():
     """Create default users for testing"""
@@ -1159,18 +2051,16 @@ def dashboard():
                     .limit(5)
                     .all())
     
-    # Get personal records
+    # Personal records and totals come from the precomputed per-type summaries
     race_types = ['5K', '10K', 'Half Marathon', 'Marathon']
-    personal_records = {}
-    
-    for race_type in race_types:
-        best_race = Race.query.filter_by(user_id=current_user.id, race_type=race_type).all()
-        if best_race:
-            best_race = min(best_race, key=lambda x: x.time_to_seconds())
-            personal_records[race_type] = best_race
+    summaries = UserRaceStats.query.filter_by(user_id=current_user.id).all()
+    best_ids = {row.race_type: row.best_race_id for row in summaries if row.race_type in race_types}
+    best_races = {r.id: r for r in Race.query.filter(Race.id.in_(list(best_ids.values()))).all()} if best_ids else {}
+    personal_records = {rt: best_races[best_ids[rt]] for rt in race_types
+                        if rt in best_ids and best_ids[rt] in best_races}
     
     # Get race statistics
-    total_races = Race.query.filter_by(user_id=current_user.id).count()
+    total_races = sum(row.race_count for row in summaries)
     
     return render_template('dashboard.html', 
                          recent_races=recent_races,
@@ -1192,79 +2082,44 @@ def races():
             base_query = base_query.filter_by(race_type=race_type)
 
         per_page = 10
-        total = base_query.count()
-        race_date_col = getattr(Race, 'race_date')
-        items = (base_query
-                 .order_by(desc(race_date_col))
-                 .offset((page - 1) * per_page)
-                 .limit(per_page)
-                 .all())
+        total = list_counts.get('race', current_user.id, race_type, base_query.count)
+        # Seek pagination on (race_date, id); photos for the whole page come in one extra query
+        races_pagination = pagination.paginate(
+            base_query.options(selectinload(Race.photos)),
+            Race.race_date, Race.id,
+            page=page, per_page=per_page,
+            after=request.args.get('after'), before=request.args.get('before'),
+            total=total,
+        )
+        items = races_pagination.items
         print(f'[RACES_DIAG] user_id={getattr(current_user, "id", None)} total={total} items={len(items)}', file=sys.stderr)
 
-        class SimplePagination:
-            def __init__(self, items, page, per_page, total):
-                self.items = items
-                self.page = page
-                self.per_page = per_page
-                self.total = total
-            @property
-            def pages(self):
-                return math.ceil(self.total / self.per_page) if self.per_page else 0
-            @property
-            def has_prev(self):
-                return self.page > 1
-            @property
-            def has_next(self):
-                return self.page < self.pages
-            @property
-            def prev_num(self):
-                return self.page - 1 if self.has_prev else None
-            @property
-            def next_num(self):
-                return self.page + 1 if self.has_next else None
-            def iter_pages(self, left_edge=2, right_edge=2, left_current=2, right_current=3):
-                last = 0
-                for num in range(1, self.pages + 1):
-                    if (num <= left_edge or
-                        (num > self.page - left_current - 1 and num < self.page + right_current) or
-                        num > self.pages - right_edge):
-                        if last + 1 != num:
-                            yield None
-                        yield num
-                        last = num
-
-        races_pagination = SimplePagination(items, page, per_page, total)
-
-        # Fetch and cache weather for each race (robust: log errors, never break loop)
+        # Weather comes from the race columns, then the shared cache (read-only);
+        # anything still missing is filled by a background backfill, never here
         race_weather = {}
+        missing = []
         for race in items:
+            race_weather[race.id] = {'start': race.start_weather, 'finish': race.finish_weather}
+            if _is_missing_weather(race.start_weather) or _is_missing_weather(race.finish_weather):
+                missing.append(race)
+        if missing:
             try:
-                start_weather, finish_weather = cache_race_weather(race)
-                race_weather[race.id] = {
-                    'start': start_weather,
-                    'finish': finish_weather
-                }
+                cached = race_weather_summaries(missing, fetch=False)
             except Exception as e:
-                print(f'[RACE_WEATHER_ERROR] race_id={getattr(race, "id", None)} finish_time={getattr(race, "finish_time", None)} error={e}', file=sys.stderr)
-                race_weather[race.id] = {'start': 'N/A', 'finish': 'N/A'}
-        try:
-            db.session.commit()
-        except Exception as e:
-            print(f'[DB_COMMIT_ERROR] {e}', file=sys.stderr)
-            db.session.rollback()
-
-        def _linkify_notes(notes):
-            import re
-            if not notes:
-                return ''
-            url_pattern = r'(https?://\S+)'
-            return re.sub(url_pattern, r'<a href="\1" target="_blank">\1</a>', notes.replace('\n', '<br>'))
+                print(f'[RACE_WEATHER_ERROR] user_id={current_user.id} error={e}', file=sys.stderr)
+                cached = {}
+            for race in missing:
+                found = cached.get(race.id) or {}
+                for slot in ('start', 'finish'):
+                    if _is_missing_weather(race_weather[race.id][slot]):
+                        race_weather[race.id][slot] = found.get(slot) or 'N/A'
+            queue_weather_backfill(current_user.id)
 
         return render_template(
             'races.html',
             races=races_pagination,
             selected_type=race_type,
-            linkify_notes=_linkify_notes,
+            linkify_notes=pagination.format_notes,
             race_weather=race_weather,
             weather_icon=weather_icon,
             format_time=format_race_time,
@@ -1273,6 +2128,8 @@ def races():
             user_email=getattr(current_user, 'email', '')
         )
     except Exception as e:
+        # The fallback below must not be cached as this user's race list
+        g.skip_fragment_cache = True
         # Log rich diagnostics to stderr for correlation
         try:
             print('[RACES_ERROR]',
@@ -1287,39 +2144,12 @@ def races():
             pass
 
         # Fallback: render empty list to avoid 500 for user
-        class EmptyPagination:
-            def __init__(self):
-                self.items = []
-                self.page = 1
-                self.per_page = 10
-                self.total = 0
-            @property
-            def pages(self):
-                return 0
-            @property
-            def has_prev(self):
-                return False
-            @property
-            def has_next(self):
-                return False
-            @property
-            def prev_num(self):
-                return None
-            @property
-            def next_num(self):
-                return None
-            def iter_pages(self, *args, **kwargs):
-                return iter([])
-
-        def _linkify_notes_2(notes):
-            return ''
-
         flash('There was an issue loading your races. Showing empty list while we investigate.', 'warning')
         return render_template(
             'races.html',
-            races=EmptyPagination(),
+            races=pagination.Page([], 1, 10, 0),
             selected_type='',
-            linkify_notes=_linkify_notes_2,
+            linkify_notes=pagination.format_notes,
             race_weather={},
             weather_icon=weather_icon,
             format_time=format_race_time,
@@ -1343,43 +2173,19 @@ def workouts():
             base_query = base_query.filter_by(workout_type=workout_type)
 
         per_page = 15
-        total = base_query.count()
-        workout_date_col = getattr(Workout, 'workout_date')
-        items = (base_query
-                 .order_by(desc(workout_date_col))
-                 .offset((page - 1) * per_page)
-                 .limit(per_page)
-                 .all())
-
-        # Simple pagination class (reusing from races)
-        class SimplePagination:
-            def __init__(self, items, page, per_page, total):
-                self.items = items
-                self.page = page
-                self.per_page = per_page
-                self.total = total
-            @property
-            def pages(self):
-                return math.ceil(self.total / self.per_page) if self.per_page else 0
-            @property
-            def has_prev(self):
-                return self.page > 1
-            @property
-            def has_next(self):
-                return self.page < self.pages
-            @property
-            def prev_num(self):
-                return self.page - 1 if self.has_prev else None
-            @property
-            def next_num(self):
-                return self.page + 1 if self.has_next else None
-
-        workouts_pagination = SimplePagination(items, page, per_page, total)
+        total = list_counts.get('workout', current_user.id, workout_type, base_query.count)
+        workouts_pagination = pagination.paginate(
+            base_query, Workout.workout_date, Workout.id,
+            page=page, per_page=per_page,
+            after=request.args.get('after'), before=request.args.get('before'),
+            total=total,
+        )
 
         return render_template(
             'workouts.html',
             workouts=workouts_pagination,
             selected_type=workout_type,
+            linkify_notes=pagination.format_notes,
             total_count=total
         )
     except Exception as e:
@@ -1464,89 +2270,123 @@ def add_workout():
 
     return render_template('add_workout.html')
 
-@app.route('/import_healthkit_workouts', methods=['POST'])
-@login_required
-def import_healthkit_workouts():
-    """Import workouts from HealthKit (for iOS app)"""
-    try:
-        # This will be called by the iOS app via JavaScript
-        workouts_data = request.get_json()
-        
-        if not workouts_data or 'workouts' not in workouts_data:
-            return jsonify({'error': 'No workout data provided'}), 400
+HEALTHKIT_IMPORT_CHUNK = int(os.environ.get('HEALTHKIT_IMPORT_CHUNK', '500'))
+# Columns refreshed when a re-synced workout already exists
+_WORKOUT_UPSERT_COLUMNS = ('workout_type', 'distance', 'pace', 'calories', 'heart_rate_avg', 'heart_rate_max')
 
-        imported_count = 0
-        for workout_data in workouts_data['workouts']:
-            try:
-                # Create workout from HealthKit data
-                workout = Workout(
-                    user_id=current_user.id,
-                    workout_type=workout_data.get('type', 'Running'),
-                    duration=workout_data.get('duration', '00:00:00'),
-                    distance=workout_data.get('distance'),
-                    calories=workout_data.get('calories'),
-                    heart_rate_avg=workout_data.get('heartRateAvg'),
-                    heart_rate_max=workout_data.get('heartRateMax'),
-                    notes=f"Imported from HealthKit - {workout_data.get('sourceApp', 'Unknown')}",
-                    workout_date=datetime.strptime(workout_data.get('date', ''), '%Y-%m-%d').date() if workout_data.get('date') else None
-                )
-
-                # Calculate pace if possible
-                if workout.distance and workout.duration:
-                    workout.pace = workout.calculate_pace()
-
-                db.session.add(workout)
-                imported_count += 1
+def _upsert_workouts(user_id: int, rows: list) -> dict:
+    """Insert or refresh a chunk of normalised workouts with one bulk statement.
 
-            except Exception as e:
-                print(f'[IMPORT_WORKOUT_ERROR] workout_data={workout_data} error={e}', file=sys.stderr)
-                continue
+    Rows are matched on the natural key (user, started_at, duration, source);
+    duplicates inside the chunk collapse to the last occurrence.
+    """
+    natural_key = lambda r: (r['started_at'], r['duration'], r['source'])
+    unique = {natural_key(r): r for r in rows}
+    table = Workout.__table__
+    existing = set()
+    if unique:
+        existing = {tuple(k) for k in db.session.execute(
+            db.select(table.c.started_at, table.c.duration, table.c.source)
+            .where(table.c.user_id == user_id,
+                   table.c.started_at.in_({k[0] for k in unique}))
+        ).all()} & set(unique)
+    now = datetime.utcnow()
+    values = [dict(r, user_id=user_id, created_at=now) for r in unique.values()]
+    dialect = db.engine.dialect.name
+    if values and dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(table).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.started_at, table.c.duration, table.c.source],
+            set_={col: stmt.excluded[col] for col in _WORKOUT_UPSERT_COLUMNS},
+        )
+        db.session.execute(stmt)
+    elif values:
+        # Generic fallback: plain executemany of the rows that are new
+        new_values = [v for v in values if natural_key(v) not in existing]
+        if new_values:
+            db.session.execute(table.insert(), new_values)
+    if unique:
+        # Core statements bypass the ORM flush hooks, so log the writes for /api/sync here
+        written = db.session.execute(
+            db.select(table.c.id, table.c.started_at, table.c.duration, table.c.source)
+            .where(table.c.user_id == user_id,
+                   table.c.started_at.in_({k[0] for k in unique}))
+        ).all()
+        record_sync_changes(db.session.connection(), user_id, 'workout',
+                            [row.id for row in written if tuple(row[1:]) in unique])
+    return {
+        'inserted': len(unique) - len(existing),
+        'updated': len(existing),
+        'duplicates_in_batch': len(rows) - len(unique),
+    }
 
-        db.session.commit()
-        return jsonify({
-            'success': True,
-            'imported': imported_count,
-            'message': f'Successfully imported {imported_count} workouts from HealthKit'
-        })
+@app.route('/import_healthkit_workouts', methods=['POST'])
+@login_required
+def import_healthkit_workouts():
+    """Import workouts from HealthKit (for iOS app).
 
-    except Exception as e:
-        print(f'[IMPORT_HEALTHKIT_ERROR] user_id={current_user.id} error={e}', file=sys.stderr)
-        db.session.rollback()
-        return jsonify({'error': 'Failed to import workouts'}), 500
+    Accepts ``{"workouts": [...]}`` JSON or NDJSON (``application/x-ndjson``,
+    one workout per line, streamed). Items are validated, deduplicated on
+    (start time, duration, source) and upserted in chunks of
+    HEALTHKIT_IMPORT_CHUNK, each committed on its own; the response lists the
+    outcome of every chunk, so an interrupted import can simply be re-sent.
+    """
+    user_id = current_user.id
+    if request.mimetype in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+        items = healthkit.iter_ndjson_items(request.stream)
+    else:
+        payload = request.get_json(silent=True)
+        if not payload or 'workouts' not in payload:
+            return jsonify({'error': 'No workout data provided'}), 400
+        try:
+            items = healthkit.iter_json_items(payload)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    chunks = []
+    totals = {'inserted': 0, 'updated': 0, 'duplicates_in_batch': 0, 'invalid': 0}
+    for number, (rows, errors) in enumerate(healthkit.validated_chunks(items, HEALTHKIT_IMPORT_CHUNK)):
+        result = {'chunk': number, 'received': len(rows) + len(errors), 'invalid': len(errors), 'errors': errors[:20]}
+        try:
+            result.update(_upsert_workouts(user_id, rows))
+            db.session.commit()
+            result['status'] = 'ok'
+        except Exception as e:
+            db.session.rollback()
+            print(f'[IMPORT_HEALTHKIT_ERROR] user_id={user_id} chunk={number} error={e}', file=sys.stderr)
+            result.update({'status': 'failed', 'inserted': 0, 'updated': 0, 'duplicates_in_batch': 0})
+        for key in totals:
+            totals[key] += result.get(key, 0)
+        chunks.append(result)
+    list_counts.invalidate('workout', user_id)
+
+    failed = sum(1 for c in chunks if c['status'] == 'failed')
+    body = {
+        'success': failed == 0,
+        'imported': totals['inserted'],
+        **totals,
+        'chunks': chunks,
+        'message': f"Imported {totals['inserted']} new and refreshed {totals['updated']} existing workouts from HealthKit",
+    }
+    return jsonify(body), (200 if failed == 0 else 207)
 
 @app.route('/backfill_weather', methods=['POST'])
 @login_required
 def backfill_weather():
-    """Backfill weather for all of the current user's races."""
-    races = Race.query.filter_by(user_id=current_user.id).all()
+    """Backfill weather for all of the current user's races (in the background)."""
     # Support forcing via form or query param
     def _truthy(v: str | None) -> bool:
         if not v:
             return False
         return v.lower() in ('1', 'true', 'yes', 'on')
     force = _truthy(request.args.get('force')) or _truthy(request.form.get('force'))
-    updated = 0
-    for r in races:
-        try:
-            before_sw, before_fw = getattr(r, 'start_weather', None), getattr(r, 'finish_weather', None)
-            if force:
-                # Explicitly clear cached values to ensure reset semantics
-                r.start_weather = None
-                r.finish_weather = None
-            sw, fw = cache_race_weather(r, force=force)
-            if force:
-                updated += 1  # Count all processed when forcing
-            else:
-                if sw != before_sw or fw != before_fw:
-                    updated += 1
-        except Exception:
-            continue
-    try:
-        db.session.commit()
-    except Exception:
-        db.session.rollback()
+    queue_weather_backfill(current_user.id, force=force)
     if force:
-        flash(f'Weather forced refresh for {len(races)} race(s).')
+        flash('Weather refresh started for all races; results will appear shortly.')
     else:
-        flash(f'Weather backfilled for {updated} race(s).')
+        flash('Weather backfill started for races missing weather; results will appear shortly.')
     return redirect(url_for('races'))
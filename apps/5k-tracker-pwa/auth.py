@@ -0,0 +1,218 @@
+"""
+Authentication helpers: cached session user loading and login throttling.
+
+Flask-Login calls the user loader on every authenticated request. The
+session stores ``"<id>:<auth_version>"`` (see ``User.get_id``) and
+``UserCache`` keeps a column snapshot of each loaded user under
+``(id, auth_version)``. A hit is re-attached to the request's session with
+``merge(load=False)``, so no query is issued, and relationships still load
+lazily as before. ``auth_version`` is bumped whenever the password changes,
+which also signs out every other session of that user. Other profile edits
+drop the entry in this process through the ORM hooks in app.py, and expire
+after ``AUTH_USER_CACHE_SECONDS`` in the other workers.
+
+``TokenBucket`` throttles the endpoints that hash passwords or mint reset
+tokens (login, forgot/reset password). Every attempt is charged to the
+client address. Only failed password checks are charged to the account's
+email. A correct password clears that bucket, so nobody can lock an owner
+out just by knowing their email address.
+
+Run ``python auth.py`` for a benchmark of the per-request loader cost.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+AUTH_USER_CACHE_SECONDS = float(os.environ.get('AUTH_USER_CACHE_SECONDS', '30'))
+AUTH_USER_CACHE_SIZE = int(os.environ.get('AUTH_USER_CACHE_SIZE', '4096'))
+# Sustained attempts per minute and the burst allowed on top, per client and per account
+AUTH_RATE_PER_MINUTE = float(os.environ.get('AUTH_RATE_PER_MINUTE', '6'))
+AUTH_RATE_BURST = int(os.environ.get('AUTH_RATE_BURST', '10'))
+
+
+# --- Session tokens ---
+def session_token(user_id, version):
+    return f'{user_id}:{version or 0}'
+
+
+def parse_session_token(token):
+    """``"<id>:<version>"`` -> ``(id, version)``; a bare id (older sessions) is version 0."""
+    user_id, _, version = str(token).partition(':')
+    try:
+        return int(user_id), int(version or 0)
+    except ValueError:
+        return None
+
+
+# --- Cached user snapshots ---
+def snapshot(obj):
+    """Loaded column values of an ORM instance (unloaded/expired columns are skipped)."""
+    state = sa_inspect(obj)
+    return {attr.key: state.dict[attr.key] for attr in state.mapper.column_attrs if attr.key in state.dict}
+
+
+def restore(model, values):
+    """Detached ``model`` instance holding ``values`` as if just loaded from the database."""
+    obj = model.__mapper__.class_manager.new_instance()
+    for key, value in values.items():
+        setattr(obj, key, value)
+    make_transient_to_detached(obj)
+    return obj
+
+
+class UserCache:
+    """Per-process LRU of user snapshots keyed ``(id, version)`` with a TTL.
+
+    ``ttl <= 0`` disables caching.
+    """
+
+    def __init__(self, ttl=AUTH_USER_CACHE_SECONDS, maxsize=AUTH_USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        if self.ttl <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return None
+            if now - hit[1] >= self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return hit[0]
+
+    def put(self, key, values):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (values, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            for key in [k for k in self._data if k[0] == user_id]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# --- Rate limiting ---
+class TokenBucket:
+    """Per-key token buckets refilled at ``rate_per_minute`` up to ``burst``.
+
+    Buckets live in this process only, so the effective limit scales with the
+    number of workers; that is enough to make password guessing impractical.
+    """
+
+    def __init__(self, rate_per_minute=AUTH_RATE_PER_MINUTE, burst=AUTH_RATE_BURST, max_keys=10000):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _level(self, key, now):
+        tokens, stamp = self._buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - stamp) * self.rate)
+
+    def _wait(self, levels):
+        short = [key for key, level in levels.items() if level < 1]
+        if not short:
+            return 0
+        if self.rate <= 0:
+            return 60.0
+        return max((1 - levels[key]) / self.rate for key in short)
+
+    def wait(self, *keys):
+        """Seconds until every bucket in ``keys`` has a token (``0`` if they do); takes nothing."""
+        now = time.monotonic()
+        with self._lock:
+            return self._wait({key: self._level(key, now) for key in keys})
+
+    def consume(self, *keys):
+        """Take one token from every bucket in ``keys``.
+
+        Returns ``0`` when allowed, otherwise the seconds until a retry can
+        succeed; nothing is taken unless all buckets have a token.
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = {key: self._level(key, now) for key in keys}
+            retry_after = self._wait(levels)
+            if retry_after:
+                return retry_after
+            if len(self._buckets) + len(keys) > self.max_keys:
+                self._prune(now)
+            for key, level in levels.items():
+                self._buckets[key] = (level - 1, now)
+            return 0
+
+    def _prune(self, now):
+        # Buckets that have refilled completely carry no state worth keeping
+        for key in [k for k in self._buckets if self._level(k, now) >= self.burst]:
+            del self._buckets[key]
+        while len(self._buckets) >= self.max_keys:
+            self._buckets.pop(next(iter(self._buckets)))
+
+    def reset(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._buckets.pop(key, None)
+
+
+if __name__ == '__main__':
+    # Benchmark: per-request user loading with and without the cache, on a scratch SQLite DB
+    import sys
+    import tempfile
+    import timeit
+
+    scratch = tempfile.mkdtemp(prefix='auth-bench-')
+    os.environ['TRACKER_DATABASE_URI'] = f'sqlite:///{os.path.join(scratch, "bench.db")}'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as tracker
+
+    tracker.init_db()
+    with tracker.app.app_context():
+        user = tracker.User(username='bench@example.com', email='bench@example.com')
+        user.set_password('bench-password')
+        tracker.db.session.add(user)
+        tracker.db.session.commit()
+        token = user.get_id()
+
+    def load():
+        with tracker.app.test_request_context('/'):
+            assert tracker.load_user(token) is not None
+            tracker.db.session.remove()
+
+    client = tracker.app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = token
+        sess['_fresh'] = True
+
+    def page():
+        assert client.get('/profile').status_code == 200
+
+    runs = 500
+    results = {}
+    for label, ttl in (('uncached', 0), ('cached', AUTH_USER_CACHE_SECONDS or 30)):
+        tracker.user_cache.ttl = ttl
+        tracker.user_cache.clear()
+        load()
+        page()
+        results[label] = (min(timeit.repeat(load, number=runs, repeat=3)) / runs * 1e6,
+                          min(timeit.repeat(page, number=runs // 5, repeat=3)) / (runs // 5) * 1e6)
+    for label, (loader_us, page_us) in results.items():
+        print(f'{label:9} load_user {loader_us:8.1f} us/request   GET /profile {page_us:8.1f} us/request')
@@ -0,0 +1,225 @@
+"""
+Streaming data export.
+
+Rows are read with ``yield_per`` and encoded a batch at a time, so a CSV or
+JSON Lines download is sent while it is being produced and memory stays flat
+regardless of how many races/workouts a user has.
+
+Zip archives (CSV + JSONL of everything plus the original photos) are written
+through the same generators: to the response for small accounts, or to a file
+under ``<UPLOAD_FOLDER>/exports/<user_id>`` by a background job (see
+``jobs``) for large ones, which the user then downloads.
+"""
+import csv
+import io
+import json
+import os
+import shutil
+import time
+import zipfile
+from datetime import date, datetime
+
+BATCH_ROWS = int(os.environ.get('EXPORT_BATCH_ROWS', '500'))
+# Finished archives are deleted after this long
+EXPORT_RETENTION_SECONDS = int(os.environ.get('EXPORT_RETENTION_SECONDS', str(24 * 3600)))
+# A placeholder/partial archive untouched this long is treated as abandoned (e.g. worker restarted)
+EXPORT_STALE_SECONDS = int(os.environ.get('EXPORT_STALE_SECONDS', str(30 * 60)))
+PART_SUFFIX = '.part'
+FAILED_SUFFIX = '.failed'
+COPY_CHUNK = 256 * 1024
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+}
+
+# (json key, CSV header, attribute) per exported column
+RACE_FIELDS = (
+    ('date', 'Date', 'race_date'),
+    ('name', 'Race Name', 'race_name'),
+    ('type', 'Type', 'race_type'),
+    ('start_time', 'Start Time', 'race_time'),
+    ('finish_time', 'Finish Time', 'finish_time'),
+    ('location', 'Location', 'location'),
+    ('weather', 'Weather', 'weather'),
+    ('notes', 'Notes', 'notes'),
+    ('start_weather', 'Start Weather', 'start_weather'),
+    ('finish_weather', 'Finish Weather', 'finish_weather'),
+    ('race_page_url', 'Race Page URL', 'race_page_url'),
+)
+
+WORKOUT_FIELDS = (
+    ('date', 'Date', 'workout_date'),
+    ('type', 'Type', 'workout_type'),
+    ('duration', 'Duration', 'duration'),
+    ('distance', 'Distance', 'distance'),
+    ('pace', 'Pace', 'pace'),
+    ('calories', 'Calories', 'calories'),
+    ('heart_rate_avg', 'Avg Heart Rate', 'heart_rate_avg'),
+    ('heart_rate_max', 'Max Heart Rate', 'heart_rate_max'),
+    ('location', 'Location', 'location'),
+    ('weather', 'Weather', 'weather'),
+    ('notes', 'Notes', 'notes'),
+    ('started_at', 'Started At (UTC)', 'started_at'),
+    ('source', 'Source', 'source'),
+)
+
+
+def _value(row, attr):
+    value = getattr(row, attr)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def iter_csv(rows, fields):
+    """CSV text chunks (header first), one chunk per ``BATCH_ROWS`` rows."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow([header for _, header, _ in fields])
+    count = 0
+    for row in rows:
+        writer.writerow(['' if v is None else v for v in (_value(row, attr) for _, _, attr in fields)])
+        count += 1
+        if count % BATCH_ROWS == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def iter_jsonl(rows, fields):
+    """JSON Lines chunks, one object per row, ``BATCH_ROWS`` rows per chunk."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({key: _value(row, attr) for key, _, attr in fields}))
+        if len(lines) >= BATCH_ROWS:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+ENCODERS = {'csv': iter_csv, 'jsonl': iter_jsonl}
+
+
+class _Pipe:
+    """Write-only sink that hands written bytes back to a generator."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _write_archive(out, tables, photos):
+    """Write the archive to ``out``, yielding after each chunk/photo.
+
+    ``tables`` is ``[(arcname, text_chunk_iter)]``; ``photos`` iterates
+    ``(arcname, path)``. Photos are stored uncompressed (they already are).
+    """
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for arcname, chunks in tables:
+            with zf.open(arcname, 'w', force_zip64=True) as dest:
+                for chunk in chunks:
+                    dest.write(chunk.encode('utf-8'))
+                    yield
+        for arcname, path in photos:
+            if not os.path.exists(path):
+                continue
+            info = zipfile.ZipInfo(arcname, time.localtime(os.path.getmtime(path))[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            with open(path, 'rb') as src, zf.open(info, 'w', force_zip64=True) as dest:
+                shutil.copyfileobj(src, dest, COPY_CHUNK)
+            yield
+    yield
+
+
+def iter_archive(tables, photos):
+    """Zip archive as a stream of byte chunks (for a streaming response)."""
+    pipe = _Pipe()
+    for _ in _write_archive(pipe, tables, photos):
+        data = pipe.drain()
+        if data:
+            yield data
+    data = pipe.drain()
+    if data:
+        yield data
+
+
+def export_dir(upload_folder, user_id):
+    path = os.path.join(upload_folder, 'exports', str(user_id))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def prune_exports(directory, now=None):
+    """Delete finished archives older than EXPORT_RETENTION_SECONDS."""
+    now = now or time.time()
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if now - os.path.getmtime(path) > EXPORT_RETENTION_SECONDS:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def start_archive(directory, filename):
+    """Record that ``filename`` is being prepared, before its job is queued.
+
+    Archive state lives in the export directory rather than in the job
+    queue, so any worker process can answer status polls (see
+    ``archive_status``).
+    """
+    prune_exports(directory)
+    path = os.path.join(directory, filename)
+    open(path + PART_SUFFIX, 'wb').close()
+    if os.path.exists(path + FAILED_SUFFIX):
+        os.remove(path + FAILED_SUFFIX)
+
+
+def archive_status(directory, filename):
+    """``{'state': 'done'|'running'|'failed', ...}`` for an archive, or None if unknown."""
+    filename = os.path.basename(filename)
+    path = os.path.join(directory, filename)
+    if os.path.isfile(path):
+        return {'state': 'done', 'filename': filename, 'bytes': os.path.getsize(path)}
+    if os.path.exists(path + FAILED_SUFFIX):
+        return {'state': 'failed', 'filename': filename}
+    try:
+        idle = time.time() - os.path.getmtime(path + PART_SUFFIX)
+    except OSError:
+        return None
+    return {'state': 'failed' if idle > EXPORT_STALE_SECONDS else 'running', 'filename': filename}
+
+
+def write_archive_file(directory, filename, tables, photos):
+    """Build the archive in ``directory`` (via a temp name) and return its size.
+
+    On error a ``.failed`` marker is left behind for ``archive_status``.
+    """
+    final_path = os.path.join(directory, filename)
+    tmp_path = final_path + PART_SUFFIX
+    try:
+        with open(tmp_path, 'wb') as out:
+            for _ in _write_archive(out, tables, photos):
+                pass
+        os.replace(tmp_path, final_path)
+    except Exception:
+        open(final_path + FAILED_SUFFIX, 'wb').close()
+        raise
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return os.path.getsize(final_path)
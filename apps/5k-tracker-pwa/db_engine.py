@@ -0,0 +1,114 @@
+"""
+Database engine configuration.
+
+``engine_options(uri)`` returns ``SQLALCHEMY_ENGINE_OPTIONS`` tuned for the
+backend in use, and ``install(engine)`` attaches the connection and
+statement hooks:
+
+* Postgres: sized pool with pre-ping and recycling, plus a per-connection
+  ``statement_timeout`` so a runaway query cannot hold a worker forever.
+* SQLite: WAL journal (readers never block the writer), ``synchronous=NORMAL``
+  (safe with WAL, far fewer fsyncs), memory-mapped reads and a busy timeout,
+  so several gunicorn workers stop tripping over ``database is locked``.
+* Any backend: statements slower than ``DB_SLOW_QUERY_MS`` are logged.
+
+``pool_stats(engine)`` feeds the ``/tracker/health`` endpoint.
+"""
+import os
+import sys
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', '10'))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', '30000'))
+DB_SLOW_QUERY_MS = float(os.environ.get('DB_SLOW_QUERY_MS', '250'))
+
+SQLITE_BUSY_TIMEOUT_S = float(os.environ.get('SQLITE_BUSY_TIMEOUT', '30'))
+SQLITE_MMAP_BYTES = int(os.environ.get('SQLITE_MMAP_BYTES', str(256 * 1024 * 1024)))
+SQLITE_CACHE_KIB = int(os.environ.get('SQLITE_CACHE_KIB', '20000'))
+
+
+def backend(uri):
+    return make_url(uri).get_backend_name()
+
+
+def engine_options(uri):
+    """``create_engine`` keyword arguments for the database at ``uri``."""
+    name = backend(uri)
+    if name == 'postgresql':
+        options = {
+            'pool_size': DB_POOL_SIZE,
+            'max_overflow': DB_MAX_OVERFLOW,
+            'pool_timeout': DB_POOL_TIMEOUT,
+            'pool_recycle': DB_POOL_RECYCLE,
+            'pool_pre_ping': True,
+        }
+        if DB_STATEMENT_TIMEOUT_MS > 0:
+            options['connect_args'] = {'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}'}
+        return options
+    if name == 'sqlite':
+        database = make_url(uri).database
+        if not database or database == ':memory:':
+            return {}
+        return {
+            # Connections are handed between threads (background jobs) but never shared concurrently
+            'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT_S, 'check_same_thread': False},
+            'pool_size': DB_POOL_SIZE,
+            'max_overflow': DB_MAX_OVERFLOW,
+            'pool_timeout': DB_POOL_TIMEOUT,
+        }
+    return {'pool_pre_ping': True}
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_S * 1000)}')
+        cursor.execute(f'PRAGMA mmap_size={SQLITE_MMAP_BYTES}')
+        cursor.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_KIB}')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+    finally:
+        cursor.close()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._tracker_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_tracker_query_start', None)
+    if start is None:
+        return
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if elapsed_ms >= DB_SLOW_QUERY_MS:
+        sql = ' '.join(statement.split())
+        print(f'[SLOW_QUERY] {elapsed_ms:.0f}ms rows={cursor.rowcount} sql={sql[:500]}', file=sys.stderr)
+
+
+def install(engine):
+    """Attach per-connection setup and slow-query logging to ``engine`` (idempotent)."""
+    if engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:'):
+        if not event.contains(engine, 'connect', _sqlite_pragmas):
+            event.listen(engine, 'connect', _sqlite_pragmas)
+    if DB_SLOW_QUERY_MS > 0 and not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def pool_stats(engine):
+    """Snapshot of the connection pool for health checks."""
+    pool = engine.pool
+    stats = {'backend': engine.dialect.name, 'pool': type(pool).__name__}
+    for key in ('size', 'checkedin', 'checkedout', 'overflow'):
+        fn = getattr(pool, key, None)
+        if callable(fn):
+            stats[key] = fn()
+    return stats
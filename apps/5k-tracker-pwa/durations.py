@@ -0,0 +1,198 @@
+"""
+Race-time parsing and formatting.
+
+Finish times arrive as free text in a handful of shapes:
+
+* ``mm`` (minutes), ``mm:ss`` and ``mm:ss.cc``
+* ``hh:mm:ss`` and ``hh:mm:ss.cc``
+* 5K only: ``mm:ss:cc`` (colon before the centiseconds)
+* ``hh:mm:ss:cc`` (rare)
+
+One compiled grammar splits a string into its parts; the rules above then
+pick the reading. Results are memoised on ``(string, race_type)`` because the
+same few thousand distinct strings are parsed over and over while rendering
+lists, so a page of races costs dictionary lookups rather than parsing.
+Anything that does not match falls back to 45 minutes, as before.
+
+Run ``python durations.py`` for a microbenchmark.
+"""
+import re
+from datetime import timedelta
+from functools import lru_cache
+
+FALLBACK_SECONDS = 45 * 60.0
+CACHE_SIZE = 8192
+MAX_TIMEDELTA_SECONDS = timedelta.max.total_seconds()
+
+_PART = r'\s*([0-9]*(?:\.[0-9]*)?)\s*'
+# Up to four colon-separated parts; each is digits with an optional fraction
+DURATION_RE = re.compile(rf'^{_PART}(?::{_PART})?(?::{_PART})?(?::{_PART})?$', re.ASCII)
+# Hour and minute are the first two non-empty colon parts; anything after is ignored
+CLOCK_RE = re.compile(r'^:*\s*([0-9]+)\s*:+\s*([0-9]+)\s*(?::.*)?$', re.ASCII | re.DOTALL)
+
+
+def _int(part, allow_empty=True):
+    if not part:
+        if allow_empty:
+            return 0
+        raise ValueError('empty part')
+    if '.' in part:
+        raise ValueError('fraction in a non-final part')
+    return int(part)
+
+
+def _float(part):
+    return float(part) if part else 0.0
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_seconds(value, race_type=''):
+    """Duration string -> seconds (float); unparseable input gives 45 minutes."""
+    m = DURATION_RE.match(value or '')
+    if m is None or not (value or '').strip():
+        return FALLBACK_SECONDS
+    # Optional groups only capture when their colon is present
+    parts = [p for p in m.groups() if p is not None]
+    try:
+        if len(parts) == 1:
+            return float(parts[0]) * 60.0
+        if len(parts) == 2:
+            return _int(parts[0]) * 60.0 + _float(parts[1])
+        if len(parts) == 3:
+            a, b, c = parts
+            # 5K with whole seconds and a two-digit tail reads as mm:ss:cc
+            if race_type == '5K' and b and c and '.' not in b and '.' not in c and int(c) <= 99:
+                return _int(a, allow_empty=False) * 60.0 + int(b) + int(c) / 100.0
+            return _int(a) * 3600.0 + _int(b) * 60.0 + _float(c)
+        hh, mm, ss, cs = (_int(p, allow_empty=False) for p in parts)
+        return hh * 3600.0 + mm * 60.0 + ss + cs / 100.0
+    except ValueError:
+        return FALLBACK_SECONDS
+
+
+def parse_timedelta(value, race_type=''):
+    """``parse_seconds`` as a timedelta with microsecond precision."""
+    secs = parse_seconds(value, race_type)
+    if not secs < MAX_TIMEDELTA_SECONDS:
+        # Absurd digit strings (or inf) would overflow timedelta
+        secs = FALLBACK_SECONDS
+    whole = int(secs)
+    micros = int(round((secs - whole) * 1_000_000))
+    # Normalize rounding overflow (e.g., 59.999999 -> +1s)
+    if micros >= 1_000_000:
+        whole += 1
+        micros -= 1_000_000
+    return timedelta(seconds=whole, microseconds=micros)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _format_race_time(race_type, time_str):
+    rt = race_type.strip()
+    s_raw = time_str.strip()
+    had_dot = '.' in s_raw
+    secs = parse_seconds(s_raw, rt)
+
+    # Convert float seconds to h/m/s/centi
+    h = int(secs // 3600)
+    rem = secs - h * 3600
+    m = int(rem // 60)
+    s = int(rem - m * 60)
+    cs = int(round((secs - int(secs)) * 100))
+    if cs == 100:
+        cs = 0
+        s += 1
+    if s >= 60:
+        s -= 60
+        m += 1
+    if m >= 60:
+        m -= 60
+        h += 1
+
+    if rt == '5K':
+        return f"{h * 60 + m:02d}:{s:02d}.{cs:02d}"
+    frac = f".{cs:02d}" if (had_dot and cs) else ''
+    if h > 0:
+        return f"{h:d}:{m:02d}:{s:02d}{frac}"
+    return f"{m:02d}:{s:02d}{frac}"
+
+
+def format_race_time(race_type, time_str):
+    """
+    Display finish time by rules:
+    - 5K ONLY: MM:SS.cc (two-digit centiseconds). Always show .cc; use .00 if missing.
+    - Others: show H:MM:SS if >=1h; otherwise MM:SS. Include .cc only if provided in input.
+    """
+    if not time_str:
+        return '—'
+    return _format_race_time(race_type or '', time_str)
+
+
+@lru_cache(maxsize=1024)
+def to_12hr(time_str):
+    """'HH:MM' or 'HH:MM:SS' -> 'HH:MM AM/PM'; 'N/A' if blank or unreadable."""
+    if not time_str or not time_str.strip():
+        return 'N/A'
+    m = CLOCK_RE.match(time_str.strip())
+    if m is None:
+        # Fewer than two parts counts as blank; otherwise show the text as entered
+        return 'N/A' if len([p for p in time_str.strip().split(':') if p]) < 2 else time_str
+    h, minute = int(m.group(1)), int(m.group(2))
+    mer = 'AM' if h < 12 else 'PM'
+    hh = 12 if h in (0, 12) else (h if h < 12 else h - 12)
+    return f"{hh:02d}:{minute:02d} {mer}"
+
+
+def pace(total_seconds, distance):
+    """'MM:SS' per distance unit, or None without a positive duration and distance."""
+    if not distance or not total_seconds or total_seconds <= 0:
+        return None
+    minutes, seconds = divmod(int(total_seconds / distance), 60)
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+# --- Batch APIs ---
+def parse_many(pairs):
+    """Seconds for each ``(value, race_type)`` pair, in order."""
+    return [parse_seconds(value or '', (race_type or '').strip()) for value, race_type in pairs]
+
+
+def format_many(pairs):
+    """``format_race_time`` for each ``(race_type, time_str)`` pair, in order."""
+    return [format_race_time(race_type, time_str) for race_type, time_str in pairs]
+
+
+def cache_info():
+    return {'parse': parse_seconds.cache_info()._asdict(),
+            'format': _format_race_time.cache_info()._asdict(),
+            'to_12hr': to_12hr.cache_info()._asdict()}
+
+
+if __name__ == '__main__':
+    # Microbenchmark: format 1,000 races (typical list page worth of repeats)
+    import random
+    import timeit
+
+    rng = random.Random(5)
+    samples = []
+    for _ in range(1000):
+        kind = rng.choice(['5K', '10K', 'Half Marathon', 'Marathon'])
+        mm, ss, cs = rng.randint(15, 59), rng.randint(0, 59), rng.randint(0, 99)
+        text = rng.choice([f'{mm}:{ss:02d}', f'{mm}:{ss:02d}.{cs:02d}', f'{mm}:{ss:02d}:{cs:02d}',
+                           f'1:{mm:02d}:{ss:02d}', f'{rng.randint(2, 5)}:{mm:02d}:{ss:02d}.{cs:02d}'])
+        samples.append((kind, text))
+
+    def cold():
+        parse_seconds.cache_clear()
+        _format_race_time.cache_clear()
+        format_many(samples)
+
+    def warm():
+        format_many(samples)
+
+    runs = 200
+    cold_ms = min(timeit.repeat(cold, number=1, repeat=runs)) * 1000
+    warm()
+    warm_ms = min(timeit.repeat(warm, number=1, repeat=runs)) * 1000
+    print(f'format 1000 race times: cold {cold_ms:.3f} ms, memoised {warm_ms:.3f} ms '
+          f'({cold_ms / warm_ms:.1f}x)')
+    print(cache_info())
@@ -0,0 +1,181 @@
+"""
+Template fragment cache.
+
+Templates wrap expensive regions in a ``{% cache %}`` block::
+
+    {% cache 'races-list', selected_type, races.page %} ... {% endcache %}
+
+The rendered HTML is stored under a digest of the template source, the
+fragment name and arguments, and a *scope* supplied by the app, here the
+user id, that user's data version and the script root. The data version
+changes with every race, workout or photo write (it is the latest
+``sync_change`` id, see app.py), so entries are never invalidated
+explicitly; stale versions simply stop being asked for and age out.
+
+Backends (``FRAGMENT_CACHE_BACKEND``):
+
+* ``memory`` (default): LRU per worker process.
+* ``sqlite``: one file (``FRAGMENT_CACHE_PATH``) shared by every gunicorn
+  worker on the host, trimmed to ``FRAGMENT_CACHE_SIZE`` oldest-first.
+* ``none``: render every time.
+"""
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+FRAGMENT_CACHE_BACKEND = os.environ.get('FRAGMENT_CACHE_BACKEND', 'memory').strip().lower()
+FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', '2048'))
+FRAGMENT_CACHE_PATH = os.environ.get('FRAGMENT_CACHE_PATH', os.path.join('instance', 'fragment-cache.sqlite'))
+
+
+# --- Backends ---
+class MemoryBackend:
+    """Per-process LRU."""
+
+    def __init__(self, maxsize=FRAGMENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteBackend:
+    """Fragments in a local SQLite file shared by all workers on the host."""
+
+    # Trim once every this many writes rather than on each one
+    TRIM_EVERY = 64
+
+    def __init__(self, path=FRAGMENT_CACHE_PATH, maxsize=FRAGMENT_CACHE_SIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS fragment ('
+                         'key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_fragment_stored_at ON fragment (stored_at)')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')  # a lost write is just a cache miss
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        try:
+            row = self._conn().execute('SELECT value FROM fragment WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f'[FRAGMENT_CACHE] read failed: {e}', file=sys.stderr)
+            return None
+        return row[0] if row else None
+
+    def set(self, key, value):
+        try:
+            conn = self._conn()
+            conn.execute('INSERT OR REPLACE INTO fragment (key, value, stored_at) VALUES (?, ?, ?)',
+                         (key, value, time.time()))
+            self._writes += 1
+            if self._writes % self.TRIM_EVERY == 0:
+                conn.execute('DELETE FROM fragment WHERE key IN (SELECT key FROM fragment '
+                             'ORDER BY stored_at DESC LIMIT -1 OFFSET ?)', (self.maxsize,))
+        except sqlite3.Error as e:
+            print(f'[FRAGMENT_CACHE] write failed: {e}', file=sys.stderr)
+
+    def clear(self):
+        self._conn().execute('DELETE FROM fragment')
+
+
+def make_backend(kind=FRAGMENT_CACHE_BACKEND):
+    """Backend named by ``FRAGMENT_CACHE_BACKEND``; None disables caching."""
+    if kind in ('', 'none', 'off'):
+        return None
+    if kind == 'sqlite':
+        return SQLiteBackend()
+    if kind != 'memory':
+        print(f'[FRAGMENT_CACHE] unknown backend {kind!r}, using memory', file=sys.stderr)
+    return MemoryBackend()
+
+
+# --- Cache and Jinja tag ---
+class FragmentCache:
+    """Backend plus the per-request scope (None means do not cache this request)."""
+
+    def __init__(self, backend, scope):
+        self.backend = backend
+        self.scope = scope
+
+    def render(self, parts, render):
+        scope = self.scope() if self.backend is not None else None
+        if scope is None:
+            return render()
+        key = hashlib.sha256(repr((scope, parts)).encode()).hexdigest()
+        html = self.backend.get(key)
+        if html is not None:
+            return Markup(html)
+        html = render()
+        self.backend.set(key, str(html))
+        return html
+
+
+class FragmentCacheExtension(Extension):
+    """``{% cache name[, vary...] %}...{% endcache %}`` backed by ``environment.fragment_cache``."""
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        # Template edits change the key, so a shared store never serves old markup
+        source = nodes.Const(f'{parser.name}:{self._source_digest(parser.name)}:{lineno}')
+        return nodes.CallBlock(self.call_method('_render', [source, nodes.List(args)]),
+                               [], [], body).set_lineno(lineno)
+
+    def _source_digest(self, name):
+        try:
+            source = self.environment.loader.get_source(self.environment, name)[0]
+        except Exception:
+            return ''
+        return hashlib.sha256(source.encode()).hexdigest()[:16]
+
+    def _render(self, source, args, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        return cache.render((source, *args), caller)
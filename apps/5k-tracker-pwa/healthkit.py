@@ -0,0 +1,142 @@
+"""
+HealthKit workout batch parsing and validation.
+
+The iOS app posts workouts either as one JSON document
+(``{"workouts": [...]}``) or as NDJSON, one workout object per line. Items are
+validated one at a time and handed on in fixed-size chunks, so an NDJSON
+upload is processed while it streams in and a bad item only rejects itself.
+
+Each valid item becomes a plain dict of ``workout`` column values. The
+natural key ``(started_at, duration, source)`` (plus the user) identifies a
+workout across re-syncs.
+"""
+import json
+from datetime import datetime, timezone
+
+DEFAULT_TYPE = 'Running'
+DEFAULT_SOURCE = 'Unknown'
+
+
+def _seconds(value):
+    """Duration in whole seconds from a number of seconds or an [HH:]MM:SS string."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        seconds = float(value)
+    elif isinstance(value, str) and value.strip():
+        parts = value.strip().split(':')
+        if len(parts) > 3:
+            raise ValueError(f'invalid duration {value!r}')
+        seconds = 0.0
+        for part in parts:
+            seconds = seconds * 60 + float(part)
+    else:
+        raise ValueError('missing duration')
+    if seconds <= 0:
+        raise ValueError(f'non-positive duration {value!r}')
+    return int(round(seconds))
+
+
+def _optional_number(item, key, cast):
+    value = item.get(key)
+    if value is None or value == '':
+        return None
+    number = cast(value)
+    if number < 0:
+        raise ValueError(f'negative {key}')
+    return number
+
+
+def _start(item):
+    """(UTC start timestamp, local workout date) from startDate, falling back to date."""
+    raw = item.get('startDate') or item.get('start')
+    if raw:
+        started = datetime.fromisoformat(str(raw).replace('Z', '+00:00'))
+        local_date = started.date()
+        if started.tzinfo is not None:
+            started = started.astimezone(timezone.utc).replace(tzinfo=None)
+        return started, local_date
+    if item.get('date'):
+        day = datetime.strptime(item['date'], '%Y-%m-%d')
+        return day, day.date()
+    raise ValueError('missing startDate/date')
+
+
+def normalize_workout(item):
+    """Validate one HealthKit item and return its column values (raises ValueError)."""
+    if not isinstance(item, dict):
+        raise ValueError('workout must be an object')
+    seconds = _seconds(item.get('duration'))
+    started_at, workout_date = _start(item)
+    source = str(item.get('sourceApp') or item.get('source') or DEFAULT_SOURCE)[:100]
+    hours, rem = divmod(seconds, 3600)
+    return {
+        'workout_type': str(item.get('type') or DEFAULT_TYPE)[:50],
+        'duration': f'{hours:02d}:{rem // 60:02d}:{rem % 60:02d}',
+        'distance': _optional_number(item, 'distance', float),
+        'calories': _optional_number(item, 'calories', lambda v: int(float(v))),
+        'heart_rate_avg': _optional_number(item, 'heartRateAvg', lambda v: int(float(v))),
+        'heart_rate_max': _optional_number(item, 'heartRateMax', lambda v: int(float(v))),
+        'notes': f'Imported from HealthKit - {source}',
+        'workout_date': workout_date,
+        'started_at': started_at,
+        'source': source,
+        '_seconds': seconds,
+    }
+
+
+def compute_paces(rows):
+    """Fill ``pace`` (MM:SS per distance unit) for a whole chunk in one pass."""
+    paces = [
+        divmod(int(row['_seconds'] / row['distance']), 60) if row['distance'] else None
+        for row in rows
+    ]
+    for row, pace in zip(rows, paces):
+        row['pace'] = f'{pace[0]:02d}:{pace[1]:02d}' if pace else None
+        del row['_seconds']
+    return rows
+
+
+def iter_json_items(payload):
+    """(index, item) pairs from a ``{"workouts": [...]}`` document or a bare list."""
+    items = payload.get('workouts') if isinstance(payload, dict) else payload
+    if not isinstance(items, list):
+        raise ValueError('expected a "workouts" list')
+    return enumerate(items)
+
+
+def iter_ndjson_items(stream):
+    """(index, item) pairs read line by line from a binary stream.
+
+    Lines that are not valid JSON are yielded as the ``ValueError`` instead of
+    an item so the caller can report them with their line number.
+    """
+    index = 0
+    for raw in stream:
+        line = raw.strip()
+        if not line:
+            continue
+        try:
+            yield index, json.loads(line)
+        except ValueError as e:
+            yield index, ValueError(f'invalid JSON: {e}')
+        index += 1
+
+
+def validated_chunks(items, size):
+    """Group (index, item) pairs into chunks of ``(rows, errors)``.
+
+    ``rows`` are normalised column dicts with pace computed; ``errors`` are
+    ``{"index": i, "error": msg}`` for items that failed validation.
+    """
+    rows, errors = [], []
+    for index, item in items:
+        try:
+            if isinstance(item, Exception):
+                raise item
+            rows.append(normalize_workout(item))
+        except (ValueError, TypeError) as e:
+            errors.append({'index': index, 'error': str(e)})
+        if len(rows) + len(errors) >= size:
+            yield compute_paces(rows), errors
+            rows, errors = [], []
+    if rows or errors:
+        yield compute_paces(rows), errors
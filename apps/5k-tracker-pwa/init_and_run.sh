@@ -11,29 +11,8 @@ python -c "
 from os import environ
 from app import app, init_db, create_default_users, User, db
 with app.app_context():
+    # Versioned migrations (migrations/runner.py): a single version check when current
     init_db()
-    # Ensure required schema migrations are applied (dev-friendly check)
-    try:
-        import sqlalchemy as sa
-        insp = sa.inspect(db.engine)
-        cols = {c['name'] for c in insp.get_columns('race')}
-        missing = []
-        if 'start_weather' not in cols:
-            missing.append('start_weather')
-        if 'finish_weather' not in cols:
-            missing.append('finish_weather')
-        if missing:
-            from sqlalchemy import text
-            print('Applying dev schema migration for race columns:', ', '.join(missing))
-            with db.engine.connect() as conn:
-                if 'start_weather' in missing:
-                    conn.execute(text('ALTER TABLE race ADD COLUMN start_weather VARCHAR(100);'))
-                if 'finish_weather' in missing:
-                    conn.execute(text('ALTER TABLE race ADD COLUMN finish_weather VARCHAR(100);'))
-                conn.commit()
-            print('Schema migration complete.')
-    except Exception as e:
-        print('Non-fatal: schema check/migration failed:', e)
     # Ensure an admin user exists. If none, create or fix it explicitly (independent of other users)
     admin = User.query.filter_by(email='admin@example.com').first()
     if not admin:
@@ -0,0 +1,105 @@
+"""
+Small in-process background job queue.
+
+Request handlers enqueue slow work (photo derivatives, backfills, exports)
+and return immediately; a fixed pool of daemon worker threads drains the
+queue. Jobs are tracked by id so callers can poll their state, and an
+optional ``key`` collapses duplicate submissions while a job is pending.
+
+The queue is per process and not persistent: anything that must survive a
+restart should be re-discoverable from the database (e.g. photos whose
+``variant`` is still NULL).
+"""
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+
+JOB_WORKERS = int(os.environ.get('TRACKER_JOB_WORKERS', '2'))
+# Finished job records are kept this long for status polling
+JOB_RETENTION_SECONDS = int(os.environ.get('TRACKER_JOB_RETENTION_SECONDS', '3600'))
+
+_queue = queue.Queue()
+_jobs = {}
+_keys = {}
+_lock = threading.Lock()
+_workers = []
+
+
+def _worker():
+    while True:
+        job_id = _queue.get()
+        with _lock:
+            job = _jobs.get(job_id)
+        if job is None:
+            continue
+        job['state'] = 'running'
+        job['started_at'] = time.time()
+        try:
+            job['result'] = job.pop('fn')(*job.pop('args'), **job.pop('kwargs'))
+            job['state'] = 'done'
+        except Exception as e:
+            job['state'] = 'failed'
+            job['error'] = str(e)
+            print(f'[JOB_ERROR] kind={job["kind"]} id={job_id} error={e}', file=sys.stderr)
+        finally:
+            job['finished_at'] = time.time()
+            with _lock:
+                if job.get('key') is not None and _keys.get(job['key']) == job_id:
+                    del _keys[job['key']]
+
+
+def _ensure_workers():
+    with _lock:
+        alive = [t for t in _workers if t.is_alive()]
+        _workers[:] = alive
+        for n in range(len(alive), max(1, JOB_WORKERS)):
+            t = threading.Thread(target=_worker, name=f'tracker-job-{n}', daemon=True)
+            t.start()
+            _workers.append(t)
+
+
+def _prune(now):
+    for job_id in [j for j, job in _jobs.items()
+                   if job.get('finished_at') and now - job['finished_at'] > JOB_RETENTION_SECONDS]:
+        del _jobs[job_id]
+
+
+def submit(kind, fn, *args, key=None, **kwargs):
+    """Queue ``fn(*args, **kwargs)`` and return its job id.
+
+    If ``key`` is given and a job with the same key is still pending or
+    running, that job's id is returned and nothing new is queued.
+    """
+    _ensure_workers()
+    now = time.time()
+    with _lock:
+        _prune(now)
+        if key is not None and key in _keys:
+            return _keys[key]
+        job_id = uuid.uuid4().hex
+        _jobs[job_id] = {
+            'id': job_id, 'kind': kind, 'key': key, 'state': 'queued', 'created_at': now,
+            'fn': fn, 'args': args, 'kwargs': kwargs,
+        }
+        if key is not None:
+            _keys[key] = job_id
+    _queue.put(job_id)
+    return job_id
+
+
+def get(job_id):
+    """Public view of a job (no callable), or None if unknown/expired."""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        return {k: v for k, v in job.items() if k not in ('fn', 'args', 'kwargs')}
+
+
+def pending(key):
+    """True while a job with ``key`` is queued or running."""
+    with _lock:
+        return key in _keys
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations.
+
+Applied versions are recorded in the ``schema_version`` table. On startup
+``migrate()`` reads the highest recorded version with a single query and
+returns immediately when it matches ``LATEST``; otherwise the pending steps
+run in order, each recorded as soon as it succeeds.
+
+Every step is idempotent (it inspects before altering), so databases that
+were upgraded by the old one-off scripts simply have their versions
+recorded. Indexes are built with ``CREATE INDEX CONCURRENTLY`` on Postgres so
+existing tables stay writable while they build.
+
+Usage::
+
+    python migrations/runner.py                  # apply pending migrations
+    python migrations/runner.py --status         # show applied/pending versions
+    python migrations/runner.py --rebuild-stats  # recompute race statistics tables
+    python migrations/runner.py --process-photos # build derivatives for unprocessed/failed photos
+"""
+import json
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+# Add parent directory to Python path so we can import from app.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import or_, text
+from sqlalchemy.exc import SQLAlchemyError
+
+import durations
+import photo_pipeline
+from app import (app, db, Race, RacePhoto, UserRaceStats, PHOTO_MAX_ATTEMPTS, _process_photo_job,
+                 rebuild_race_stats)
+
+BATCH_SIZE = 500
+# Arbitrary key for pg_advisory_lock so concurrent boots migrate one at a time
+ADVISORY_LOCK_KEY = 541_200_041
+
+
+# --- DDL helpers ---
+def _columns(engine, table):
+    return {column['name'] for column in db.inspect(engine).get_columns(table)}
+
+
+def _index_exists(engine, table, name):
+    return name in {index['name'] for index in db.inspect(engine).get_indexes(table)}
+
+
+def _quoted(engine, table):
+    # "user" is a reserved word on Postgres
+    return engine.dialect.identifier_preparer.quote(table)
+
+
+def _is_unique(engine, table, column):
+    inspector = db.inspect(engine)
+    constraints = [c['column_names'] for c in inspector.get_unique_constraints(table)]
+    indexes = [i['column_names'] for i in inspector.get_indexes(table) if i['unique']]
+    return [column] in constraints + indexes
+
+
+def add_column(engine, table, column, ddl_type):
+    if column in _columns(engine, table):
+        return
+    print(f"Adding {table}.{column}...")
+    with engine.begin() as conn:
+        conn.execute(text(f'ALTER TABLE {_quoted(engine, table)} ADD COLUMN {column} {ddl_type}'))
+
+
+def create_index(engine, name, table, columns, unique=False):
+    """Create an index if missing; online (CONCURRENTLY) on Postgres."""
+    kind = 'UNIQUE INDEX' if unique else 'INDEX'
+    if engine.dialect.name == 'postgresql':
+        with engine.connect() as conn:
+            conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+            # An interrupted concurrent build leaves an INVALID index behind; rebuild it
+            invalid = conn.execute(text(
+                'SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid '
+                'WHERE c.relname = :name AND NOT i.indisvalid'), {'name': name}).first()
+            if invalid:
+                conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+            elif _index_exists(engine, table, name):
+                return
+            print(f"Creating {kind.lower()} {name} on {table} (concurrently)...")
+            conn.execute(text(f'CREATE {kind} CONCURRENTLY IF NOT EXISTS {name} ON {_quoted(engine, table)} ({columns})'))
+        return
+    if _index_exists(engine, table, name):
+        return
+    print(f"Creating {kind.lower()} {name} on {table}...")
+    with engine.begin() as conn:
+        conn.execute(text(f'CREATE {kind} IF NOT EXISTS {name} ON {_quoted(engine, table)} ({columns})'))
+
+
+def _variant(raw):
+    try:
+        info = json.loads(raw) if raw else None
+    except ValueError:
+        return None
+    return info if isinstance(info, dict) and info.get('widths') else None
+
+
+def _failed_attempts(raw):
+    try:
+        info = json.loads(raw) if raw else None
+    except ValueError:
+        return 0
+    return (info.get('attempts') or 1) if isinstance(info, dict) and info.get('failed') else 0
+
+
+# --- Migration steps (append only; never renumber) ---
+def _create_tables(engine):
+    db.metadata.create_all(engine, checkfirst=True)
+
+
+def _race_weather_columns(engine):
+    add_column(engine, 'race', 'start_weather', 'VARCHAR(100)')
+    add_column(engine, 'race', 'finish_weather', 'VARCHAR(100)')
+
+
+def _race_time_column(engine):
+    add_column(engine, 'race', 'race_time', 'VARCHAR(20)')
+
+
+def _race_page_url_column(engine):
+    add_column(engine, 'race', 'race_page_url', 'TEXT')
+
+
+def _race_finish_seconds(engine):
+    add_column(engine, 'race', 'finish_seconds', 'FLOAT')
+    # Backfill rows that have never been parsed, in batches
+    backfilled = 0
+    while True:
+        rows = db.session.execute(
+            text('SELECT id, finish_time, race_type FROM race '
+                 'WHERE finish_seconds IS NULL ORDER BY id LIMIT :n'),
+            {'n': BATCH_SIZE},
+        ).fetchall()
+        if not rows:
+            break
+        seconds = durations.parse_many((r[1], r[2]) for r in rows)
+        db.session.execute(
+            text('UPDATE race SET finish_seconds = :s WHERE id = :id'),
+            [{'id': r[0], 's': secs} for r, secs in zip(rows, seconds)],
+        )
+        db.session.commit()
+        backfilled += len(rows)
+    if backfilled:
+        print(f"Backfilled finish_seconds for {backfilled} race(s).")
+    create_index(engine, 'ix_race_user_type_seconds', 'race', 'user_id, race_type, finish_seconds')
+
+
+def _photo_variant_column(engine):
+    add_column(engine, 'race_photo', 'variant', 'TEXT')
+
+
+def _list_pagination_indexes(engine):
+    create_index(engine, 'ix_race_user_date', 'race', 'user_id, race_date, id')
+    create_index(engine, 'ix_race_user_type_date', 'race', 'user_id, race_type, race_date, id')
+    create_index(engine, 'ix_workout_user_date', 'workout', 'user_id, workout_date, id')
+    create_index(engine, 'ix_race_photo_race_id', 'race_photo', 'race_id')
+
+
+def _user_race_stats(engine):
+    if UserRaceStats.query.first() or not Race.query.first():
+        return
+    print(f"Built race statistics for {rebuild_race_stats()} key(s).")
+
+
+def _workout_natural_key(engine):
+    add_column(engine, 'workout', 'started_at', 'TIMESTAMP')
+    add_column(engine, 'workout', 'source', 'VARCHAR(100)')
+    create_index(engine, 'uq_workout_natural_key', 'workout', 'user_id, started_at, duration, source', unique=True)
+
+
+def _user_auth_indexes(engine):
+    add_column(engine, 'user', 'auth_version', 'INTEGER NOT NULL DEFAULT 0')
+    # Login/forgot-password look up by email, reset links by token
+    if not _is_unique(engine, 'user', 'email'):
+        create_index(engine, 'uq_user_email', 'user', 'email', unique=True)
+    create_index(engine, 'uq_user_reset_token', 'user', 'reset_token', unique=True)
+
+
+def _photo_size_bytes(engine):
+    add_column(engine, 'race_photo', 'size_bytes', 'BIGINT')
+    photos_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'photos')
+    derived = photo_pipeline.derived_dir(photos_dir)
+    measured = 0
+    while True:
+        rows = db.session.execute(
+            text('SELECT id, filename, variant FROM race_photo '
+                 'WHERE size_bytes IS NULL ORDER BY id LIMIT :n'),
+            {'n': BATCH_SIZE},
+        ).fetchall()
+        if not rows:
+            break
+        db.session.execute(
+            text('UPDATE race_photo SET size_bytes = :s WHERE id = :id'),
+            [{'id': r[0], 's': photo_pipeline.disk_usage(os.path.join(photos_dir, r[1]), derived, _variant(r[2]))}
+             for r in rows],
+        )
+        db.session.commit()
+        measured += len(rows)
+    if measured:
+        print(f"Measured storage for {measured} photo(s).")
+
+
+MIGRATIONS = (
+    (1, 'create_tables', _create_tables),
+    (2, 'race_weather_columns', _race_weather_columns),
+    (3, 'race_time_column', _race_time_column),
+    (4, 'race_page_url_column', _race_page_url_column),
+    (5, 'race_finish_seconds', _race_finish_seconds),
+    (6, 'photo_variant_column', _photo_variant_column),
+    (7, 'list_pagination_indexes', _list_pagination_indexes),
+    (8, 'user_race_stats', _user_race_stats),
+    (9, 'workout_natural_key', _workout_natural_key),
+    (10, 'user_auth_indexes', _user_auth_indexes),
+    (11, 'photo_size_bytes', _photo_size_bytes),
+)
+LATEST = MIGRATIONS[-1][0]
+
+
+# --- Runner ---
+def _ensure_version_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_version ('
+            'version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at TIMESTAMP NOT NULL)'))
+
+
+def current_version(engine):
+    """Highest applied version, or 0 if the version table does not exist yet."""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text('SELECT MAX(version) FROM schema_version')).scalar() or 0
+    except SQLAlchemyError:
+        return 0
+
+
+@contextmanager
+def _migration_lock(engine):
+    if engine.dialect.name != 'postgresql':
+        yield
+        return
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+        conn.execute(text('SELECT pg_advisory_lock(:k)'), {'k': ADVISORY_LOCK_KEY})
+        try:
+            yield
+        finally:
+            conn.execute(text('SELECT pg_advisory_unlock(:k)'), {'k': ADVISORY_LOCK_KEY})
+
+
+def migrate():
+    """Apply pending migrations; returns the resulting schema version."""
+    try:
+        with app.app_context():
+            engine = db.engine
+            version = current_version(engine)
+            if version >= LATEST:
+                print(f"Schema is current (version {version}).")
+                return version
+            _ensure_version_table(engine)
+            with _migration_lock(engine):
+                # Another process may have migrated while we waited for the lock
+                version = current_version(engine)
+                for number, name, step in MIGRATIONS:
+                    if number <= version:
+                        continue
+                    print(f"Applying migration {number}: {name}...")
+                    step(engine)
+                    with engine.begin() as conn:
+                        conn.execute(text('INSERT INTO schema_version (version, name, applied_at) '
+                                          'VALUES (:v, :n, :t)'),
+                                     {'v': number, 'n': name, 't': datetime.utcnow()})
+                    version = number
+            print(f"Schema migrated to version {version}.")
+            return version
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error applying migrations: {e}")
+        raise
+
+
+def status():
+    with app.app_context():
+        version = current_version(db.engine)
+        for number, name, _ in MIGRATIONS:
+            print(f"{'applied' if number <= version else 'pending':8} {number:3d} {name}")
+
+
+def process_pending_photos():
+    with app.app_context():
+        # Unprocessed photos plus failed ones that have not used up their attempts
+        candidates = RacePhoto.query.filter(or_(RacePhoto.variant.is_(None),
+                                                RacePhoto.variant.like('%"failed"%'))).all()
+        pending = [(p.id, p.filename) for p in candidates
+                   if p.variant is None or _failed_attempts(p.variant) < PHOTO_MAX_ATTEMPTS]
+        print(f"Generating derivatives for {len(pending)} photo(s)...")
+        for photo_id, filename in pending:
+            _process_photo_job(photo_id, filename)
+
+
+def rebuild_stats():
+    with app.app_context():
+        print(f"Rebuilt race statistics for {rebuild_race_stats()} key(s).")
+
+
+if __name__ == "__main__":
+    if '--status' in sys.argv:
+        status()
+    else:
+        migrate()
+        if '--rebuild-stats' in sys.argv:
+            rebuild_stats()
+        if '--process-photos' in sys.argv:
+            process_pending_photos()
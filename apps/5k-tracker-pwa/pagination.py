@@ -0,0 +1,175 @@
+"""
+Shared list pagination for /races and /workouts.
+
+Lists are ordered newest first on ``(date, id)`` and paged with keyset (seek)
+pagination: Next/Previous links carry a cursor for the last/first row shown,
+so fetching page N is an index range scan of ``per_page + 1`` rows no matter
+how deep N is. Jumping straight to an arbitrary page number still works via
+OFFSET as a fallback.
+
+Also here: a small per-user total-count cache (invalidated on writes, see
+the mapper events in app.py) and the notes formatter used by the list
+templates.
+"""
+import functools
+import math
+import re
+import threading
+import time
+from datetime import date
+
+from markupsafe import Markup, escape
+from sqlalchemy import and_, or_
+
+_URL_RE = re.compile(r'(https?://[^\s<]+)')
+_NEWLINE_RE = re.compile(r'\r\n|\r|\n')
+
+
+def encode_cursor(sort_value, row_id):
+    """Opaque-ish cursor for a row, e.g. ``2024-05-01.123``."""
+    return f'{sort_value.isoformat()}.{row_id}'
+
+
+def decode_cursor(token):
+    """Inverse of ``encode_cursor``; returns ``(date, id)`` or None if malformed."""
+    try:
+        day, row_id = (token or '').rsplit('.', 1)
+        return date.fromisoformat(day), int(row_id)
+    except ValueError:
+        return None
+
+
+class Page:
+    """One page of results plus what the templates need to link around it."""
+
+    def __init__(self, items, page, per_page, total, has_next=None, sort_attr=None):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self._has_next = has_next
+        self._sort_attr = sort_attr
+
+    @property
+    def pages(self):
+        return math.ceil(self.total / self.per_page) if self.per_page else 0
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        if self._has_next is not None:
+            return self._has_next
+        return self.page < self.pages
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+    def _cursor(self, row):
+        return encode_cursor(getattr(row, self._sort_attr), row.id) if row is not None and self._sort_attr else None
+
+    @property
+    def next_cursor(self):
+        return self._cursor(self.items[-1]) if self.items and self.has_next else None
+
+    @property
+    def prev_cursor(self):
+        return self._cursor(self.items[0]) if self.items and self.has_prev else None
+
+    def link_args(self, num):
+        """``url_for`` arguments for page ``num``: seek cursors for neighbours, offset otherwise."""
+        if num == self.page + 1 and self.next_cursor:
+            return {'page': num, 'after': self.next_cursor}
+        if num == self.page - 1 and num > 1 and self.prev_cursor:
+            return {'page': num, 'before': self.prev_cursor}
+        return {'page': num}
+
+    def iter_pages(self, left_edge=2, right_edge=2, left_current=2, right_current=3):
+        last = 0
+        for num in range(1, self.pages + 1):
+            if (num <= left_edge or
+                    (num > self.page - left_current - 1 and num < self.page + right_current) or
+                    num > self.pages - right_edge):
+                if last + 1 != num:
+                    yield None
+                yield num
+                last = num
+
+
+def paginate(query, sort_col, id_col, page=1, per_page=10, after=None, before=None, total=0):
+    """Return a ``Page`` of ``query`` ordered by ``(sort_col, id_col)`` descending.
+
+    ``after``/``before`` are cursors from a neighbouring page's
+    ``next_cursor``/``prev_cursor``; without either, page 1 is read directly
+    and other page numbers fall back to OFFSET.
+    """
+    page = max(1, page or 1)
+    after_key = decode_cursor(after) if after else None
+    before_key = decode_cursor(before) if before else None
+    if after_key:
+        d, i = after_key
+        rows = (query.filter(or_(sort_col < d, and_(sort_col == d, id_col < i)))
+                .order_by(sort_col.desc(), id_col.desc())
+                .limit(per_page + 1).all())
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+    elif before_key:
+        d, i = before_key
+        rows = (query.filter(or_(sort_col > d, and_(sort_col == d, id_col > i)))
+                .order_by(sort_col.asc(), id_col.asc())
+                .limit(per_page).all())
+        rows.reverse()
+        has_next = True  # we came back from the page after this one
+    else:
+        rows = (query.order_by(sort_col.desc(), id_col.desc())
+                .offset((page - 1) * per_page)
+                .limit(per_page + 1).all())
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+    return Page(rows, page, per_page, total, has_next=has_next, sort_attr=sort_col.key)
+
+
+class CountCache:
+    """Per-process cache of list totals keyed ``(kind, user_id, filter)``.
+
+    Entries are dropped by ``invalidate`` when the owning user writes and
+    expire after ``ttl`` seconds (which bounds staleness across workers).
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind, user_id, flt, loader):
+        key = (kind, user_id, flt or '')
+        now = time.monotonic()
+        with self._lock:
+            hit = self._data.get(key)
+            if hit and now - hit[1] < self.ttl:
+                return hit[0]
+        value = loader()
+        with self._lock:
+            self._data[key] = (value, now)
+        return value
+
+    def invalidate(self, kind, user_id):
+        with self._lock:
+            for key in [k for k in self._data if k[0] == kind and k[1] == user_id]:
+                del self._data[key]
+
+
+@functools.lru_cache(maxsize=2048)
+def format_notes(notes):
+    """Escape notes, keep line breaks and turn URLs into links (returns Markup)."""
+    if not notes:
+        return Markup('')
+    html = _NEWLINE_RE.sub('<br>', str(escape(notes)))
+    return Markup(_URL_RE.sub(r'<a href="\1" target="_blank" rel="noopener">\1</a>', html))
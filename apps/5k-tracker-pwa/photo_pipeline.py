@@ -0,0 +1,159 @@
+"""
+Race photo derivative pipeline.
+
+Uploaded originals are normalised (auto-oriented, EXIF/GPS stripped) and a set
+of width-bucketed derivatives is written next to them so galleries can serve
+small images with ``srcset`` instead of multi-megabyte originals:
+
+    uploads/photos/<stem>.<ext>                 original (sanitised in place)
+    uploads/photos/derived/<stem>_w<W>.<fmt>    derivatives, fmt in webp/avif/jpg
+
+Processing runs as a background job (see ``jobs``); ``process_photo`` returns
+the variant description that is stored on ``RacePhoto.variant``.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+from PIL import Image, ImageOps, features
+
+# Width buckets generated for every photo (never upscaled)
+THUMB_WIDTHS = (320, 640, 1280)
+DERIVED_DIRNAME = 'derived'
+JPEG_QUALITY = 82
+WEBP_QUALITY = 78
+AVIF_QUALITY = 55
+# Refuse to decode absurdly large images (decompression bombs)
+Image.MAX_IMAGE_PIXELS = int(os.environ.get('PHOTO_MAX_PIXELS', str(60_000_000)))
+
+
+def _supported_formats():
+    """Derivative formats in preference order; AVIF only if a codec is available."""
+    Image.init()
+    formats = []
+    if '.avif' in Image.registered_extensions():
+        formats.append('avif')
+    if features.check('webp'):
+        formats.append('webp')
+    formats.append('jpg')  # universal fallback
+    return tuple(formats)
+
+
+FORMATS = _supported_formats()
+
+
+def derived_dir(photos_dir):
+    return os.path.join(photos_dir, DERIVED_DIRNAME)
+
+
+def derivative_name(filename, width, fmt):
+    """File name of one derivative, e.g. ``<uuid>_w640.webp``."""
+    stem = os.path.splitext(filename)[0]
+    return f"{stem}_w{width}.{fmt}"
+
+
+@contextmanager
+def _replacing(path):
+    """Yield a unique temp path beside ``path`` and move it into place on success.
+
+    Every gunicorn worker can pick up the same photo, so temp names must not collide.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.tmp-')
+    os.close(fd)
+    os.chmod(tmp, 0o644)  # mkstemp creates 0600; keep the permissions a plain open() would give
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _save(img, path, fmt, icc_profile=None):
+    extra = {'icc_profile': icc_profile} if icc_profile else {}
+    if fmt not in ('jpg', 'webp', 'avif'):
+        raise ValueError(f"unsupported derivative format {fmt!r}")
+    with _replacing(path) as tmp:
+        if fmt == 'jpg':
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            img.save(tmp, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True, **extra)
+        elif fmt == 'webp':
+            img.save(tmp, 'WEBP', quality=WEBP_QUALITY, method=4, **extra)
+        else:
+            img.save(tmp, 'AVIF', quality=AVIF_QUALITY, **extra)
+
+
+def _sanitise_original(img, src_path, source_format, icc_profile=None):
+    """Rewrite the original in its own format without EXIF (GPS, camera serials...)."""
+    if source_format not in ('JPEG', 'PNG', 'WEBP'):
+        return
+    params = {'icc_profile': icc_profile} if icc_profile else {}
+    if source_format == 'JPEG':
+        params.update(quality=92, optimize=True)
+    clean = img.convert('RGB') if source_format == 'JPEG' and img.mode not in ('RGB', 'L') else img
+    with _replacing(src_path) as tmp:
+        clean.save(tmp, source_format, **params)
+
+
+def process_photo(src_path, out_dir, widths=THUMB_WIDTHS, formats=None):
+    """Normalise one original and write its derivatives.
+
+    Returns the variant dict stored on the photo row:
+    ``{"w": <orig width>, "h": <orig height>, "widths": [...], "formats": [...]}``.
+    """
+    formats = tuple(formats or FORMATS)
+    os.makedirs(out_dir, exist_ok=True)
+    filename = os.path.basename(src_path)
+    with Image.open(src_path) as opened:
+        source_format = opened.format
+        animated = getattr(opened, 'is_animated', False)
+        has_exif = 'exif' in opened.info or bool(opened.getexif())
+        icc_profile = opened.info.get('icc_profile')
+        img = ImageOps.exif_transpose(opened)
+        img.load()
+    if has_exif and not animated:
+        _sanitise_original(img, src_path, source_format, icc_profile)
+    if img.mode not in ('RGB', 'RGBA', 'L'):
+        img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('P', 'LA') else 'RGB')
+
+    orig_w, orig_h = img.size
+    buckets = sorted({min(w, orig_w) for w in widths}, reverse=True)
+    current = img
+    written = []
+    # Downscale largest to smallest so each step resamples an already reduced image
+    for width in buckets:
+        if current.width > width:
+            height = max(1, round(orig_h * width / orig_w))
+            current = current.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+        for fmt in formats:
+            _save(current, os.path.join(out_dir, derivative_name(filename, width, fmt)), fmt, icc_profile)
+        written.append(width)
+    return {'w': orig_w, 'h': orig_h, 'widths': sorted(written), 'formats': list(formats)}
+
+
+def disk_usage(src_path, out_dir, variant=None):
+    """Bytes on disk for an original plus whichever of its derivatives exist."""
+    filename = os.path.basename(src_path)
+    widths = (variant or {}).get('widths') or THUMB_WIDTHS
+    formats = (variant or {}).get('formats') or FORMATS
+    paths = [src_path] + [os.path.join(out_dir, derivative_name(filename, width, fmt))
+                          for width in widths for fmt in formats]
+    total = 0
+    for path in paths:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+
+def remove_derivatives(filename, out_dir, variant=None):
+    """Delete every derivative that belongs to ``filename``."""
+    widths = (variant or {}).get('widths') or THUMB_WIDTHS
+    formats = (variant or {}).get('formats') or FORMATS
+    for width in widths:
+        for fmt in formats:
+            path = os.path.join(out_dir, derivative_name(filename, width, fmt))
+            if os.path.exists(path):
+                os.remove(path)
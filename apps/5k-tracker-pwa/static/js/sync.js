@@ -0,0 +1,201 @@
+// Offline data store and sync client for Race Tracker.
+// Loaded by pages (window) and by the service worker (importScripts), so it
+// only uses APIs available in both. Server protocol: see /api/sync in app.py.
+(function (global) {
+  'use strict';
+
+  const DB_NAME = 'race-tracker-sync';
+  const DB_VERSION = 1;
+  const DATA_STORES = ['races', 'workouts', 'photos'];
+  const ENTITY_STORE = { race: 'races', workout: 'workouts', photo: 'photos' };
+  const SYNC_TAG = 'tracker-sync';
+  const LOCAL_PREFIX = 'local-';
+
+  let syncUrl = '/api/sync';
+  let dbPromise = null;
+
+  function openDb() {
+    if (!dbPromise) {
+      dbPromise = new Promise((resolve, reject) => {
+        const req = indexedDB.open(DB_NAME, DB_VERSION);
+        req.onupgradeneeded = () => {
+          const db = req.result;
+          DATA_STORES.forEach((name) => {
+            if (!db.objectStoreNames.contains(name)) db.createObjectStore(name, { keyPath: 'id' });
+          });
+          if (!db.objectStoreNames.contains('outbox')) db.createObjectStore('outbox', { keyPath: 'seq', autoIncrement: true });
+          if (!db.objectStoreNames.contains('meta')) db.createObjectStore('meta', { keyPath: 'key' });
+        };
+        req.onsuccess = () => resolve(req.result);
+        req.onerror = () => { dbPromise = null; reject(req.error); };
+      });
+    }
+    return dbPromise;
+  }
+
+  // Run fn(transaction) synchronously and resolve when the transaction commits
+  async function withStores(stores, mode, fn) {
+    const db = await openDb();
+    return new Promise((resolve, reject) => {
+      const t = db.transaction(stores, mode);
+      let result;
+      t.oncomplete = () => resolve(result);
+      t.onerror = () => reject(t.error);
+      t.onabort = () => reject(t.error);
+      result = fn(t);
+    });
+  }
+
+  function getAll(storeName) {
+    return withStores([storeName], 'readonly', (t) => {
+      const out = [];
+      t.objectStore(storeName).openCursor().onsuccess = (e) => {
+        const cursor = e.target.result;
+        if (cursor) { out.push(cursor.value); cursor.continue(); }
+      };
+      return out;
+    });
+  }
+
+  function getRecord(storeName, id) {
+    const box = {};
+    return withStores([storeName], 'readonly', (t) => {
+      t.objectStore(storeName).get(id).onsuccess = (e) => { box.value = e.target.result; };
+    }).then(() => box.value);
+  }
+
+  // Where the local copy is up to, and which account it belongs to
+  async function getState() {
+    const cursor = await getRecord('meta', 'cursor');
+    const user = await getRecord('meta', 'user');
+    return { cursor: cursor ? cursor.value : 0, userId: user ? user.value : undefined };
+  }
+
+  function applyDelta(body) {
+    return withStores(DATA_STORES.concat(['meta']), 'readwrite', (t) => {
+      if (body.reset) DATA_STORES.forEach((name) => t.objectStore(name).clear());
+      DATA_STORES.forEach((name) => (body[name] || []).forEach((rec) => t.objectStore(name).put(rec)));
+      Object.keys(body.deleted || {}).forEach((entity) => {
+        const store = ENTITY_STORE[entity];
+        if (store) body.deleted[entity].forEach((id) => t.objectStore(store).delete(id));
+      });
+      t.objectStore('meta').put({ key: 'cursor', value: body.cursor });
+      t.objectStore('meta').put({ key: 'user', value: body.user_id });
+    });
+  }
+
+  // Pull deltas until caught up; resolves to the final cursor
+  async function pull() {
+    let { cursor, userId } = await getState();
+    for (;;) {
+      const resp = await fetch(`${syncUrl}?since=${cursor}`, { credentials: 'same-origin', headers: { Accept: 'application/json' } });
+      if (!resp.ok) throw new Error(`sync pull failed: ${resp.status}`);
+      const body = await resp.json();
+      if (cursor > 0 && body.user_id !== userId) {
+        // Another account signed in since the last sync: replace the local copy with a full snapshot
+        cursor = 0;
+        continue;
+      }
+      await applyDelta(body);
+      cursor = body.cursor;
+      if (!body.has_more) return cursor;
+    }
+  }
+
+  function newClientId() {
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+  }
+
+  // Queue an offline write and apply it to the local store optimistically.
+  // mutation: {entity: 'race'|'workout', op: 'upsert'|'delete', id?, base_version?, data?}
+  async function queueMutation(mutation) {
+    const { userId } = await getState();
+    const m = Object.assign({ client_id: newClientId(), user_id: userId }, mutation);
+    const store = ENTITY_STORE[m.entity];
+    await withStores([store, 'outbox'], 'readwrite', (t) => {
+      t.objectStore('outbox').add(m);
+      const records = t.objectStore(store);
+      if (m.op === 'delete') {
+        records.delete(m.id);
+      } else if (m.id === undefined || m.id === null) {
+        records.put(Object.assign({ id: LOCAL_PREFIX + m.client_id, pending: true }, m.data));
+      } else {
+        records.get(m.id).onsuccess = (e) => {
+          records.put(Object.assign({}, e.target.result || { id: m.id }, m.data, { pending: true }));
+        };
+      }
+    });
+    requestSync();
+    return m.client_id;
+  }
+
+  // Send queued writes in order. Conflicts resolve server-wins: the server
+  // copy replaces the local edit. Writes stay queued only on network failure.
+  // Only writes queued by the signed-in account are sent; others wait for it.
+  async function flush() {
+    let queued = await getAll('outbox');
+    if (queued.length) {
+      await pull();
+      const { userId } = await getState();
+      queued = queued.filter((m) => m.user_id === undefined || m.user_id === userId);
+    }
+    if (queued.length) {
+      const resp = await fetch(syncUrl, {
+        method: 'POST',
+        credentials: 'same-origin',
+        headers: { 'Content-Type': 'application/json', Accept: 'application/json' },
+        body: JSON.stringify({ mutations: queued.map(({ seq, user_id, ...m }) => m) }),
+      });
+      if (!resp.ok) throw new Error(`sync push failed: ${resp.status}`);
+      const { results } = await resp.json();
+      await withStores(DATA_STORES.concat(['outbox']), 'readwrite', (t) => {
+        results.forEach((res, i) => {
+          const m = queued[i];
+          const store = t.objectStore(ENTITY_STORE[m.entity]);
+          t.objectStore('outbox').delete(m.seq);
+          if (m.op === 'upsert' && (m.id === undefined || m.id === null)) store.delete(LOCAL_PREFIX + m.client_id);
+          if (res.record) store.put(res.record);
+          if (res.status === 'error') console.warn('[Sync] write rejected', m, res.error);
+        });
+      });
+    }
+    return pull();
+  }
+
+  // Prefer Background Sync so queued writes go out even after the tab closes
+  function requestSync() {
+    if (typeof window === 'undefined' && global.registration && global.registration.sync) {
+      return global.registration.sync.register(SYNC_TAG).catch(() => flush());
+    }
+    if (typeof window !== 'undefined' && navigator.serviceWorker && global.SyncManager) {
+      return navigator.serviceWorker.ready
+        .then((reg) => reg.sync.register(SYNC_TAG))
+        .catch(() => flush());
+    }
+    return flush().catch((e) => console.log('[Sync] deferred:', e.message));
+  }
+
+  async function clear() {
+    await withStores(DATA_STORES.concat(['outbox', 'meta']), 'readwrite', (t) => {
+      DATA_STORES.concat(['outbox', 'meta']).forEach((name) => t.objectStore(name).clear());
+    });
+  }
+
+  function configure(options) {
+    if (options && options.syncUrl) syncUrl = options.syncUrl;
+  }
+
+  global.TrackerSync = { SYNC_TAG, configure, openDb, getAll, getRecord, pull, flush, queueMutation, requestSync, clear };
+
+  if (typeof window !== 'undefined' && typeof document !== 'undefined') {
+    const script = document.currentScript;
+    if (script && script.dataset.syncUrl) configure({ syncUrl: script.dataset.syncUrl });
+    const start = () => flush().catch((e) => console.log('[Sync] offline, using local data:', e.message));
+    window.addEventListener('online', start);
+    document.addEventListener('click', (e) => {
+      const link = e.target.closest && e.target.closest('a[href$="/logout"]');
+      if (link) clear();
+    });
+    start();
+  }
+})(typeof self !== 'undefined' ? self : this);
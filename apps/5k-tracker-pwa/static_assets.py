@@ -0,0 +1,88 @@
+"""
+Fingerprinted static assets.
+
+Every file under ``static/`` gets a content hash baked into its URL
+(``css/style.css`` -> ``/assets/css/style.3f9a1c2b7d4e.css``), so it can be
+served with a year-long, immutable ``Cache-Control`` and a new deploy changes
+the URL of exactly the files that changed.
+
+The manifest is written at image build time (``python static_assets.py``,
+see the Dockerfile) to ``static/asset-manifest.json``; if that file is
+missing it is computed at startup instead. The service worker precache list
+and cache version are generated from the same manifest.
+"""
+import hashlib
+import json
+import os
+import sys
+
+MANIFEST_NAME = 'asset-manifest.json'
+HASH_LENGTH = 12
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def fingerprinted_name(filename, file_hash):
+    """``css/style.css`` + hash -> ``css/style.<hash>.css``."""
+    stem, ext = os.path.splitext(filename)
+    return f'{stem}.{file_hash}{ext}'
+
+
+def build_manifest(static_dir):
+    """``{relative path: fingerprinted relative path}`` for every static file."""
+    manifest = {}
+    for root, _, files in os.walk(static_dir):
+        for name in sorted(files):
+            if name == MANIFEST_NAME or name.startswith('.'):
+                continue
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, static_dir).replace(os.sep, '/')
+            manifest[rel] = fingerprinted_name(rel, _file_hash(path))
+    return dict(sorted(manifest.items()))
+
+
+def manifest_version(manifest):
+    """Short digest of the whole manifest; changes whenever any asset does."""
+    return hashlib.sha256(json.dumps(manifest, sort_keys=True).encode()).hexdigest()[:HASH_LENGTH]
+
+
+class AssetManifest:
+    """Loaded manifest plus the reverse lookup used to serve fingerprinted URLs."""
+
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        path = os.path.join(static_dir, MANIFEST_NAME)
+        try:
+            with open(path) as f:
+                self.files = json.load(f)
+        except (OSError, ValueError):
+            self.files = build_manifest(static_dir)
+        self.reverse = {hashed: rel for rel, hashed in self.files.items()}
+        self.version = manifest_version(self.files)
+
+    def hashed(self, filename):
+        return self.files.get(filename)
+
+    def original(self, hashed_name):
+        """Source file for a fingerprinted name, or None if it is not current."""
+        return self.reverse.get(hashed_name)
+
+
+def write_manifest(static_dir):
+    manifest = build_manifest(static_dir)
+    with open(os.path.join(static_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write('\n')
+    return manifest
+
+
+if __name__ == '__main__':
+    static = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    written = write_manifest(static)
+    print(f'Wrote {len(written)} entries to {os.path.join(static, MANIFEST_NAME)}')
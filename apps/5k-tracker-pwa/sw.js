@@ -1,13 +1,32 @@
 // Service Worker for Race Tracker PWA - lightweight cache versioning
+// /sw.js prepends __ASSET_VERSION and __PRECACHE_ASSETS (fingerprinted URLs) from
+// the static asset manifest, so the cache version changes with every asset change
+const ASSETS = self.__PRECACHE_ASSETS || {};
 const CACHE_PREFIX = 'race-tracker-v';
-// IMPORTANT: bump this value on deploy (we set headers no-cache for sw.js and manifest)
-const CACHE_VERSION = '8';
+const CACHE_VERSION = self.__ASSET_VERSION || '9';
 const CACHE_NAME = `${CACHE_PREFIX}${CACHE_VERSION}`;
+const asset = (name) => ASSETS[name] || `/static/${name}`;
 const PRECACHE_URLS = [
   '/manifest.json',
-  '/static/css/style.css',
   '/'
+].concat(Object.keys(ASSETS).length ? Object.values(ASSETS) : [asset('css/style.css'), asset('js/sync.js')]);
+// Views the worker can render from the local (IndexedDB) copy when the network is slow or gone
+const OFFLINE_VIEWS = ['/races', '/workouts'];
+const NETWORK_TIMEOUT_MS = 3000;
+// Form posts that are queued for background sync when the server cannot be reached
+const OFFLINE_WRITES = [
+  { pattern: /^\/add_race\/?$/, entity: 'race', redirect: '/races' },
+  { pattern: /^\/edit_race\/(\d+)\/?$/, entity: 'race', redirect: '/races' },
+  { pattern: /^\/add_workout\/?$/, entity: 'workout', redirect: '/workouts' },
 ];
+// Form fields /api/sync accepts (mirrors _SYNC_WRITABLE in app.py); photos need a connection
+const WRITE_FIELDS = {
+  race: ['race_name', 'race_type', 'race_date', 'race_time', 'finish_time', 'location', 'notes', 'race_page_url'],
+  workout: ['workout_type', 'workout_date', 'duration', 'distance', 'calories', 'heart_rate_avg',
+    'heart_rate_max', 'location', 'notes'],
+};
+
+importScripts(asset('js/sync.js'));
 
 self.addEventListener('install', (event) => {
   console.log('[Service Worker] Install, precaching:', PRECACHE_URLS);
@@ -31,15 +50,43 @@ self.addEventListener('fetch', (event) => {
   const req = event.request;
   const accept = req.headers.get('accept') || '';
 
-  // Navigation and HTML: network-first with offline fallback to cached shell
+  if (req.method === 'POST') {
+    const path = new URL(req.url).pathname;
+    const write = OFFLINE_WRITES.find((w) => w.pattern.test(path));
+    if (write) {
+      event.respondWith(postOrQueue(req, write, path.match(write.pattern)[1]));
+      return;
+    }
+  }
+
+  // Navigation and HTML: network-first; list views fall back to a page rendered
+  // from local data, everything else to the cached shell
   if (req.mode === 'navigate' || (req.method === 'GET' && accept.includes('text/html'))) {
+    const path = new URL(req.url).pathname;
+    const view = OFFLINE_VIEWS.find((v) => path === v || path.startsWith(v + '/'));
+    if (view && req.method === 'GET') {
+      event.respondWith(networkOrLocal(req, view));
+      return;
+    }
     event.respondWith(
       fetch(req).catch(() => caches.match('/'))
     );
     return;
   }
 
-  // CSS/JS: network-first so style/script updates land immediately after deploy
+  // Fingerprinted assets never change: cache-first
+  if (req.method === 'GET' && new URL(req.url).pathname.indexOf('/assets/') !== -1) {
+    event.respondWith(
+      caches.match(req).then((cached) => cached || fetch(req).then((fresh) => {
+        const copy = fresh.clone();
+        caches.open(CACHE_NAME).then((cache) => cache.put(req, copy));
+        return fresh;
+      }))
+    );
+    return;
+  }
+
+  // Other CSS/JS: network-first so style/script updates land immediately after deploy
   if (accept.includes('text/css') || accept.includes('javascript')) {
     event.respondWith((async () => {
       try {
@@ -60,3 +107,77 @@ self.addEventListener('fetch', (event) => {
     caches.match(req).then((resp) => resp || fetch(req))
   );
 });
+
+// Replay queued offline writes when connectivity returns (Background Sync)
+self.addEventListener('sync', (event) => {
+  if (event.tag === self.TrackerSync.SYNC_TAG) {
+    event.waitUntil(self.TrackerSync.flush());
+  }
+});
+
+// Post the form; if the network fails, queue it as a sync mutation and show the local list
+async function postOrQueue(req, write, id) {
+  const copy = req.clone();
+  try {
+    return await fetch(req);
+  } catch (e) {
+    const form = await copy.formData();
+    const data = {};
+    WRITE_FIELDS[write.entity].forEach((key) => {
+      if (form.has(key)) data[key] = String(form.get(key)).trim();
+    });
+    if (write.entity === 'workout' && data.duration && data.duration.split(':').length === 2) {
+      data.duration = `00:${data.duration}`;  // same MM:SS normalisation as add_workout
+    }
+    const mutation = { entity: write.entity, op: 'upsert', data };
+    if (id !== undefined) {
+      const local = await self.TrackerSync.getRecord(`${write.entity}s`, Number(id));
+      Object.assign(mutation, { id: Number(id), base_version: local ? local.version : undefined });
+    }
+    await self.TrackerSync.queueMutation(mutation);
+    return Response.redirect(new URL(write.redirect, self.location.origin).href, 303);
+  }
+}
+
+async function networkOrLocal(req, view) {
+  const network = fetch(req);
+  const timeout = new Promise((resolve) => setTimeout(resolve, NETWORK_TIMEOUT_MS, null));
+  try {
+    const resp = await Promise.race([network, timeout]);
+    if (resp) return resp;
+  } catch (e) {
+    // fall through to local data
+  }
+  try {
+    return await renderLocalView(view);
+  } catch (e) {
+    return network.catch(() => caches.match('/'));
+  }
+}
+
+function escapeHtml(value) {
+  return String(value === null || value === undefined ? '' : value)
+    .replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;')
+    .replace(/"/g, '&quot;').replace(/'/g, '&#39;');
+}
+
+async function renderLocalView(view) {
+  const isRaces = view === '/races';
+  const rows = await self.TrackerSync.getAll(isRaces ? 'races' : 'workouts');
+  const dateKey = isRaces ? 'race_date' : 'workout_date';
+  rows.sort((a, b) => String(b[dateKey] || '').localeCompare(String(a[dateKey] || '')));
+  const items = rows.map((r) => isRaces
+    ? `<li class="list-group-item"><strong>${escapeHtml(r.race_name)}</strong> <span class="badge bg-secondary">${escapeHtml(r.race_type)}</span><br><small class="text-muted">${escapeHtml(r.race_date)} &middot; ${escapeHtml(r.finish_time)}${r.location ? ' &middot; ' + escapeHtml(r.location) : ''}${r.pending ? ' &middot; not synced yet' : ''}</small></li>`
+    : `<li class="list-group-item"><strong>${escapeHtml(r.workout_type)}</strong> ${escapeHtml(r.duration)}${r.distance ? ' &middot; ' + escapeHtml(r.distance) : ''}<br><small class="text-muted">${escapeHtml(r.workout_date)}${r.pace ? ' &middot; ' + escapeHtml(r.pace) + ' pace' : ''}${r.pending ? ' &middot; not synced yet' : ''}</small></li>`
+  ).join('');
+  const title = isRaces ? 'My Races' : 'My Workouts';
+  const html = `<!DOCTYPE html><html lang="en"><head><meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>${title} (offline)</title>
+<link rel="manifest" href="/manifest.json"><link rel="stylesheet" href="${asset('css/style.css')}">
+</head><body><div class="container py-3">
+<div class="alert alert-warning">You are offline. Showing ${rows.length} ${isRaces ? 'races' : 'workouts'} saved on this device.</div>
+<h2>${title}</h2><ul class="list-group">${items || '<li class="list-group-item text-muted">Nothing saved on this device yet.</li>'}</ul>
+<p class="mt-3"><a href="/">Home</a></p></div></body></html>`;
+  return new Response(html, { headers: { 'Content-Type': 'text/html; charset=utf-8', 'X-Rendered-By': 'service-worker' } });
+}
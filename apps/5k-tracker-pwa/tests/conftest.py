@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+# Add the app directory so that flat modules (durations, ...) are importable
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
@@ -0,0 +1,158 @@
+"""Property tests for durations: round trips on well-formed times and
+agreement with the parser it replaced (kept below as the reference)."""
+from datetime import timedelta
+
+from hypothesis import given, strategies as st
+
+import durations
+from durations import FALLBACK_SECONDS, format_race_time, parse_seconds, parse_timedelta, to_12hr
+
+RACE_TYPES = st.sampled_from(['5K', '10K', 'Half Marathon', 'Marathon', ''])
+minutes = st.integers(min_value=0, max_value=59)
+seconds = st.integers(min_value=0, max_value=59)
+centis = st.integers(min_value=0, max_value=99)
+hours = st.integers(min_value=0, max_value=9)
+# Free text in the alphabet finish times are typed with
+duration_text = st.text(alphabet='0123456789:. \t', max_size=14)
+
+
+# --- Reference: the parsing/formatting helpers app.py used before durations.py ---
+
+def _reference_parse_seconds(value, race_type):
+    s = (value or '').strip()
+    if not s:
+        return 45 * 60.0
+    try:
+        parts = s.split(':')
+        if len(parts) == 3:
+            a, b, c = parts[0].strip(), parts[1].strip(), parts[2].strip()
+            if race_type == '5K' and ('.' not in b) and ('.' not in c) and b.isdigit() and c.isdigit() and int(c) <= 99:
+                return int(a) * 60.0 + int(b) + (int(c) / 100.0)
+            hh = int(a) if a else 0
+            mm = int(b) if b else 0
+            sec = float(c) if c else 0.0
+            return hh * 3600.0 + mm * 60.0 + sec
+        if len(parts) == 2:
+            mm = int(parts[0]) if parts[0] else 0
+            sec = float(parts[1]) if parts[1] else 0.0
+            return mm * 60.0 + sec
+        if len(parts) == 4:
+            return int(parts[0]) * 3600.0 + int(parts[1]) * 60.0 + int(parts[2]) + (int(parts[3]) / 100.0)
+        if len(parts) == 1:
+            return float(parts[0]) * 60.0
+    except Exception:
+        pass
+    return 45 * 60.0
+
+
+def _reference_to_12hr(time_str):
+    if not time_str:
+        return 'N/A'
+    try:
+        s = time_str.strip()
+        if not s:
+            return 'N/A'
+        parts = [p for p in s.split(':') if p != '']
+        if len(parts) < 2:
+            return 'N/A'
+        h = int(parts[0])
+        m = int(parts[1])
+        if h == 0:
+            hh, mer = 12, 'AM'
+        elif 1 <= h <= 11:
+            hh, mer = h, 'AM'
+        elif h == 12:
+            hh, mer = 12, 'PM'
+        else:
+            hh, mer = h - 12, 'PM'
+        return f"{hh:02d}:{m:02d} {mer}"
+    except Exception:
+        return time_str or 'N/A'
+
+
+def _close(a, b):
+    return abs(a - b) < 1e-6
+
+
+# --- Well-formed inputs ---
+
+@given(minutes, seconds, RACE_TYPES)
+def test_mm_ss(mm, ss, race_type):
+    assert _close(parse_seconds(f'{mm}:{ss:02d}', race_type), mm * 60 + ss)
+
+
+@given(minutes, seconds, centis, RACE_TYPES)
+def test_mm_ss_dot_cc(mm, ss, cc, race_type):
+    assert _close(parse_seconds(f'{mm}:{ss:02d}.{cc:02d}', race_type), mm * 60 + ss + cc / 100)
+
+
+@given(hours, minutes, seconds, st.one_of(st.none(), centis), st.sampled_from(['10K', 'Half Marathon', 'Marathon']))
+def test_hh_mm_ss(hh, mm, ss, cc, race_type):
+    text = f'{hh}:{mm:02d}:{ss:02d}' + (f'.{cc:02d}' if cc is not None else '')
+    expected = hh * 3600 + mm * 60 + ss + (cc or 0) / 100
+    assert _close(parse_seconds(text, race_type), expected)
+
+
+@given(minutes, seconds, centis)
+def test_5k_mm_ss_cc(mm, ss, cc):
+    assert _close(parse_seconds(f'{mm}:{ss:02d}:{cc:02d}', '5K'), mm * 60 + ss + cc / 100)
+
+
+@given(minutes, seconds, centis)
+def test_5k_format_round_trips(mm, ss, cc):
+    for text in (f'{mm}:{ss:02d}:{cc:02d}', f'{mm}:{ss:02d}.{cc:02d}'):
+        shown = format_race_time('5K', text)
+        assert shown == f'{mm:02d}:{ss:02d}.{cc:02d}'
+        assert _close(parse_seconds(shown, '5K'), parse_seconds(text, '5K'))
+
+
+@given(hours, minutes, seconds, centis, st.sampled_from(['10K', 'Half Marathon', 'Marathon']))
+def test_format_round_trips(hh, mm, ss, cc, race_type):
+    text = f'{hh}:{mm:02d}:{ss:02d}.{cc:02d}'
+    shown = format_race_time(race_type, text)
+    assert _close(parse_seconds(shown, race_type), parse_seconds(text, race_type))
+
+
+@given(duration_text, RACE_TYPES)
+def test_timedelta_matches_seconds(text, race_type):
+    td = parse_timedelta(text, race_type)
+    secs = parse_seconds(text, race_type)
+    if secs >= durations.MAX_TIMEDELTA_SECONDS:
+        secs = FALLBACK_SECONDS
+    assert abs(td.total_seconds() - secs) <= 1e-6 * max(1.0, secs)
+    assert td >= timedelta(0)
+
+
+# --- Agreement with the previous implementation ---
+
+@given(duration_text, RACE_TYPES)
+def test_parse_matches_reference(text, race_type):
+    assert _close(parse_seconds(text, race_type), _reference_parse_seconds(text, race_type))
+
+
+@given(st.text(max_size=14), RACE_TYPES)
+def test_negative_input_falls_back(text, race_type):
+    # The old parser let int()/float() accept a leading '-'; durations never goes negative
+    text = '-' + text
+    assert parse_seconds(text, race_type) == FALLBACK_SECONDS
+    assert parse_seconds(text, race_type) >= 0
+
+
+@given(st.text(alphabet='0123456789: \t', max_size=12))
+def test_to_12hr_matches_reference(text):
+    assert to_12hr(text) == _reference_to_12hr(text)
+
+
+@given(st.integers(min_value=0, max_value=23), minutes, st.booleans())
+def test_to_12hr_clock(h, m, with_seconds):
+    text = f'{h:02d}:{m:02d}' + (':00' if with_seconds else '')
+    shown = to_12hr(text)
+    hh, rest = shown.split(':')
+    assert 1 <= int(hh) <= 12
+    assert rest == f"{m:02d} {'AM' if h < 12 else 'PM'}"
+
+
+def test_batch_apis_match_single_calls():
+    pairs = [('5K', '25:13:07'), ('10K', '55:02.5'), ('Marathon', '3:59:59'), ('5K', '')]
+    assert durations.format_many(pairs) == [format_race_time(*p) for p in pairs]
+    assert durations.parse_many([(t, r) for r, t in pairs]) == [parse_seconds(t, r) for r, t in pairs]
@@ -0,0 +1,173 @@
+"""
+Streaming photo upload handling.
+
+* Multipart file parts are written straight to disk in chunks (never spooled
+  in memory) inside ``<UPLOAD_FOLDER>/tmp`` so a finished upload can be moved
+  into place with a rename instead of a second copy.
+* Pasted ``data:image/...;base64,`` URLs are decoded incrementally into the
+  destination file rather than materialising the whole binary.
+* Every file is checked against a per-file byte budget and the whole
+  submission against a per-request budget (``MAX_CONTENT_LENGTH``).
+"""
+import base64
+import os
+import re
+import shutil
+import tempfile
+
+from werkzeug.exceptions import RequestEntityTooLarge
+from flask import Request, current_app
+
+CHUNK_SIZE = 64 * 1024
+# Base64 text is decoded in blocks that are a multiple of 4 characters
+B64_BLOCK = 4 * 16 * 1024
+
+# Per-file limit; the per-request limit is app.config['MAX_CONTENT_LENGTH']
+PHOTO_MAX_FILE_BYTES = int(os.environ.get('PHOTO_MAX_FILE_BYTES', str(12 * 1024 * 1024)))
+
+DATA_URL_RE = re.compile(r'^\s*data:image/(png|jpe?g|gif|webp|bmp);base64,', re.IGNORECASE)
+# Pasted base64 is often wrapped; whitespace is dropped before decoding
+_B64_WHITESPACE = ' \t\r\n\f\v'
+_STRIP_WHITESPACE = str.maketrans('', '', _B64_WHITESPACE)
+
+_MAGIC = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+)
+
+
+class UploadTooLarge(RequestEntityTooLarge):
+    description = 'Photo exceeds the per-file upload limit.'
+
+
+def sniff_image_type(head: bytes):
+    """Image type from the first bytes of a file ('jpg', 'png', ...), or None."""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    for magic, kind in _MAGIC:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+class _BudgetedFile:
+    """File-like wrapper that refuses to grow past ``limit`` bytes."""
+
+    def __init__(self, fileobj, limit):
+        self._file = fileobj
+        self._limit = limit
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        if self._limit and self.written > self._limit:
+            raise UploadTooLarge()
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+
+def upload_tmp_dir(upload_folder):
+    path = os.path.join(upload_folder, 'tmp')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class StreamingRequest(Request):
+    """Request whose multipart file parts stream to disk under a byte budget."""
+
+    @property
+    def max_form_memory_size(self):
+        # Non-file fields (incl. pasted data URLs) are the only form data held in memory
+        config = current_app.config
+        return config.get('MAX_FORM_MEMORY_SIZE') or config.get('MAX_CONTENT_LENGTH')
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        tmp_dir = upload_tmp_dir(current_app.config['UPLOAD_FOLDER'])
+        tmp = tempfile.NamedTemporaryFile(dir=tmp_dir, prefix='part-', suffix='.upload')
+        return _BudgetedFile(tmp, PHOTO_MAX_FILE_BYTES)
+
+
+def store_file(file_storage, dest_dir, stem):
+    """Move an uploaded part into ``dest_dir`` as ``<stem>.<type>``.
+
+    The extension comes from the file's magic bytes, not the client-supplied
+    name. Returns the new filename, or None if the part is not an image.
+    """
+    stream = file_storage.stream
+    stream.seek(0)
+    kind = sniff_image_type(stream.read(16))
+    if kind is None:
+        return None
+    filename = f'{stem}.{kind}'
+    dest_path = os.path.join(dest_dir, filename)
+    stream.seek(0)
+    name = getattr(stream, 'name', None)
+    if isinstance(name, str) and os.path.exists(name):
+        try:
+            # Same filesystem: hard-link the finished temp file, no second copy
+            os.link(name, dest_path)
+            return filename
+        except OSError:
+            pass
+    with open(dest_path, 'wb') as out:
+        shutil.copyfileobj(stream, out, CHUNK_SIZE)
+    return filename
+
+
+def _b64_blocks(value, start, end):
+    """Whitespace-free base64 text of ``value[start:end]`` in 4-aligned blocks (the last may be short)."""
+    carry = ''
+    for offset in range(start, end, B64_BLOCK):
+        carry += value[offset:min(offset + B64_BLOCK, end)].translate(_STRIP_WHITESPACE)
+        if len(carry) >= B64_BLOCK:
+            cut = len(carry) - len(carry) % 4
+            yield carry[:cut]
+            carry = carry[cut:]
+    if carry:
+        yield carry
+
+
+def decode_data_url(value, dest_dir, stem, max_bytes=PHOTO_MAX_FILE_BYTES):
+    """Decode a base64 image data URL into ``dest_dir`` block by block.
+
+    Returns the new filename (``<stem>.<type>``), or None if the value is not a
+    usable image data URL. Raises ``UploadTooLarge`` if the decoded size would
+    exceed ``max_bytes``; nothing is decoded in that case.
+    """
+    m = DATA_URL_RE.match(value or '')
+    if not m:
+        return None
+    start, end = m.end(), len(value)
+    payload = (end - start) - sum(value.count(c, start, end) for c in _B64_WHITESPACE)
+    # Decoded size is 3/4 of the base64 length, so check before decoding
+    if max_bytes and (payload // 4) * 3 > max_bytes + 3:
+        raise UploadTooLarge()
+    tmp_path = os.path.join(dest_dir, f'{stem}.part')
+    kind = None
+    try:
+        with open(tmp_path, 'wb') as out:
+            for text in _b64_blocks(value, start, end):
+                block = base64.b64decode(text)
+                if kind is None:
+                    kind = sniff_image_type(block[:16])
+                    if kind is None:
+                        break
+                out.write(block)
+        if kind is None:
+            os.remove(tmp_path)
+            return None
+        filename = f'{stem}.{kind}'
+        os.replace(tmp_path, os.path.join(dest_dir, filename))
+        return filename
+    except (ValueError, OSError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
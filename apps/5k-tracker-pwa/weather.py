@@ -0,0 +1,210 @@
+"""
+Weather providers and cache-key helpers.
+
+Observations are cached per (rounded location, hour) in the ``weather_cache``
+table (see ``WeatherCache`` in app.py) and shared by every user and race, so a
+provider is only asked for hours nobody has looked up before. Providers fetch
+a whole hour range per location in one call.
+
+Select the provider with ``WEATHER_PROVIDER``:
+
+* ``stub`` (default) - deterministic local values, no network
+* ``open-meteo`` - Open-Meteo geocoding + hourly archive/forecast APIs
+"""
+import os
+import re
+import sys
+import threading
+from datetime import date, datetime, timedelta
+
+import requests
+
+WEATHER_PROVIDER = os.environ.get('WEATHER_PROVIDER', 'stub').strip().lower()
+WEATHER_HTTP_TIMEOUT = float(os.environ.get('WEATHER_HTTP_TIMEOUT', '10'))
+
+_COORDS_RE = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+
+# WMO weather interpretation codes (subset used for descriptions)
+WMO_CODES = {
+    0: 'Clear sky', 1: 'Mainly clear', 2: 'Partly cloudy', 3: 'Overcast',
+    45: 'Fog', 48: 'Rime fog', 51: 'Light drizzle', 53: 'Drizzle', 55: 'Heavy drizzle',
+    61: 'Light rain', 63: 'Rain', 65: 'Heavy rain', 66: 'Freezing rain', 67: 'Freezing rain',
+    71: 'Light snow', 73: 'Snow', 75: 'Heavy snow', 77: 'Snow grains',
+    80: 'Rain showers', 81: 'Rain showers', 82: 'Violent rain showers',
+    85: 'Snow showers', 86: 'Snow showers', 95: 'Thunderstorm', 96: 'Thunderstorm with hail',
+    99: 'Thunderstorm with hail',
+}
+
+
+def location_key(place):
+    """Cache key for a place: coordinates rounded to ~1km, names normalised."""
+    place = (place or '').strip()
+    m = _COORDS_RE.match(place)
+    if m:
+        return f'{float(m.group(1)):.2f},{float(m.group(2)):.2f}'
+    return re.sub(r'\s+', ' ', place.lower()).strip(' ,.')
+
+
+def hour_bucket(dt):
+    """Truncate a datetime to the hour it is cached under."""
+    return dt.replace(minute=0, second=0, microsecond=0, tzinfo=None)
+
+
+def iter_hours(start, end):
+    hour = hour_bucket(start)
+    end = hour_bucket(end)
+    while hour <= end:
+        yield hour
+        hour += timedelta(hours=1)
+
+
+def summarize(data):
+    """Human readable summary stored on races, e.g. 'Clear sky: 68°F, wind 5 mph, humidity 60%'."""
+    if not data or data.get('temperature') is None:
+        return 'Weather unavailable'
+    desc = data.get('description') or 'Weather'
+    return (f"{desc}: {data.get('temperature', '?')}°F, wind {data.get('wind_speed', '?')} mph, "
+            f"humidity {data.get('humidity', '?')}%")
+
+
+class WeatherProvider:
+    """Fetches hourly observations for one location and an hour range."""
+
+    name = 'base'
+
+    def fetch_range(self, place, start, end):
+        """Return ``{hour_datetime: observation_dict}`` for hours in [start, end].
+
+        Observation dicts carry ``temperature`` (°F), ``wind_speed`` (mph),
+        ``humidity`` (%), ``weather_code`` and ``description``. Hours the
+        provider has no data for are simply absent.
+        """
+        raise NotImplementedError
+
+
+class StubWeatherProvider(WeatherProvider):
+    """Deterministic local provider for development and tests."""
+
+    name = 'stub'
+
+    def fetch_range(self, place, start, end):
+        out = {}
+        for hour in iter_hours(start, end):
+            h = hour.hour or 7
+            out[hour] = {
+                'temperature': 68 + ((h - 7) % 6) * 2,
+                'wind_speed': 5,
+                'humidity': 60,
+                'weather_code': 0,
+                'description': 'Clear sky',
+            }
+        return out
+
+
+class OpenMeteoProvider(WeatherProvider):
+    """Open-Meteo: one geocode per place, one hourly request per date range."""
+
+    name = 'open-meteo'
+    GEOCODE_URL = 'https://geocoding-api.open-meteo.com/v1/search'
+    ARCHIVE_URL = 'https://archive-api.open-meteo.com/v1/archive'
+    FORECAST_URL = 'https://api.open-meteo.com/v1/forecast'
+    # The archive lags real time by a few days; newer hours come from the forecast API
+    ARCHIVE_LAG_DAYS = 5
+
+    def __init__(self):
+        self._session = requests.Session()
+        self._coords = {}
+        self._lock = threading.Lock()
+
+    def _locate(self, place):
+        m = _COORDS_RE.match(place or '')
+        if m:
+            return float(m.group(1)), float(m.group(2))
+        key = location_key(place)
+        if not key:
+            return None
+        with self._lock:
+            if key in self._coords:
+                return self._coords[key]
+        coords = None
+        try:
+            resp = self._session.get(self.GEOCODE_URL, params={'name': place, 'count': 1},
+                                     timeout=WEATHER_HTTP_TIMEOUT)
+            resp.raise_for_status()
+            results = resp.json().get('results') or []
+            if results:
+                coords = (results[0]['latitude'], results[0]['longitude'])
+        except (requests.RequestException, ValueError, KeyError) as e:
+            print(f'[WEATHER_PROVIDER_ERROR] geocode place={place!r} error={e}', file=sys.stderr)
+            return None
+        with self._lock:
+            self._coords[key] = coords
+        return coords
+
+    def fetch_range(self, place, start, end):
+        coords = self._locate(place)
+        if coords is None:
+            return {}
+        use_archive = end.date() <= date.today() - timedelta(days=self.ARCHIVE_LAG_DAYS)
+        params = {
+            'latitude': coords[0],
+            'longitude': coords[1],
+            'start_date': start.date().isoformat(),
+            'end_date': end.date().isoformat(),
+            'hourly': 'temperature_2m,relative_humidity_2m,wind_speed_10m,weather_code',
+            'temperature_unit': 'fahrenheit',
+            'wind_speed_unit': 'mph',
+            'timezone': 'auto',
+        }
+        try:
+            resp = self._session.get(self.ARCHIVE_URL if use_archive else self.FORECAST_URL,
+                                     params=params, timeout=WEATHER_HTTP_TIMEOUT)
+            resp.raise_for_status()
+            hourly = resp.json().get('hourly') or {}
+        except (requests.RequestException, ValueError) as e:
+            print(f'[WEATHER_PROVIDER_ERROR] place={place!r} {start}..{end} error={e}', file=sys.stderr)
+            return {}
+        wanted = set(iter_hours(start, end))
+
+        def value(key, i):
+            # Series can be missing, null or shorter than 'time'
+            series = hourly.get(key) or []
+            return series[i] if i < len(series) else None
+
+        out = {}
+        for i, stamp in enumerate(hourly.get('time') or []):
+            hour = hour_bucket(datetime.fromisoformat(stamp))
+            if hour not in wanted:
+                continue
+            temp = value('temperature_2m', i)
+            if temp is None:
+                continue
+            code = value('weather_code', i)
+            out[hour] = {
+                'temperature': round(temp),
+                'wind_speed': round(value('wind_speed_10m', i) or 0),
+                'humidity': value('relative_humidity_2m', i),
+                'weather_code': code,
+                'description': WMO_CODES.get(code, 'Weather'),
+            }
+        return out
+
+
+PROVIDERS = {
+    StubWeatherProvider.name: StubWeatherProvider,
+    OpenMeteoProvider.name: OpenMeteoProvider,
+}
+
+_provider = None
+
+
+def get_provider():
+    """Process-wide provider selected by WEATHER_PROVIDER (falls back to the stub)."""
+    global _provider
+    if _provider is None:
+        cls = PROVIDERS.get(WEATHER_PROVIDER)
+        if cls is None:
+            print(f'[WEATHER_PROVIDER_ERROR] unknown provider {WEATHER_PROVIDER!r}, using stub', file=sys.stderr)
+            cls = StubWeatherProvider
+        _provider = cls()
+    return _provider
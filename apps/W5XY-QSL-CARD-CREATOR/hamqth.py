@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+HamQTH Lookups
+HamQTH XML API client with a persistent lookup cache and batch prefetch.
+
+- All requests go through one requests.Session, so the TLS connection to
+  HamQTH is kept alive between lookups instead of being set up every call.
+- Parsed <search> results and bios are stored in a small SQLite file
+  (HAMQTH_CACHE_PATH) for HAMQTH_CACHE_DAYS; "callsign not found" answers
+  are remembered for HAMQTH_NEGATIVE_CACHE_HOURS so unknown calls are not
+  asked for again on every page load. Network and session errors are
+  never cached.
+- prefetch() warms the cache for many callsigns at once with at most
+  HAMQTH_PREFETCH_WORKERS lookups in flight.
+- With HAMQTH_RECORD_DIR set, raw responses are saved as fixtures that the
+  stub server replays, so lookups can be exercised without a HamQTH account.
+
+Run "python hamqth.py --stub [fixtures dir] [port]" to serve recorded
+fixtures, and point HAMQTH_XML_URL / HAMQTH_BIO_URL at it.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+HAMQTH_XML_URL = os.environ.get('HAMQTH_XML_URL', 'https://www.hamqth.com/xml.php')
+HAMQTH_BIO_URL = os.environ.get('HAMQTH_BIO_URL', 'https://www.hamqth.com/xml_bio.php')
+HAMQTH_PROGRAM = 'W5XY_QSL_Card_Creator'
+HAMQTH_TIMEOUT = float(os.environ.get('HAMQTH_TIMEOUT', '10'))
+# Next to the app by default, not in whatever directory the app was started from
+HAMQTH_CACHE_PATH = os.environ.get('HAMQTH_CACHE_PATH',
+                                   os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hamqth_cache.sqlite'))
+HAMQTH_CACHE_DAYS = float(os.environ.get('HAMQTH_CACHE_DAYS', '30'))
+HAMQTH_NEGATIVE_CACHE_HOURS = float(os.environ.get('HAMQTH_NEGATIVE_CACHE_HOURS', '24'))
+HAMQTH_PREFETCH_WORKERS = int(os.environ.get('HAMQTH_PREFETCH_WORKERS', '4'))
+HAMQTH_RECORD_DIR = os.environ.get('HAMQTH_RECORD_DIR', '')
+
+# HamQTH sessions last an hour; renew a little early
+SESSION_SECONDS = 3500
+
+
+def _local(tag):
+    return tag.split('}', 1)[-1]
+
+
+def _child(elem, name):
+    """First direct child called name, whatever namespace the response uses."""
+    for child in elem:
+        if _local(child.tag) == name:
+            return child
+    return None
+
+
+def fixture_name(callsign, suffix='.xml'):
+    """File a recorded response for callsign is stored under (portable calls contain '/')."""
+    return callsign.upper().replace('/', '_') + suffix
+
+
+def _is_session_error(text):
+    text = text.lower()
+    return 'session' in text or 'expired' in text or 'invalid' in text
+
+
+class HamQTHCache:
+    """Parsed lookups and bios keyed by (kind, callsign); data None marks a negative entry."""
+
+    def __init__(self, path=HAMQTH_CACHE_PATH, ttl_seconds=HAMQTH_CACHE_DAYS * 86400,
+                 negative_ttl_seconds=HAMQTH_NEGATIVE_CACHE_HOURS * 3600):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS hamqth_cache ("
+            " kind TEXT NOT NULL, callsign TEXT NOT NULL, data TEXT, message TEXT,"
+            " fetched_at REAL NOT NULL, PRIMARY KEY (kind, callsign))")
+        self._conn.commit()
+
+    def get(self, kind, callsign):
+        """(data, message) if a fresh entry exists, else None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, message, fetched_at FROM hamqth_cache WHERE kind = ? AND callsign = ?",
+                (kind, callsign.upper())).fetchone()
+        if row is None:
+            return None
+        data, message, fetched_at = row
+        ttl = self.ttl_seconds if data is not None else self.negative_ttl_seconds
+        if time.time() - fetched_at > ttl:
+            return None
+        return (json.loads(data) if data is not None else None), message
+
+    def put(self, kind, callsign, data, message):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO hamqth_cache (kind, callsign, data, message, fetched_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (kind, callsign.upper(), json.dumps(data) if data is not None else None, message, time.time()))
+            self._conn.commit()
+
+    def fresh_callsigns(self, kind, callsigns):
+        """{callsign (upper-cased): is_negative} for those with a fresh entry of this kind."""
+        now = time.time()
+        fresh = {}
+        wanted = [c.upper() for c in callsigns]
+        with self._lock:
+            for start in range(0, len(wanted), 500):
+                chunk = wanted[start:start + 500]
+                rows = self._conn.execute(
+                    "SELECT callsign, data IS NULL, fetched_at FROM hamqth_cache"
+                    f" WHERE kind = ? AND callsign IN ({','.join('?' * len(chunk))})",
+                    [kind] + chunk).fetchall()
+                for callsign, negative, fetched_at in rows:
+                    ttl = self.negative_ttl_seconds if negative else self.ttl_seconds
+                    if now - fetched_at <= ttl:
+                        fresh[callsign] = bool(negative)
+        return fresh
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM hamqth_cache")
+            self._conn.commit()
+
+
+class HamQTHXMLAPI:
+    """HAMQTH XML API client for email lookup"""
+
+    def __init__(self, cache=None, base_url=HAMQTH_XML_URL, bio_url=HAMQTH_BIO_URL,
+                 pool_size=HAMQTH_PREFETCH_WORKERS, record_dir=HAMQTH_RECORD_DIR):
+        self.session_id = None
+        self.session_expires = 0
+        self.base_url = base_url
+        self.base_bio_url = bio_url
+        self.username = None
+        self.password = None
+        self.namespace = None  # Will be set after first response
+        self.cache = cache
+        self.record_dir = record_dir
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', adapter)
+        self._session_lock = threading.Lock()
+
+    def set_credentials(self, username, password):
+        if (username, password) != (self.username, self.password):
+            self.session_id = None
+            self.session_expires = 0
+        self.username = username
+        self.password = password
+
+    def _get_namespace(self, root):
+        # Extract namespace from root tag: {namespace}HamQTH
+        if root.tag.startswith('{'):
+            return root.tag.split('}')[0].strip('{')
+        return ''
+
+    def _record(self, name, content):
+        if not self.record_dir:
+            return
+        try:
+            os.makedirs(self.record_dir, exist_ok=True)
+            with open(os.path.join(self.record_dir, name), 'wb') as f:
+                f.write(content)
+        except OSError as e:
+            logging.debug(f"HAMQTH: could not record {name}: {e}")
+
+    def get_session(self, force_new=False):
+        """Get or renew session ID (reuse if valid, else request new)"""
+        if not self.username or not self.password:
+            return False, "HAMQTH credentials not configured"
+        if self.session_id and self.session_expires > time.time() and not force_new:
+            return True, "Session reused"
+        # Prefetch workers share the session; only one of them logs in
+        with self._session_lock:
+            if self.session_id and self.session_expires > time.time() and not force_new:
+                return True, "Session reused"
+            try:
+                params = {'u': self.username, 'p': self.password}
+                response = self.http.get(self.base_url, params=params, timeout=HAMQTH_TIMEOUT)
+                response.raise_for_status()
+                root = ET.fromstring(response.content)
+                self.namespace = self._get_namespace(root)
+                session_elem = _child(root, 'session')
+                if session_elem is None:
+                    return False, "No <session> element in response"
+                error_elem = _child(session_elem, 'error')
+                if error_elem is not None and error_elem.text:
+                    return False, f"HAMQTH error: {error_elem.text}"
+                session_id_elem = _child(session_elem, 'session_id')
+                if session_id_elem is not None and session_id_elem.text:
+                    self.session_id = session_id_elem.text
+                    self.session_expires = time.time() + SESSION_SECONDS
+                    return True, "Session established"
+                return False, "No session ID in response"
+            except requests.RequestException as e:
+                return False, f"Network error: {str(e)}"
+            except ET.ParseError as e:
+                return False, f"XML parse error: {str(e)}"
+            except Exception as e:
+                return False, f"Session error: {str(e)}"
+
+    def _query(self, url, params, callsign, fixture):
+        """Run one search request; returns (search element, message, cacheable)."""
+        max_retries = 2
+        for attempt in range(max_retries):
+            session_ok, message = self.get_session(force_new=(attempt > 0))
+            if not session_ok:
+                return None, message, False
+            try:
+                response = self.http.get(url, params=dict(params, id=self.session_id), timeout=HAMQTH_TIMEOUT)
+                response.raise_for_status()
+                logging.debug(f"HAMQTH raw XML for {callsign}:\n{response.text}")
+                root = ET.fromstring(response.content)
+                session_elem = _child(root, 'session')
+                if session_elem is not None:
+                    error_elem = _child(session_elem, 'error')
+                    err_text = ((error_elem.text or '') if error_elem is not None else '').strip()
+                    if err_text:
+                        # Session expired or invalid, force new session and retry
+                        if _is_session_error(err_text):
+                            if attempt < max_retries - 1:
+                                self.session_id = None
+                                self.session_expires = 0
+                                continue
+                            return None, f"HAMQTH error: {err_text}", False
+                        # Anything else (e.g. "Callsign not found") is a real answer
+                        self._record(fixture, response.content)
+                        return None, f"HAMQTH error: {err_text}", True
+                self._record(fixture, response.content)
+                search_elem = _child(root, 'search')
+                if search_elem is None:
+                    search_elem = next((e for e in root.iter() if _local(e.tag) == 'search'), None)
+                return search_elem, "Success", True
+            except requests.RequestException as e:
+                if attempt < max_retries - 1:
+                    continue
+                return None, f"Network error: {str(e)}", False
+            except ET.ParseError as e:
+                logging.warning(f"HAMQTH: XML parse error for {callsign}: {str(e)}")
+                return None, f"XML parse error: {str(e)}", False
+            except Exception as e:
+                logging.warning(f"HAMQTH: Lookup error for {callsign}: {str(e)}")
+                return None, f"Lookup error: {str(e)}", False
+        return None, "Max retries exceeded", False
+
+    def _cached_lookup(self, kind, callsign, use_cache, fetch):
+        if self.cache is not None and use_cache:
+            hit = self.cache.get(kind, callsign)
+            if hit is not None:
+                return hit
+        data, message, cacheable = fetch()
+        if self.cache is not None and cacheable:
+            self.cache.put(kind, callsign, data, message)
+        return data, message
+
+    def lookup_callsign(self, callsign, use_cache=True):
+        """Lookup callsign information; returns (dict of <search> fields, "Success") or (None, message)."""
+        def fetch():
+            params = {'callsign': callsign.lower(), 'prg': HAMQTH_PROGRAM}
+            search_elem, message, cacheable = self._query(self.base_url, params, callsign,
+                                                          fixture_name(callsign))
+            if search_elem is None:
+                if message == "Success":
+                    logging.info(f"HAMQTH: No <search> node found for {callsign}")
+                    message = "No data found for callsign"
+                return None, message, cacheable
+            data = {_local(child.tag): child.text for child in search_elem}
+            logging.debug(f"HAMQTH parsed data for {callsign}: {data}")
+            return data, "Success", True
+
+        return self._cached_lookup('callsign', callsign, use_cache, fetch)
+
+    def lookup_bio(self, callsign: str, strip_html: bool = True, use_cache=True):
+        """Lookup callsign bio text using xml_bio.php. Returns (data, message) where data is {'bio': str}.
+
+        Requires a valid session. Will attempt one session refresh on error, then fail gracefully.
+        """
+        def fetch():
+            params = {'callsign': callsign.lower(), 'strip_html': '1' if strip_html else '0'}
+            search_elem, message, cacheable = self._query(self.base_bio_url, params, callsign,
+                                                          fixture_name(callsign, '.bio.xml'))
+            if search_elem is None:
+                if message == "Success":
+                    message = "No bio found for callsign"
+                return None, message, cacheable
+            bio_elem = _child(search_elem, 'bio')
+            bio_text = bio_elem.text if bio_elem is not None else ''
+            return {'bio': bio_text or ''}, "Success", True
+
+        kind = 'bio' if strip_html else 'bio_html'
+        return self._cached_lookup(kind, callsign, use_cache, fetch)
+
+    def prefetch(self, callsigns, include_bio=False, workers=HAMQTH_PREFETCH_WORKERS, progress=None):
+        """Warm the cache for callsigns, running at most `workers` lookups at a time.
+
+        progress, if given, is called with (done, total) after each lookup.
+        Returns counts of what happened.
+        """
+        wanted = sorted({c.strip().upper() for c in callsigns if c and c.strip()})
+        stats = {'requested': len(wanted), 'cached': 0, 'found': 0, 'not_found': 0, 'errors': 0}
+        if self.cache is not None:
+            fresh = self.cache.fresh_callsigns('callsign', wanted)
+            if include_bio:
+                # Unknown callsigns never get a bio entry
+                bios = self.cache.fresh_callsigns('bio', wanted)
+                fresh = {c for c, negative in fresh.items() if negative or c in bios}
+            stats['cached'] = len(fresh)
+            wanted = [c for c in wanted if c not in fresh]
+        if not wanted:
+            return stats
+        # Log in once up front rather than having every worker race for it
+        session_ok, message = self.get_session()
+        if not session_ok:
+            stats['errors'] = len(wanted)
+            stats['error'] = message
+            return stats
+
+        lock = threading.Lock()
+        done = [0]
+
+        def work(callsign):
+            data, message = self.lookup_callsign(callsign)
+            if include_bio and data:
+                self.lookup_bio(callsign)
+            with lock:
+                if data:
+                    stats['found'] += 1
+                elif self.cache is not None and self.cache.get('callsign', callsign) is not None:
+                    stats['not_found'] += 1
+                else:
+                    stats['errors'] += 1
+                done[0] += 1
+                if progress:
+                    progress(done[0], len(wanted))
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            list(pool.map(work, wanted))
+        return stats
+
+
+# ----------------------------------------------------------------------
+# Stub server
+# ----------------------------------------------------------------------
+
+STUB_NS = 'https://www.hamqth.com'
+STUB_SESSION_ID = 'stub-session'
+
+
+def _stub_error(message):
+    return (f'<?xml version="1.0"?>\n<HamQTH version="2.8" xmlns="{STUB_NS}">'
+            f'<session><error>{message}</error></session></HamQTH>').encode()
+
+
+def make_stub_server(fixtures_dir, host='127.0.0.1', port=0):
+    """HTTP server answering xml.php / xml_bio.php from fixtures recorded with HAMQTH_RECORD_DIR.
+
+    Any user name and password log in. Callsigns without a fixture get
+    "Callsign not found". server.hits counts lookups per path, for tests.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlsplit
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the real service
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            if 'u' in query:
+                body = (f'<?xml version="1.0"?>\n<HamQTH version="2.8" xmlns="{STUB_NS}"><session>'
+                        f'<session_id>{STUB_SESSION_ID}</session_id></session></HamQTH>').encode()
+            elif query.get('id') != STUB_SESSION_ID:
+                body = _stub_error('Session does not exist or expired')
+            else:
+                callsign = query.get('callsign', '')
+                suffix = '.bio.xml' if url.path.endswith('xml_bio.php') else '.xml'
+                with self.server.hits_lock:
+                    self.server.hits[url.path] = self.server.hits.get(url.path, 0) + 1
+                fixture = os.path.join(fixtures_dir, os.path.basename(fixture_name(callsign, suffix)))
+                if callsign and os.path.exists(fixture):
+                    with open(fixture, 'rb') as f:
+                        body = f.read()
+                else:
+                    body = _stub_error('Callsign not found')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/xml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.hits = {}
+    server.hits_lock = threading.Lock()
+    return server
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) < 2 or sys.argv[1] != '--stub':
+        sys.exit("usage: python hamqth.py --stub [fixtures dir] [port]")
+    fixtures = sys.argv[2] if len(sys.argv) > 2 else (HAMQTH_RECORD_DIR or 'hamqth_fixtures')
+    stub = make_stub_server(fixtures, port=int(sys.argv[3]) if len(sys.argv) > 3 else 8765)
+    host, port = stub.server_address[:2]
+    print(f"HamQTH stub serving {fixtures} on http://{host}:{port}")
+    print(f"  HAMQTH_XML_URL=http://{host}:{port}/xml.php HAMQTH_BIO_URL=http://{host}:{port}/xml_bio.php")
+    stub.serve_forever()
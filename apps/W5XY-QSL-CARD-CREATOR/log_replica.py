@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Log4OM Read Replica
+A local, read-optimised snapshot of the Log4OM database for page loads.
+
+- The snapshot is taken with SQLite's online backup API from a read-only
+  connection whenever the (mtime, size) of the source file or its -wal file
+  changes, so readers never touch the file Log4OM and Syncthing write to.
+  The -wal file matters because writes through web_app put the database in
+  WAL mode, and commits stay there until a checkpoint.
+- Indexes the web views need (callsign, qsodate) are built on the copy,
+  which is then swapped in with an atomic rename. Connections still reading
+  the previous copy keep its (unlinked) inode until they are returned.
+- The copy is never modified after the rename, so it is opened with
+  immutable=1 and served from a small pool of shared read-only connections
+  without any process-wide lock.
+- The source version is recorded inside the copy; other workers and
+  restarts adopt an up-to-date copy instead of taking their own.
+
+Run "python log_replica.py <Log4OM db.SQLite>" to time a refresh and reads.
+"""
+
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+LOG_REPLICA_PATH = os.environ.get('LOG_REPLICA_PATH',
+                                  os.path.join(tempfile.gettempdir(), 'qsl-log-replica.sqlite'))
+LOG_REPLICA_POOL_SIZE = int(os.environ.get('LOG_REPLICA_POOL_SIZE', '4'))
+# Seconds between stat() calls on the source
+LOG_REPLICA_CHECK_SECONDS = float(os.environ.get('LOG_REPLICA_CHECK_SECONDS', '1'))
+
+# Built on the copy only; the Log4OM file itself is never altered
+REPLICA_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS ix_replica_log_callsign ON Log (callsign COLLATE NOCASE)",
+    "CREATE INDEX IF NOT EXISTS ix_replica_log_qsodate ON Log (qsodate, qsoid)",
+)
+
+
+def source_version(path):
+    """(path, mtime_ns, size, wal_mtime_ns, wal_size) of a database; changes with every commit."""
+    st = os.stat(path)
+    try:
+        wal = os.stat(f"{path}-wal")
+        wal_mtime_ns, wal_size = wal.st_mtime_ns, wal.st_size
+    except FileNotFoundError:
+        wal_mtime_ns, wal_size = 0, 0
+    return os.path.abspath(path), st.st_mtime_ns, st.st_size, wal_mtime_ns, wal_size
+
+
+class LogReplica:
+    """Snapshot of source_path at replica_path with a pool of read-only connections."""
+
+    def __init__(self, source_path, replica_path=LOG_REPLICA_PATH, pool_size=LOG_REPLICA_POOL_SIZE,
+                 check_seconds=LOG_REPLICA_CHECK_SECONDS):
+        self.source_path = source_path
+        self.replica_path = replica_path
+        self.check_seconds = check_seconds
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._version = None      # source version the current copy was taken from
+        self._generation = 0      # bumped on every swap; pooled connections of older ones are closed
+        self._checked_at = None
+        self._refresh_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Refresh
+    # ------------------------------------------------------------------
+
+    def _recorded_version(self, path):
+        try:
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                row = conn.execute(
+                    "SELECT path, mtime_ns, size, wal_mtime_ns, wal_size FROM replica_source").fetchone()
+            finally:
+                conn.close()
+            return tuple(row) if row else None
+        except sqlite3.Error:
+            return None
+
+    def _copy(self, version):
+        """Back the source up into a temp file next to the replica, index it and rename it into place."""
+        directory = os.path.dirname(os.path.abspath(self.replica_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            source = sqlite3.connect(f"file:{self.source_path}?mode=ro", uri=True, timeout=5.0)
+            target = sqlite3.connect(tmp)
+            try:
+                source.backup(target)
+                for ddl in REPLICA_INDEXES:
+                    target.execute(ddl)
+                target.execute("CREATE TABLE replica_source (path TEXT, mtime_ns INTEGER, size INTEGER,"
+                               " wal_mtime_ns INTEGER, wal_size INTEGER)")
+                target.execute("INSERT INTO replica_source VALUES (?, ?, ?, ?, ?)", version)
+                target.commit()
+                target.execute("ANALYZE")
+                target.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                target.close()
+                source.close()
+            os.replace(tmp, self.replica_path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def refresh(self, force=False):
+        """Bring the copy up to date with the source; returns True when a new copy was swapped in."""
+        if not os.path.exists(self.source_path):
+            raise sqlite3.OperationalError(f"Database file not found: {self.source_path}")
+        version = source_version(self.source_path)
+        if version == self._version and not force:
+            return False
+        with self._refresh_lock:
+            if version == self._version and not force:
+                return False
+            # Another worker (or an earlier run) may already hold this version
+            if force or self._recorded_version(self.replica_path) != version:
+                started = time.perf_counter()
+                self._copy(version)
+                print(f"Log replica refreshed in {time.perf_counter() - started:.2f}s")
+            self._version = version
+            self._generation += 1
+            self._checked_at = time.monotonic()
+            return True
+
+    def current_version(self):
+        """source_version() of the database behind the snapshot readers get now (refreshing if due)."""
+        self._maybe_refresh()
+        return self._version
+
+    def mark_stale(self):
+        """Re-check the source on the next read (call after writing through the guarded path)."""
+        self._checked_at = None
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if (self._version is not None and self._checked_at is not None
+                and now - self._checked_at < self.check_seconds):
+            return
+        if self._version is None:
+            self.refresh()  # nothing to serve yet, so wait for the first copy
+            return
+        self._checked_at = now
+        # Only one thread copies; the rest keep reading the current snapshot meanwhile
+        if self._refresh_lock.locked():
+            return
+        try:
+            self.refresh()
+        except (OSError, sqlite3.Error) as e:
+            print(f"Log replica refresh failed, serving previous snapshot: {e}")
+
+    # ------------------------------------------------------------------
+    # Connections
+    # ------------------------------------------------------------------
+
+    def _connect(self):
+        conn = sqlite3.connect(f"file:{self.replica_path}?mode=ro&immutable=1", uri=True,
+                               check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """A pooled read-only connection to the current snapshot."""
+        self._maybe_refresh()
+        generation = self._generation
+        conn = None
+        while conn is None:
+            try:
+                pooled_generation, pooled = self._pool.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+                break
+            if pooled_generation == generation:
+                conn = pooled
+            else:
+                pooled.close()
+        try:
+            yield conn
+        finally:
+            if generation != self._generation:
+                conn.close()
+            else:
+                try:
+                    self._pool.put_nowait((generation, conn))
+                except queue.Full:
+                    conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait()[1].close()
+            except queue.Empty:
+                return
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) < 2:
+        sys.exit("usage: python log_replica.py <Log4OM db.SQLite>")
+    replica = LogReplica(sys.argv[1], os.path.join(tempfile.mkdtemp(prefix='log-replica-'), 'replica.sqlite'))
+    start = time.perf_counter()
+    replica.refresh(force=True)
+    print(f"snapshot + indexes: {time.perf_counter() - start:.2f}s")
+    query = "SELECT qsoid FROM Log ORDER BY qsodate DESC, qsoid DESC LIMIT 100"
+    for label, connect in (('direct', lambda: sqlite3.connect(f"file:{sys.argv[1]}?mode=ro", uri=True)),
+                           ('replica', None)):
+        start = time.perf_counter()
+        for _ in range(50):
+            if connect:
+                conn = connect()
+                conn.execute(query).fetchall()
+                conn.close()
+            else:
+                with replica.connection() as conn:
+                    conn.execute(query).fetchall()
+        print(f"{label:8} latest-100 query: {(time.perf_counter() - start) / 50 * 1000:.2f} ms")
+    replica.close()
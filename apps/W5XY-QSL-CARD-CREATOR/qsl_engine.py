@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+QSL Card Engine
+Renders QSL cards onto the PDF template, one card or hundreds at a time.
+
+- The template PDF is parsed once per (path, modification time) and its first
+  page is reused for every card; PyPDF2 copies the page dictionary on
+  add_page, so adding an overlay never touches the cached page.
+- Each overlay is attached as a form XObject drawn after the template's own
+  content, so neither content stream is re-parsed per card (merge_page does
+  that, and it dominated the old cost).
+- Font names are resolved once at import instead of probing setFont per line.
+- A batch draws all of its overlays on one multi-page ReportLab canvas, and
+  large batches are split into chunks rendered in a process pool. Pool
+  workers start with only this module imported, not the web app.
+- The form XObject is built from PyPDF2 internals (stream._data,
+  writer._add_object), so the requirements pin PyPDF2 to 3.0.x.
+- Output is either one PDF per QSO or a single merged multi-page print sheet.
+
+Run "python qsl_engine.py <template.pdf> [count]" to time a batch.
+"""
+
+import os
+import re
+import sys
+import threading
+import types
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfgen import canvas
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import (ArrayObject, DecodedStreamObject, DictionaryObject, EncodedStreamObject,
+                            NameObject)
+
+# Worker processes for large batches (0 or 1 renders everything in-process)
+QSL_RENDER_WORKERS = int(os.environ.get('QSL_RENDER_WORKERS', str(min(4, os.cpu_count() or 1))))
+# Batches up to this size skip the pool entirely
+QSL_INLINE_MAX = int(os.environ.get('QSL_INLINE_MAX', '16'))
+# Cards per pool task
+QSL_CHUNK_SIZE = int(os.environ.get('QSL_CHUNK_SIZE', '50'))
+
+Card = namedtuple('Card', ['callsign', 'date', 'freq', 'mode', 'rst', 'qsltype'])
+
+# ============================================================================
+# Layout - professionally tuned coordinates (points)
+# ============================================================================
+
+BOX_LEFT = 30.445
+BOX_RIGHT = 138.395
+BOX_TOP = 167.92
+BOX_HEIGHT = 55
+BOX_BOTTOM = BOX_TOP - BOX_HEIGHT
+X_CENTER = 84.4
+
+# Gaps between successive text lines, top to bottom
+_TOP_PADDING = 10
+_LINE_GAPS = (20, 16, 13, 18, 12, 12)  # call, QSO TIME, date, MHz, Mode, RST
+
+
+def _line_positions():
+    y = BOX_TOP - _TOP_PADDING
+    positions = [y]
+    for gap in _LINE_GAPS:
+        y -= gap
+        positions.append(y)
+    return tuple(positions)
+
+
+LINE_Y = _line_positions()
+QSL_TYPES = ('QSL', 'PSE', 'TNX')
+QSL_GAP = 32
+QSL_Y = BOX_BOTTOM - 65
+RULE_Y = BOX_BOTTOM - 52
+
+# ============================================================================
+# Fonts - resolved once
+# ============================================================================
+
+_FONT_MAP = {
+    'Arial': 'Helvetica',
+    'Arial-Bold': 'Helvetica-Bold',
+    'Arial Black': 'Helvetica-Bold',
+    'Helvetica': 'Helvetica',
+    'Helvetica-Bold': 'Helvetica-Bold',
+    'Sans-Serif': 'Helvetica',
+    'DejaVu Sans': 'Helvetica',
+    'Liberation Sans': 'Helvetica'
+}
+_FONT_FALLBACKS = ('Helvetica', 'Helvetica-Bold', 'Times-Roman', 'Courier', 'Symbol')
+
+
+@lru_cache(maxsize=None)
+def resolve_font(name):
+    """Map a requested font to one ReportLab can draw, falling back to the base-14 fonts."""
+    for candidate in (_FONT_MAP.get(name, 'Helvetica'),) + _FONT_FALLBACKS:
+        try:
+            pdfmetrics.getFont(candidate)
+            return candidate
+        except Exception:
+            continue
+    return 'Helvetica'
+
+
+REGULAR_FONT = resolve_font('Arial')
+BOLD_FONT = resolve_font('Arial-Bold')
+
+# ============================================================================
+# Card content
+# ============================================================================
+
+_DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M')
+
+
+def format_qso_datetime(date):
+    """'2024-06-22 18:05:00 UTC' -> '06-22-2024 • 18:05 UTC'; unparseable values get ' UTC' appended."""
+    try:
+        date_clean = str(date).strip().replace(" UTC", "")
+        for fmt in _DATE_FORMATS:
+            try:
+                dt = datetime.strptime(date_clean, fmt)
+            except ValueError:
+                continue
+            return f"{dt.strftime('%m-%d-%Y')} • {dt.strftime('%H:%M')} UTC"
+        return f"{date_clean} UTC"
+    except Exception:
+        return str(date)
+
+
+def draw_card(can, card):
+    """Draw one card's overlay on the current canvas page."""
+    lines = (
+        (REGULAR_FONT, 10, 'Confirming QSL With'),
+        (BOLD_FONT, 22, (card.callsign or '').upper()),
+        (REGULAR_FONT, 10, 'QSO TIME'),
+        (BOLD_FONT, 10, format_qso_datetime(card.date)),
+    )
+    for (font, size, text), y in zip(lines, LINE_Y):
+        can.setFont(font, size)
+        can.drawCentredString(X_CENTER, y, text)
+
+    # Right-aligned label, bold value, centred as a pair
+    for (label, value), y in zip((('MHz:', card.freq), ('Mode:', card.mode), ('RST:', card.rst)), LINE_Y[4:]):
+        value = str(value)
+        label_width = can.stringWidth(label, REGULAR_FONT, 10)
+        value_width = can.stringWidth(value, BOLD_FONT, 10)
+        label_x = X_CENTER - (label_width + 6 + value_width) / 2 + label_width
+        can.setFont(REGULAR_FONT, 10)
+        can.drawRightString(label_x, y, label)
+        can.setFont(BOLD_FONT, 10)
+        can.drawString(label_x + 6, y, value)
+
+    # Rule and QSL types at the bottom of the white box
+    can.setStrokeColorRGB(162/255, 32/255, 53/255)
+    can.setLineWidth(2)
+    can.line(BOX_LEFT + 5, RULE_Y, BOX_RIGHT - 5, RULE_Y)
+    can.setFont(REGULAR_FONT, 10)
+    for i, t in enumerate(QSL_TYPES):
+        x = X_CENTER + (i - 1) * QSL_GAP
+        if t == card.qsltype:
+            text_width = can.stringWidth(t, REGULAR_FONT, 10)
+            can.setFillColorRGB(1, 1, 0)  # Yellow highlight
+            can.rect(x - text_width/2 - 2, QSL_Y - 2, text_width + 4, 12, stroke=0, fill=1)
+        can.setFillColorRGB(0, 0, 0)
+        can.drawCentredString(x, QSL_Y, t)
+
+
+def render_overlays(cards, width, height):
+    """One PDF with an overlay page per card."""
+    packet = BytesIO()
+    can = canvas.Canvas(packet, pagesize=(width, height))
+    for card in cards:
+        draw_card(can, card)
+        can.showPage()
+    can.save()
+    return packet.getvalue()
+
+
+def card_filename(card):
+    """QSL_<CALLSIGN>_<YYYYMMDD>_<HHMM>.pdf, safe for any file system."""
+    digits = re.sub(r'\D', '', str(card.date or ''))
+    stamp = f"{digits[:8]}_{digits[8:12]}" if len(digits) >= 12 else (digits[:8] or 'nodate')
+    call = re.sub(r'[^A-Z0-9]+', '-', (card.callsign or 'UNKNOWN').upper()).strip('-') or 'UNKNOWN'
+    return f"QSL_{call}_{stamp}.pdf"
+
+# ============================================================================
+# Template cache
+# ============================================================================
+
+
+class CardTemplate:
+    """Parsed template: its first page and dimensions."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.page = PdfReader(BytesIO(f.read())).pages[0]
+        self.width = float(self.page.mediabox.width)
+        self.height = float(self.page.mediabox.height)
+        # PdfReader resolves objects lazily; one page copy at a time
+        self._lock = threading.Lock()
+
+    def add_card(self, writer, overlay_page):
+        """Append a copy of the template page to writer with overlay_page drawn on top."""
+        with self._lock:
+            page = writer.add_page(self.page)
+        form = _overlay_form(writer, overlay_page)
+        if form is None:
+            page.merge_page(overlay_page)
+        else:
+            _stamp(writer, page, form)
+        return page
+
+
+_OVERLAY_NAME = NameObject('/QSLOverlay')
+
+
+def _stream(writer, data):
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    return writer._add_object(stream)
+
+
+def _overlay_form(writer, overlay_page):
+    """overlay_page's content as a form XObject in writer, without decoding it.
+
+    Returns None for layouts ReportLab does not produce (several content
+    streams), which fall back to merge_page.
+    """
+    contents = overlay_page.get('/Contents')
+    if contents is None:
+        return None
+    stream = contents.get_object()
+    if not isinstance(stream, (EncodedStreamObject, DecodedStreamObject)):
+        return None
+    form = EncodedStreamObject() if isinstance(stream, EncodedStreamObject) else DecodedStreamObject()
+    form._data = stream._data
+    for key in ('/Filter', '/DecodeParms'):
+        if key in stream:
+            form[NameObject(key)] = stream[key].clone(writer)
+    form[NameObject('/Type')] = NameObject('/XObject')
+    form[NameObject('/Subtype')] = NameObject('/Form')
+    form[NameObject('/BBox')] = ArrayObject(overlay_page.mediabox)
+    if '/Resources' in overlay_page:
+        form[NameObject('/Resources')] = overlay_page['/Resources'].get_object().clone(writer)
+    return writer._add_object(form)
+
+
+def _stamp(writer, page, form):
+    """Wrap page's content in q/Q and draw form after it."""
+    existing = []
+    if '/Contents' in page:
+        contents = page['/Contents'].get_object()
+        existing = list(contents) if isinstance(contents, ArrayObject) else [page.raw_get('/Contents')]
+    page[NameObject('/Contents')] = ArrayObject(
+        [_stream(writer, b"q\n")] + existing + [_stream(writer, b"\nQ\nq " + _OVERLAY_NAME.encode() + b" Do Q\n")])
+    # Fresh resource dictionaries so the shared template ones are left alone
+    resources = page.get('/Resources')
+    resources = DictionaryObject(resources.get_object()) if resources is not None else DictionaryObject()
+    xobjects = resources.get('/XObject')
+    xobjects = DictionaryObject(xobjects.get_object()) if xobjects is not None else DictionaryObject()
+    xobjects[_OVERLAY_NAME] = form
+    resources[NameObject('/XObject')] = xobjects
+    page[NameObject('/Resources')] = resources
+
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def load_template(path):
+    """Cached CardTemplate for path, re-read when the file changes."""
+    path = os.path.abspath(path)
+    key = (path, os.stat(path).st_mtime_ns)
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is None:
+            template = CardTemplate(path)
+            for stale in [k for k in _templates if k[0] == path]:
+                del _templates[stale]
+            _templates[key] = template
+        return template
+
+# ============================================================================
+# Rendering (in-process or in pool workers)
+# ============================================================================
+
+
+def _pdf_bytes(writer):
+    out = BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def _write_file(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _render_chunk(template_path, cards, output_dir=None, names=None):
+    """Render cards; returns merged PDF bytes, or the written paths when output_dir is set."""
+    template = load_template(template_path)
+    overlays = PdfReader(BytesIO(render_overlays(cards, template.width, template.height))).pages
+    if output_dir is None:
+        writer = PdfWriter()
+        for overlay in overlays:
+            template.add_card(writer, overlay)
+        return _pdf_bytes(writer)
+    paths = []
+    for overlay, name in zip(overlays, names):
+        writer = PdfWriter()
+        template.add_card(writer, overlay)
+        path = os.path.join(output_dir, name)
+        _write_file(path, _pdf_bytes(writer))
+        paths.append(path)
+    return paths
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Stand-in __main__ with no file, so spawned workers have no main script to re-run
+_WORKER_MAIN = types.ModuleType('__mp_main__')
+
+
+def _get_pool(workers):
+    """Shared worker pool; spawn keeps workers independent of the web server's threads."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+@contextmanager
+def _bare_main():
+    """Hide the launching script from spawn while workers may start (they start inside submit).
+
+    Run as "python web_app.py", every worker would otherwise import web_app.py as
+    __mp_main__ and repeat its module-level setup (Flask app, log replica,
+    HamQTH cache) just to call _render_chunk.
+    """
+    with _pool_lock:
+        main = sys.modules['__main__']
+        sys.modules['__main__'] = _WORKER_MAIN
+        try:
+            yield
+        finally:
+            sys.modules['__main__'] = main
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+class CardEngine:
+    """Generate QSL cards from one template."""
+
+    def __init__(self, template_path, workers=QSL_RENDER_WORKERS):
+        self.template_path = os.path.abspath(template_path)
+        self.workers = workers
+        load_template(self.template_path)  # fail fast on a missing/broken template
+
+    def _chunks(self, cards, names=None):
+        size = max(1, min(QSL_CHUNK_SIZE, -(-len(cards) // max(1, self.workers))))
+        for start in range(0, len(cards), size):
+            yield cards[start:start + size], (names[start:start + size] if names else None)
+
+    def _run(self, cards, output_dir=None, names=None):
+        """Chunk results in order; pooled when the batch is large enough to pay for it."""
+        if self.workers > 1 and len(cards) > QSL_INLINE_MAX:
+            try:
+                pool = _get_pool(self.workers)
+                with _bare_main():
+                    futures = [pool.submit(_render_chunk, self.template_path, chunk, output_dir, chunk_names)
+                               for chunk, chunk_names in self._chunks(cards, names)]
+                return [f.result() for f in futures]
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    _reset_pool()
+                print(f"QSL render pool unavailable, rendering in-process: {e}", file=sys.stderr)
+        return [_render_chunk(self.template_path, chunk, output_dir, chunk_names)
+                for chunk, chunk_names in self._chunks(cards, names)]
+
+    def card_pdf(self, card):
+        """PDF bytes for a single card."""
+        return _render_chunk(self.template_path, [card])
+
+    def write_card(self, card, output_path):
+        _write_file(output_path, self.card_pdf(card))
+        return output_path
+
+    def write_cards(self, cards, output_dir):
+        """One PDF per card in output_dir; returns the paths in input order."""
+        cards = list(cards)
+        os.makedirs(output_dir, exist_ok=True)
+        names, seen = [], {}
+        for card in cards:
+            name = card_filename(card)
+            seen[name] = seen.get(name, 0) + 1
+            if seen[name] > 1:
+                stem, ext = os.path.splitext(name)
+                name = f"{stem}_{seen[name]}{ext}"
+            names.append(name)
+        return [path for paths in self._run(cards, output_dir, names) for path in paths]
+
+    def merged_pdf(self, cards):
+        """One multi-page PDF (a print sheet) with a page per card."""
+        cards = list(cards)
+        chunks = self._run(cards)
+        if len(chunks) == 1:
+            return chunks[0]
+        writer = PdfWriter()
+        for data in chunks:
+            writer.append(PdfReader(BytesIO(data)))
+        return _pdf_bytes(writer)
+
+
+if __name__ == '__main__':
+    import tempfile
+    import time
+
+    if len(sys.argv) < 2:
+        sys.exit("usage: python qsl_engine.py <template.pdf> [count]")
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    sample = [Card(f"K{i % 10}ABC", f"2024-06-22 {i % 24:02d}:{i % 60:02d}:00 UTC", '14.074', 'FT8', '-10', 'TNX')
+              for i in range(count)]
+    engine = CardEngine(sys.argv[1])
+    start = time.perf_counter()
+    sheet = engine.merged_pdf(sample)
+    print(f"merged sheet: {count} cards, {len(sheet) // 1024} KiB in {time.perf_counter() - start:.2f}s")
+    with tempfile.TemporaryDirectory() as out_dir:
+        start = time.perf_counter()
+        engine.write_cards(sample, out_dir)
+        print(f"individual PDFs: {count} files in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+QSL Card Preview
+PNG previews for the create page, rendered without building a PDF per request.
+
+- The template is rasterized once per file content (in-process with
+  pypdfium2 when installed, otherwise one pdftoppm call) and the raster is
+  kept in memory and next to the previews on disk.
+- Each preview copies that raster and draws the card with Pillow through a
+  small canvas adapter, so qsl_engine.draw_card lays it out exactly as on
+  the printed PDF.
+- PNGs are cached on disk under a hash of (template content, callsign, date,
+  freq, mode, rst, qsltype, width) and evicted least-recently-used once the
+  directory exceeds QSL_PREVIEW_CACHE_MB.
+
+Run "python qsl_preview.py <template.pdf>" to time cold and cached previews.
+"""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from io import BytesIO
+
+from PIL import Image, ImageDraw, ImageFont
+from reportlab.pdfbase import pdfmetrics
+
+import qsl_engine
+
+try:
+    import pypdfium2
+    PDFIUM_AVAILABLE = True
+except ImportError:
+    PDFIUM_AVAILABLE = False
+
+QSL_PREVIEW_CACHE_DIR = os.environ.get('QSL_PREVIEW_CACHE_DIR',
+                                       os.path.join(tempfile.gettempdir(), 'qsl-preview-cache'))
+QSL_PREVIEW_CACHE_MB = float(os.environ.get('QSL_PREVIEW_CACHE_MB', '64'))
+QSL_PREVIEW_WIDTH = int(os.environ.get('QSL_PREVIEW_WIDTH', '800'))
+
+# Bump when the drawing changes so old cached PNGs are never served
+RENDER_REVISION = 1
+
+# ============================================================================
+# Template raster
+# ============================================================================
+
+
+@lru_cache(maxsize=8)
+def _file_digest(path, mtime_ns, size):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def template_digest(path):
+    """Content hash of the template, recomputed only when the file changes."""
+    st = os.stat(path)
+    return _file_digest(os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+def _rasterize_pdfium(path, width):
+    pdf = pypdfium2.PdfDocument(path)
+    try:
+        page = pdf[0]
+        return page.render(scale=width / page.get_width()).to_pil().convert('RGB')
+    finally:
+        pdf.close()
+
+
+def _rasterize_poppler(path, width):
+    if not shutil.which('pdftoppm'):
+        return None
+    # Without an output root pdftoppm writes the image to stdout
+    result = subprocess.run(['pdftoppm', '-png', '-singlefile', '-f', '1', '-l', '1',
+                             '-scale-to-x', str(width), '-scale-to-y', '-1', path],
+                            capture_output=True, timeout=30)
+    if result.returncode != 0 or not result.stdout:
+        print(f"pdftoppm failed: {result.stderr.decode(errors='replace')}")
+        return None
+    return Image.open(BytesIO(result.stdout)).convert('RGB')
+
+
+def rasterize_template(path, width):
+    """First page of the template as an RGB image width pixels wide, or None if no rasterizer works."""
+    if PDFIUM_AVAILABLE:
+        try:
+            return _rasterize_pdfium(path, width)
+        except Exception as e:
+            print(f"pdfium could not render template, trying pdftoppm: {e}")
+    return _rasterize_poppler(path, width)
+
+
+def _blank_raster(path, width):
+    template = qsl_engine.load_template(path)
+    return Image.new('RGB', (width, round(width * template.height / template.width)), 'white')
+
+
+_rasters = {}
+_rasters_lock = threading.Lock()
+
+
+def _remove_stale_rasters(cache_dir, keep_prefix):
+    """Delete stored rasters of earlier template versions (PreviewCache does not count them)."""
+    with os.scandir(cache_dir) as it:
+        stale = [entry.path for entry in it
+                 if entry.name.startswith('template-') and entry.name.endswith('.png')
+                 and not entry.name.startswith(keep_prefix)]
+    for stale_path in stale:
+        try:
+            os.unlink(stale_path)
+        except OSError:
+            pass
+
+
+def template_raster(path, width, cache_dir):
+    """(raster, rendered) for (template content, width); persisted in cache_dir across restarts.
+
+    When no rasterizer works the raster is a blank card and rendered is
+    False. That placeholder is never cached, so the real template shows up
+    as soon as rendering succeeds again.
+    """
+    key = (template_digest(path), width)
+    with _rasters_lock:
+        image = _rasters.get(key)
+    if image is not None:
+        return image, True
+    prefix = f"template-{key[0][:32]}-"
+    stored = os.path.join(cache_dir, f"{prefix}{width}.png")
+    try:
+        image = Image.open(stored).convert('RGB')
+    except (OSError, ValueError):
+        image = rasterize_template(path, width)
+        if image is None:
+            return _blank_raster(path, width), False
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            _write_atomic(stored, _png(image))
+            _remove_stale_rasters(cache_dir, prefix)
+        except OSError as e:
+            print(f"Could not store template raster: {e}")
+    with _rasters_lock:
+        # One template in use at a time; drop rasters of older versions
+        for stale in [k for k in _rasters if k[1] == width]:
+            del _rasters[stale]
+        _rasters[key] = image
+    return image, True
+
+# ============================================================================
+# Drawing
+# ============================================================================
+
+# Liberation Sans and Arial share Helvetica's metrics; DejaVu is wider and gets scaled down
+_PIL_FONTS = {
+    'Helvetica': ('LiberationSans-Regular.ttf', 'Arial.ttf', 'arial.ttf', 'DejaVuSans.ttf'),
+    'Helvetica-Bold': ('LiberationSans-Bold.ttf', 'Arial Bold.ttf', 'arialbd.ttf', 'DejaVuSans-Bold.ttf'),
+}
+
+
+_WIDTH_SAMPLE = 'Confirming QSL With QSO TIME 0123456789 ABCDEFGHIJKLMNOPQRSTUVWXYZ abcdefghijklmnopqrstuvwxyz'
+
+
+@lru_cache(maxsize=None)
+def _pil_face(name):
+    """(font file or None for Pillow's default, fake_bold, size factor) standing in for a ReportLab font."""
+    for filename in _PIL_FONTS.get(name, _PIL_FONTS['Helvetica']):
+        try:
+            font = ImageFont.truetype(filename, 100)
+        except OSError:
+            continue
+        fake_bold = False
+        break
+    else:
+        filename, fake_bold = None, name.endswith('Bold')
+        font = _default_font(100)
+    # Substitute fonts run wider than Helvetica; shrink them so text keeps its PDF footprint
+    factor = pdfmetrics.stringWidth(_WIDTH_SAMPLE, name, 100) / font.getlength(_WIDTH_SAMPLE)
+    return filename, fake_bold, min(1.0, factor)
+
+
+def _default_font(size):
+    try:
+        return ImageFont.load_default(size)  # Pillow >= 10.1
+    except TypeError:
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=64)
+def _pil_font(name, size):
+    """(font, fake_bold) for a ReportLab font name at a pixel size."""
+    filename, fake_bold, factor = _pil_face(name)
+    size = max(1, round(size * factor))
+    return (ImageFont.truetype(filename, size) if filename else _default_font(size)), fake_bold
+
+
+class ImageCanvas:
+    """The parts of ReportLab's canvas API that qsl_engine.draw_card uses, drawing on a Pillow image."""
+
+    def __init__(self, image, page_width, page_height):
+        self.draw = ImageDraw.Draw(image)
+        self.scale = image.width / page_width
+        self.page_height = page_height
+        self.fill = (0, 0, 0)
+        self.stroke = (0, 0, 0)
+        self.line_width = 1
+        self.font_name, self.font_size = qsl_engine.REGULAR_FONT, 10
+
+    def _xy(self, x, y):
+        return x * self.scale, (self.page_height - y) * self.scale
+
+    @staticmethod
+    def _rgb(r, g, b):
+        return tuple(round(c * 255) for c in (r, g, b))
+
+    def setFont(self, name, size):
+        self.font_name, self.font_size = name, size
+
+    def stringWidth(self, text, name, size):
+        return pdfmetrics.stringWidth(text, name, size)
+
+    def setFillColorRGB(self, r, g, b):
+        self.fill = self._rgb(r, g, b)
+
+    def setStrokeColorRGB(self, r, g, b):
+        self.stroke = self._rgb(r, g, b)
+
+    def setLineWidth(self, width):
+        self.line_width = width
+
+    def _text(self, x, y, text, anchor):
+        font, fake_bold = _pil_font(self.font_name, max(1, round(self.font_size * self.scale)))
+        stroke = max(1, round(self.scale / 3)) if fake_bold else 0
+        self.draw.text(self._xy(x, y), text, font=font, fill=self.fill, anchor=anchor,
+                       stroke_width=stroke, stroke_fill=self.fill)
+
+    def drawString(self, x, y, text):
+        self._text(x, y, text, 'ls')
+
+    def drawCentredString(self, x, y, text):
+        self._text(x, y, text, 'ms')
+
+    def drawRightString(self, x, y, text):
+        self._text(x, y, text, 'rs')
+
+    def line(self, x1, y1, x2, y2):
+        self.draw.line([self._xy(x1, y1), self._xy(x2, y2)], fill=self.stroke,
+                       width=max(1, round(self.line_width * self.scale)))
+
+    def rect(self, x, y, width, height, stroke=1, fill=0):
+        self.draw.rectangle([self._xy(x, y + height), self._xy(x + width, y)],
+                            fill=self.fill if fill else None, outline=self.stroke if stroke else None)
+
+
+def _png(image):
+    out = BytesIO()
+    image.save(out, 'PNG', compress_level=3)
+    return out.getvalue()
+
+
+def render_preview(template_path, card, width=QSL_PREVIEW_WIDTH, cache_dir=QSL_PREVIEW_CACHE_DIR):
+    """(PNG bytes, rendered) of card drawn on the template raster (uncached).
+
+    rendered is False when the template could not be rasterized and the
+    card was drawn on a blank background.
+    """
+    template = qsl_engine.load_template(template_path)
+    raster, rendered = template_raster(template_path, width, cache_dir)
+    image = raster.copy()
+    qsl_engine.draw_card(ImageCanvas(image, template.width, template.height), card)
+    return _png(image), rendered
+
+# ============================================================================
+# Disk cache
+# ============================================================================
+
+
+def _write_atomic(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class PreviewCache:
+    """Content-addressed PNG files in one directory, LRU-evicted to a byte budget.
+
+    Recency is the file's mtime (touched on every hit), so the order survives
+    restarts and is shared by every process using the directory; each process
+    enforces the budget when it adds files.
+    """
+
+    def __init__(self, directory=QSL_PREVIEW_CACHE_DIR, budget_bytes=int(QSL_PREVIEW_CACHE_MB * 1024 * 1024)):
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+        self._index = None  # key -> size, least recently used first
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.png")
+
+    def _load_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.png') and not entry.name.startswith('template-'):
+                    st = entry.stat()
+                    entries.append((st.st_mtime_ns, entry.name[:-4], st.st_size))
+        self._index = OrderedDict((key, size) for _, key, size in sorted(entries))
+        self._total = sum(self._index.values())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                if self._index is not None and key in self._index:
+                    self._total -= self._index.pop(key)
+            return None
+        with self._lock:
+            if self._index is not None:
+                if key not in self._index:
+                    self._index[key] = len(data)
+                    self._total += len(data)
+                self._index.move_to_end(key)
+        return data
+
+    def put(self, key, data):
+        with self._lock:
+            if self._index is None:
+                self._load_index()
+            _write_atomic(self._path(key), data)
+            self._total += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            while self._total > self.budget_bytes and len(self._index) > 1:
+                old, size = self._index.popitem(last=False)
+                self._total -= size
+                try:
+                    os.unlink(self._path(old))
+                except OSError:
+                    pass
+
+    def clear(self):
+        with self._lock:
+            if self._index is None:
+                self._load_index()
+            for key in self._index:
+                try:
+                    os.unlink(self._path(key))
+                except OSError:
+                    pass
+            self._index.clear()
+            self._total = 0
+
+
+def preview_key(template_path, card, width=QSL_PREVIEW_WIDTH):
+    parts = (RENDER_REVISION, template_digest(template_path), width) + tuple(str(v) for v in card)
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+_cache = PreviewCache()
+
+
+def preview_png(template_path, card, width=QSL_PREVIEW_WIDTH, cache=None):
+    """PNG bytes of the card preview, from the cache when this exact card was rendered before."""
+    cache = cache or _cache
+    key = preview_key(template_path, card, width)
+    data = cache.get(key)
+    if data is None:
+        data, rendered = render_preview(template_path, card, width, cache.directory)
+        # Previews on a blank stand-in background would otherwise outlive the rasterizer failure
+        if rendered:
+            try:
+                cache.put(key, data)
+            except OSError as e:
+                print(f"Could not cache preview: {e}")
+    return data
+
+
+if __name__ == '__main__':
+    import time
+
+    if len(sys.argv) < 2:
+        sys.exit("usage: python qsl_preview.py <template.pdf>")
+    scratch = PreviewCache(tempfile.mkdtemp(prefix='qsl-preview-'))
+    card = qsl_engine.Card('K1ABC', '2024-06-22 18:05:00 UTC', '14.074', 'FT8', '-10', 'TNX')
+    for label in ('first (rasterizes template)', 'cached', 'new card (warm template)'):
+        if label.startswith('new'):
+            card = card._replace(callsign='W1AW')
+        start = time.perf_counter()
+        data = preview_png(sys.argv[1], card, cache=scratch)
+        print(f"{label:28} {(time.perf_counter() - start) * 1000:8.1f} ms  {len(data) // 1024} KiB")
+    shutil.rmtree(scratch.directory, ignore_errors=True)
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+QSO Repository
+One query and one row-mapping path for every view of the Log4OM Log table.
+
+- Filtering (callsign prefix, date range, band, mode, QSL sent/received) and
+  pagination happen in SQL. The QSL state filter calls qsl_flag, a SQL
+  function backed by the same cached parser map_row uses.
+- map_row turns a row into the dict the templates and JSON API use. The QSL
+  card entry parsed out of qsoconfirmations is cached per
+  (qsoid, hash of the JSON), so paging back and forth re-parses nothing.
+- iter_qsos reads the ordered qsoids once and the rows in batches, taking
+  the database lock per batch only, which lets the JSON API stream any
+  number of rows.
+
+Run "python qso_repository.py <Log4OM db.SQLite>" to time a page and a full scan.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+
+QSO_PAGE_SIZE = int(os.environ.get('QSO_PAGE_SIZE', '100'))
+QSO_PAGE_MAX = int(os.environ.get('QSO_PAGE_MAX', '1000'))
+# Rows fetched per lock acquisition while streaming
+QSO_STREAM_BATCH = int(os.environ.get('QSO_STREAM_BATCH', '500'))
+QSO_CONFIRMATION_CACHE_SIZE = int(os.environ.get('QSO_CONFIRMATION_CACHE_SIZE', '100000'))
+
+COLUMNS = ('qsoid', 'callsign', 'qsodate', 'freq', 'band', 'mode', 'rstsent', 'rstrcvd', 'email',
+           'qsoconfirmations')
+_SELECT = f"SELECT {', '.join(COLUMNS)} FROM Log"
+_ORDER = "ORDER BY qsodate DESC, qsoid DESC"
+
+QSL_STATES = ('sent', 'not_sent', 'received', 'not_received')
+
+QSOFilter = namedtuple('QSOFilter', ['callsign', 'date_from', 'date_to', 'band', 'mode', 'qsl'],
+                       defaults=(None,) * 6)
+
+
+class QSOPage(namedtuple('QSOPage', ['items', 'page', 'per_page', 'total'])):
+    """One page of mapped QSOs."""
+
+    @property
+    def pages(self):
+        return max(1, -(-self.total // self.per_page))
+
+    @property
+    def first_index(self):
+        return (self.page - 1) * self.per_page + 1 if self.items else 0
+
+    @property
+    def last_index(self):
+        return (self.page - 1) * self.per_page + len(self.items)
+
+# ============================================================================
+# Row mapping
+# ============================================================================
+
+
+def split_qso_datetime(value):
+    """Log4OM qsodate -> ('YYYY-MM-DD', 'HH:MM:SS'); time is '' when the value has none."""
+    if not value:
+        return '', ''
+    if not isinstance(value, str):
+        return str(value), ''
+    clean = value.replace('Z', '').replace('T', ' ').strip()
+    date_part, _, time_part = clean.partition(' ')
+    if '/' in date_part:
+        try:
+            date_part = datetime.strptime(date_part, '%m/%d/%Y').strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+    return date_part, time_part.strip().split('.')[0]
+
+
+_confirmations = OrderedDict()
+_confirmations_lock = threading.Lock()
+
+
+def _parse_qsl_state(raw):
+    """('Yes'|'No', 'Yes'|'No') for the QSL card entry; eQSL/LoTW and 'Requested' count as No."""
+    try:
+        entries = json.loads(raw)
+    except ValueError:
+        return 'No', 'No'
+    if isinstance(entries, list):
+        for entry in entries:
+            if isinstance(entry, dict) and entry.get('CT') == 'QSL':
+                return ('Yes' if entry.get('S') == 'Yes' else 'No',
+                        'Yes' if entry.get('R') == 'Yes' else 'No')
+    return 'No', 'No'
+
+
+def qsl_state(qsoid, raw):
+    """Cached _parse_qsl_state, keyed by (qsoid, hash of the confirmations JSON)."""
+    if not raw:
+        return 'No', 'No'
+    key = (qsoid, hash(raw))
+    with _confirmations_lock:
+        state = _confirmations.get(key)
+        if state is not None:
+            _confirmations.move_to_end(key)
+            return state
+    state = _parse_qsl_state(raw)
+    with _confirmations_lock:
+        _confirmations[key] = state
+        while len(_confirmations) > QSO_CONFIRMATION_CACHE_SIZE:
+            _confirmations.popitem(last=False)
+    return state
+
+
+def map_row(row, time_suffix=' UTC'):
+    """Log row (COLUMNS order) -> QSO dict for templates and the JSON API."""
+    qsoid, callsign, qsodate, freq, band, mode, rstsent, rstrcvd, email, confirmations = row
+    date_part, time_part = split_qso_datetime(qsodate)
+    qsl_sent, qsl_received = qsl_state(qsoid, confirmations)
+    return {
+        'qso_id': qsoid,
+        'callsign': callsign,
+        'date': date_part,
+        'time': f"{time_part}{time_suffix}" if time_part else '',
+        'frequency': str(freq) if freq else '',
+        'band': band or '',
+        'mode': mode or '',
+        'rst_sent': rstsent or '59',
+        'rst_received': rstrcvd or '59',
+        'email': email or '',
+        'qsl_sent': qsl_sent,
+        'qsl_received': qsl_received,
+        'qso_datetime': qsodate,  # full datetime for unique identification
+    }
+
+# ============================================================================
+# Filters
+# ============================================================================
+
+def _sql_qsl_flag(qsoid, raw, field):
+    """SQL function qsl_flag(qsoid, qsoconfirmations, 'S'|'R') -> 1 when that QSL card flag is Yes."""
+    sent, received = qsl_state(qsoid, raw)
+    return int((sent if field == 'S' else received) == 'Yes')
+
+
+# Evaluated through the same cached parser as map_row (registered per connection in _fetch)
+_QSL_CLAUSES = {
+    'sent': "qsl_flag(qsoid, qsoconfirmations, 'S') = 1",
+    'not_sent': "qsl_flag(qsoid, qsoconfirmations, 'S') = 0",
+    'received': "qsl_flag(qsoid, qsoconfirmations, 'R') = 1",
+    'not_received': "qsl_flag(qsoid, qsoconfirmations, 'R') = 0",
+}
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value.strip(), '%Y-%m-%d')
+    except (AttributeError, ValueError):
+        return None
+
+
+def filter_from_args(args):
+    """QSOFilter from request args (callsign, from, to, band, mode, qsl); unknown values are dropped."""
+    def text(name):
+        value = (args.get(name) or '').strip()
+        return value or None
+
+    qsl = text('qsl')
+    return QSOFilter(
+        callsign=(text('callsign') or '').upper() or None,
+        date_from=_parse_date(args.get('from')),
+        date_to=_parse_date(args.get('to')),
+        band=text('band'),
+        mode=text('mode'),
+        qsl=qsl if qsl in QSL_STATES else None,
+    )
+
+
+def where_clause(filters):
+    """(SQL starting with ' WHERE' or '', params) for a QSOFilter."""
+    clauses, params = [], []
+    if filters.callsign:
+        escaped = filters.callsign.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        clauses.append("callsign LIKE ? ESCAPE '\\'")
+        params.append(f"{escaped}%")
+    if filters.date_from:
+        clauses.append("qsodate >= ?")
+        params.append(filters.date_from.strftime('%Y-%m-%d'))
+    if filters.date_to:
+        clauses.append("qsodate < ?")
+        params.append((filters.date_to + timedelta(days=1)).strftime('%Y-%m-%d'))
+    if filters.band:
+        clauses.append("band = ? COLLATE NOCASE")
+        params.append(filters.band)
+    if filters.mode:
+        clauses.append("mode = ? COLLATE NOCASE")
+        params.append(filters.mode)
+    if filters.qsl:
+        clauses.append(_QSL_CLAUSES[filters.qsl])
+    return (f" WHERE {' AND '.join(clauses)}" if clauses else ''), params
+
+# ============================================================================
+# Repository
+# ============================================================================
+
+
+class QSORepository:
+    """Queries against the Log table through a SafeDatabaseAccess.
+
+    Sorting whole rows drags every qsoconfirmations blob through the sort,
+    so the ordered page is selected as bare qsoids first and the rows are
+    then read by primary key.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+
+    def _fetch(self, sql, params=()):
+        with self.db.get_connection(read_only=True) as conn:
+            conn.create_function('qsl_flag', 3, _sql_qsl_flag, deterministic=True)
+            return conn.execute(sql, params).fetchall()
+
+    def _rows(self, ids):
+        """Rows for ids, in the order given (ids deleted meanwhile are skipped)."""
+        if not ids:
+            return []
+        found = {row[0]: row for row in self._fetch(
+            f"{_SELECT} WHERE qsoid IN ({', '.join('?' * len(ids))})", ids)}
+        return [found[i] for i in ids if i in found]
+
+    def _cached(self, key, loader):
+        """loader() memoised until the data served by self.db changes."""
+        try:
+            key = (key, self.db.data_version())
+        except OSError:
+            return loader()
+        with self._cache_lock:
+            if key in self._cache:
+                return self._cache[key]
+        value = loader()
+        with self._cache_lock:
+            if len(self._cache) >= 256:
+                self._cache.clear()
+            self._cache[key] = value
+        return value
+
+    def count(self, filters=QSOFilter()):
+        """Matching rows; cached per data version, so paging re-counts nothing."""
+        where, params = where_clause(filters)
+        return self._cached(('count', filters),
+                            lambda: self._fetch(f"SELECT COUNT(*) FROM Log{where}", params)[0][0])
+
+    def page(self, filters=QSOFilter(), page=1, per_page=QSO_PAGE_SIZE):
+        """QSOPage of mapped rows, newest first; page is clamped to the available range."""
+        per_page = min(max(1, per_page), QSO_PAGE_MAX)
+        total = self.count(filters)
+        page = min(max(1, page), max(1, -(-total // per_page)))
+        where, params = where_clause(filters)
+        ids = [r[0] for r in self._fetch(f"SELECT qsoid FROM Log{where} {_ORDER} LIMIT ? OFFSET ?",
+                                         params + [per_page, (page - 1) * per_page])]
+        return QSOPage([map_row(r) for r in self._rows(ids)], page, per_page, total)
+
+    def iter_qsos(self, filters=QSOFilter(), limit=None, time_suffix=' UTC', batch=QSO_STREAM_BATCH):
+        """Mapped rows newest first; the ordered ids are read once, rows in batches (lock held per batch)."""
+        where, params = where_clause(filters)
+        sql = f"SELECT qsoid FROM Log{where} {_ORDER}"
+        if limit is not None:
+            sql, params = f"{sql} LIMIT ?", params + [limit]
+        ids = [r[0] for r in self._fetch(sql, params)]
+        for start in range(0, len(ids), batch):
+            for row in self._rows(ids[start:start + batch]):
+                yield map_row(row, time_suffix)
+
+    def by_callsign(self, callsign):
+        """Every QSO with callsign (exact, case-insensitive), newest first; times without ' UTC'."""
+        rows = self._fetch(f"{_SELECT} WHERE callsign = ? COLLATE NOCASE {_ORDER}", (callsign,))
+        return [map_row(r, time_suffix='') for r in rows]
+
+    def distinct_values(self, column):
+        """Sorted non-empty values of band or mode, for filter dropdowns."""
+        if column not in ('band', 'mode'):
+            raise ValueError(column)
+        sql = f"SELECT DISTINCT {column} FROM Log WHERE {column} IS NOT NULL AND {column} != '' ORDER BY {column}"
+        return self._cached(('distinct', column), lambda: [r[0] for r in self._fetch(sql)])
+
+
+def stream_json(qsos):
+    """Chunks of '{"qsos": [...], "count": n}' for a streamed response."""
+    yield '{"qsos": ['
+    count = 0
+    for qso in qsos:
+        yield (',' if count else '') + json.dumps(qso)
+        count += 1
+    yield f'], "count": {count}}}'
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from web_app import SafeDatabaseAccess
+
+    if len(sys.argv) < 2:
+        sys.exit("usage: python qso_repository.py <Log4OM db.SQLite>")
+    repo = QSORepository(SafeDatabaseAccess(sys.argv[1]))
+    for label, run in (('first page', lambda: repo.page().items),
+                       ('first page (warm)', lambda: repo.page().items),
+                       ('last page', lambda: repo.page(page=10**9).items),
+                       ('QSL not sent', lambda: repo.page(QSOFilter(qsl='not_sent')).items),
+                       ('stream all', lambda: list(repo.iter_qsos()))):
+        start = time.perf_counter()
+        n = len(run())
+        print(f"{label:18} {n:6d} rows in {(time.perf_counter() - start) * 1000:8.1f} ms")
@@ -8,7 +8,7 @@ A Flask web interface for the QSL Card Creator desktop application
 from dotenv import load_dotenv
 load_dotenv('/Users/yancyshepherd/MEGA/PythonProjects/YANCY/shared/config/.env')
 
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, flash, Response, stream_with_context
 import os
 import sys
 import tempfile
@@ -41,9 +41,14 @@ import sys
 import sqlite3
 import logging
 import threading
-from contextlib import contextmanager
+from contextlib import contextmanager, ExitStack
 from typing import Optional, Tuple, List, Dict, Any
 import math
+import itertools
+
+from qso_repository import QSORepository, filter_from_args, stream_json, QSL_STATES
+from log_replica import LogReplica, source_version
+from hamqth import HamQTHXMLAPI, HamQTHCache
 
 # HTTP client for connector
 import requests
@@ -62,6 +67,8 @@ except ImportError:
 try:
     from reportlab.pdfgen import canvas
     from PyPDF2 import PdfWriter, PdfReader
+    import qsl_engine
+    import qsl_preview
     REPORTLAB_AVAILABLE = True
     PYPDF2_AVAILABLE = True
 except ImportError as e:
@@ -76,19 +83,33 @@ class SafeDatabaseAccess:
     to prevent corruption when Log4OM and QSL Card Creator access simultaneously
     """
     
-    def __init__(self, db_path):
+    def __init__(self, db_path, replica=None):
         self.db_path = db_path
+        self.replica = replica
         self._lock = threading.RLock()
     
     @contextmanager
-    def get_connection(self, timeout=10, read_only=True):
+    def get_connection(self, timeout=10, read_only=True, snapshot=True):
         """
         Get a database connection with proper locking and error handling
         
         Args:
             timeout: Maximum time to wait for database access
             read_only: If True, opens database in read-only mode to prevent conflicts
+            snapshot: If True (and a replica is configured), read-only access is served
+                      from the local replica without the global lock
         """
+        if read_only and snapshot and self.replica is not None:
+            stack = ExitStack()
+            try:
+                replica_conn = stack.enter_context(self.replica.connection())
+            except (OSError, sqlite3.Error) as e:
+                logging.warning(f"Log replica unavailable, reading the database directly: {e}")
+            else:
+                with stack:
+                    yield replica_conn
+                return
+        
         conn = None
         acquired = False
         
@@ -167,12 +188,23 @@ class SafeDatabaseAccess:
                     return cursor.fetchall()
                 else:
                     conn.commit()
+                    if self.replica is not None:
+                        self.replica.mark_stale()
                     return cursor.rowcount
                     
         except Exception as e:
             logging.error(f"Query execution error: {e}")
             return None
     
+    def data_version(self):
+        """Token that changes whenever the data served to readers may have changed"""
+        if self.replica is not None:
+            try:
+                return self.replica.current_version()
+            except (OSError, sqlite3.Error):
+                pass
+        return source_version(self.db_path)
+    
     def get_qso_count(self):
         """Get total QSO count safely"""
         try:
@@ -188,7 +220,8 @@ class SafeDatabaseAccess:
     def test_database_integrity(self):
         """Test database integrity and return status"""
         try:
-            with self.get_connection(read_only=True) as conn:
+            # Check the Log4OM file itself, not the replica
+            with self.get_connection(read_only=True, snapshot=False) as conn:
                 cursor = conn.cursor()
                 cursor.execute("PRAGMA integrity_check")
                 result = cursor.fetchone()
@@ -224,8 +257,10 @@ def get_database_path():
 # Global database path
 DATABASE_PATH = get_database_path()
 
-# Global safe database access instance
-safe_db = SafeDatabaseAccess(DATABASE_PATH)
+# Global safe database access instance; reads go to a local snapshot unless QSL_DB_REPLICA=0
+USE_DB_REPLICA = os.environ.get('QSL_DB_REPLICA', '1').lower() not in ('0', 'false', 'no')
+safe_db = SafeDatabaseAccess(DATABASE_PATH, LogReplica(DATABASE_PATH) if USE_DB_REPLICA else None)
+qso_repo = QSORepository(safe_db)
 
 # ============================================================================
 # MISSING CLASSES AND FUNCTIONS - Required for web app functionality
@@ -273,61 +308,18 @@ class AppSettings:
             print(f"Error saving settings: {e}")
 
 def preview_qsl_card(template_path, callsign, date, freq, mode, rst, qsltype):
-    """Generate a preview image of the QSL card with proper PDF preview"""
-    try:
-        # First, try to generate the actual PDF
-        pdf_path = generate_qsl_card(template_path, callsign, date, freq, mode, rst, qsltype)
-        if not pdf_path or not os.path.exists(pdf_path):
-            return generate_fallback_preview(callsign, date, freq, mode, rst, qsltype)
-        
-        # Try to convert PDF to image using Poppler
-        poppler_available, _ = check_poppler()
-        if poppler_available:
-            try:
-                import subprocess
-                preview_path = tempfile.mktemp(suffix='.png')
-                
-                # Use pdftoppm to convert first page of PDF to PNG
-                cmd = [
-                    'pdftoppm', 
-                    '-png', 
-                    '-f', '1',  # First page only
-                    '-l', '1',  # Last page (same as first)
-                    '-scale-to-x', '800',  # Scale to reasonable width
-                    '-scale-to-y', '-1',   # Maintain aspect ratio
-                    pdf_path,
-                    preview_path.replace('.png', '')  # pdftoppm adds -1.png
-                ]
-                
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-                
-                # pdftoppm creates filename-1.png
-                actual_preview = preview_path.replace('.png', '-1.png')
-                
-                if result.returncode == 0 and os.path.exists(actual_preview):
-                    # Move to expected filename
-                    os.rename(actual_preview, preview_path)
-                    # Clean up PDF
-                    try:
-                        os.unlink(pdf_path)
-                    except:
-                        pass
-                    return preview_path
-                else:
-                    print(f"PDF to image conversion failed: {result.stderr}")
-                    
-            except Exception as e:
-                print(f"Error converting PDF to image: {e}")
-        
-        # Fallback to simple preview if PDF conversion fails
+    """PNG bytes previewing the QSL card (cached per card, see qsl_preview)"""
+    if not REPORTLAB_AVAILABLE or not os.path.exists(template_path):
         return generate_fallback_preview(callsign, date, freq, mode, rst, qsltype)
-        
+    try:
+        card = qsl_engine.Card(callsign, date, freq, mode, rst, qsltype)
+        return qsl_preview.preview_png(template_path, card)
     except Exception as e:
         print(f"Error generating preview: {e}")
         return generate_fallback_preview(callsign, date, freq, mode, rst, qsltype)
 
 def generate_fallback_preview(callsign, date, freq, mode, rst, qsltype):
-    """Generate a simple fallback preview image"""
+    """Generate a simple fallback preview image (PNG bytes)"""
     try:
         from PIL import Image, ImageDraw, ImageFont
         
@@ -353,7 +345,7 @@ def generate_fallback_preview(callsign, date, freq, mode, rst, qsltype):
             f"RST: {rst}",
             f"Type: {qsltype}",
             "",
-            "(Fallback preview - install Poppler for full PDF preview)"
+            "(Fallback preview - template or PDF libraries unavailable)"
         ]
         
         y_offset = 20
@@ -361,16 +353,16 @@ def generate_fallback_preview(callsign, date, freq, mode, rst, qsltype):
             draw.text((20, y_offset), line, fill='black', font=font)
             y_offset += 25
             
-        temp_file = tempfile.mktemp(suffix='.png')
-        img.save(temp_file, 'PNG')
-        return temp_file
+        buffer = BytesIO()
+        img.save(buffer, 'PNG')
+        return buffer.getvalue()
         
     except Exception as e:
         print(f"Error generating fallback preview: {e}")
         return None
 
 def generate_qsl_card(template_path, callsign, date, freq, mode, rst, qsltype, output_path=None):
-    """Generate QSL card PDF using proper template positioning"""
+    """Generate QSL card PDF using proper template positioning (see qsl_engine)"""
     if output_path is None:
         output_path = tempfile.mktemp(suffix='.pdf')
         
@@ -379,201 +371,8 @@ def generate_qsl_card(template_path, callsign, date, freq, mode, rst, qsltype, o
         return generate_simple_pdf(callsign, date, freq, mode, rst, qsltype, output_path)
         
     try:
-        # Import required libraries 
-        from reportlab.pdfgen import canvas
-        from PyPDF2 import PdfWriter, PdfReader
-        from io import BytesIO
-        
-        template_reader = PdfReader(template_path)
-        page = template_reader.pages[0]
-        
-        # Get page dimensions
-        page_width = float(page.mediabox.width)
-        page_height = float(page.mediabox.height)
-        
-        # Create overlay
-        packet = BytesIO()
-        can = canvas.Canvas(packet, pagesize=(page_width, page_height))
-        
-        # QSL card positioning - professionally tuned coordinates
-        box_left = 30.445
-        box_right = 138.395
-        box_top = 167.92
-        box_height = 55
-        box_bottom = box_top - box_height
-        x_center = 84.4
-        
-        # Format date and time - handle multiple formats including UTC suffix
-        try:
-            # Try different datetime formats that might come from web interface
-            date_clean = str(date).strip()
-            
-            # Remove " UTC" suffix if present but preserve it for display
-            has_utc = " UTC" in date_clean
-            if has_utc:
-                date_clean = date_clean.replace(" UTC", "")
-            
-            # Try to parse the cleaned date
-            dt = None
-            for fmt in ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M']:
-                try:
-                    dt = datetime.strptime(date_clean, fmt)
-                    break
-                except ValueError:
-                    continue
-            
-            if dt:
-                formatted_datetime = f"{dt.strftime('%m-%d-%Y')} • {dt.strftime('%H:%M')} UTC"
-            else:
-                # If parsing fails, at least try to add UTC if it was in original
-                formatted_datetime = f"{date_clean} UTC" if has_utc or not " UTC" in str(date) else str(date)
-        except:
-            formatted_datetime = str(date)
-        
-        # Text lines with proper positioning
-        lines = [
-            ('Arial', 10, 'Confirming QSL With', False),
-            ('Arial-Bold', 22, callsign.upper(), False),
-            ('Arial', 10, 'QSO TIME', False),
-            ('Arial-Bold', 10, formatted_datetime, False),
-            ('Arial', 10, 'MHz:', True),
-            ('Arial', 10, 'Mode:', True),
-            ('Arial', 10, 'RST:', True)
-        ]
-        
-        values = [None, None, None, None, str(freq), str(mode), str(rst)]
-        
-        # Y positions - professionally calculated spacing
-        top_padding = 10
-        gap_call = 20
-        gap_qso = 16
-        gap_qso_date = 13
-        gap_to_mhz = 18
-        minor_gap = 12
-        
-        y = box_top - top_padding
-        y_positions = [y]
-        y -= gap_call
-        y_positions.append(y)
-        y -= gap_qso
-        y_positions.append(y)
-        y -= gap_qso_date
-        y_positions.append(y)
-        y -= gap_to_mhz
-        y_positions.append(y)
-        y -= minor_gap
-        y_positions.append(y)
-        y -= minor_gap
-        y_positions.append(y)
-        
-        def font_or_fallback(name):
-            # Most compatible sans-serif fonts for Docker/Linux environments
-            # Ordered by compatibility and appearance quality
-            font_fallbacks = [
-                'Helvetica',           # Most reliable PostScript font
-                'Helvetica-Bold',      # Bold variant
-                'Times-Roman',         # Serif fallback (very reliable)
-                'Courier',             # Monospace fallback (always available)
-                'Symbol'               # Last resort system font
-            ]
-            
-            # Map requested fonts to compatible equivalents
-            font_map = {
-                'Arial': 'Helvetica',
-                'Arial-Bold': 'Helvetica-Bold',
-                'Arial Black': 'Helvetica-Bold',
-                'Helvetica': 'Helvetica',
-                'Helvetica-Bold': 'Helvetica-Bold',
-                'Sans-Serif': 'Helvetica',
-                'DejaVu Sans': 'Helvetica',
-                'Liberation Sans': 'Helvetica'
-            }
-            
-            # Get the mapped font name
-            target_font = font_map.get(name, 'Helvetica')
-            
-            # Try the target font first
-            try:
-                can.setFont(target_font, 10)
-                return target_font
-            except:
-                # Try each fallback font in order of preference
-                for fallback_font in font_fallbacks:
-                    try:
-                        can.setFont(fallback_font, 10)
-                        return fallback_font
-                    except:
-                        continue
-                
-                # If all else fails, use the most basic font available
-                return 'Helvetica'  # ReportLab should always have this
-        
-        # Draw text with professional positioning
-        callsign_upper = (callsign or '').upper()
-        for i, (font, size, text, is_label_value) in enumerate(lines):
-            y = y_positions[i]
-            # Ensure callsign renders in bold, regardless of mapping
-            if not is_label_value and text.upper() == callsign_upper:
-                font_name = 'Helvetica-Bold'
-            else:
-                font_name = font_or_fallback(font)
-            print(f"Drawing text '{text}' using font '{font_name}' (requested: '{font}') at size {size}")
-            can.setFont(font_name, size)
-            if is_label_value:
-                label_width = can.stringWidth(text, font_name, size)
-                value = values[i]
-                value_font = font_or_fallback('Arial-Bold')
-                print(f"Using value font '{value_font}' for value '{value}' (requested: 'Arial-Bold')")
-                value_size = 10
-                value_width = can.stringWidth(value, value_font, value_size)
-                total_width = label_width + 6 + value_width
-                label_x = x_center - total_width/2 + label_width
-                value_x = label_x + 6
-                can.drawRightString(label_x, y, text)
-                can.setFont(value_font, value_size)
-                can.drawString(value_x, y, value)
-            else:
-                can.drawCentredString(x_center, y, text)
-        
-        # Draw line and QSL types - positioned at bottom of white box
-        can.setStrokeColorRGB(162/255, 32/255, 53/255)
-        can.setLineWidth(2)
-        line_y = box_bottom - 52  # Just above the QSL text
-        can.line(box_left + 5, line_y, box_right - 5, line_y)
-        
-        qsl_types = ['QSL', 'PSE', 'TNX']
-        qsl_gap = 32
-        qsl_y = box_bottom - 65  # Position at actual bottom of white box
-        qsl_xs = [x_center - qsl_gap, x_center, x_center + qsl_gap]
-        
-        for i, t in enumerate(qsl_types):
-            qsl_font = font_or_fallback('Arial')
-            print(f"Drawing QSL type '{t}' using font '{qsl_font}' (requested: 'Arial')")
-            can.setFont(qsl_font, 10)
-            can.setFillColorRGB(0, 0, 0)
-            can.drawCentredString(qsl_xs[i], qsl_y, t)
-            if t == qsltype:
-                text_width = can.stringWidth(t, qsl_font, 10)
-                can.setFillColorRGB(1, 1, 0)  # Yellow color
-                can.rect(qsl_xs[i] - text_width/2 - 2, qsl_y - 2, text_width + 4, 12, stroke=0, fill=1)
-                can.setFillColorRGB(0, 0, 0)  # Black text
-                can.drawCentredString(qsl_xs[i], qsl_y, t)
-        
-        can.save()
-        packet.seek(0)
-        overlay_pdf = packet.getvalue()
-        
-        # Merge with template
-        writer = PdfWriter()
-        page.merge_page(PdfReader(BytesIO(overlay_pdf)).pages[0])
-        writer.add_page(page)
-        
-        # Write to output file
-        with open(output_path, 'wb') as f:
-            writer.write(f)
-        
-        return output_path
-        
+        card = qsl_engine.Card(callsign, date, freq, mode, rst, qsltype)
+        return qsl_engine.CardEngine(template_path).write_card(card, output_path)
     except Exception as e:
         print(f"Error generating QSL card: {e}")
         return generate_simple_pdf(callsign, date, freq, mode, rst, qsltype, output_path)
@@ -783,169 +582,17 @@ de {mycall}
 # END MISSING FUNCTIONS
 # ============================================================================
 
-# HAMQTH XML API Implementation
-class HamQTHXMLAPI:
-    """HAMQTH XML API client for email lookup"""
-    def __init__(self):
-        self.session_id = None
-        self.session_expires = 0
-        self.base_url = "https://www.hamqth.com/xml.php"
-        self.base_bio_url = "https://www.hamqth.com/xml_bio.php"
-        self.username = None
-        self.password = None
-        self.namespace = None  # Will be set after first response
-
-    def set_credentials(self, username, password):
-        self.username = username
-        self.password = password
-
-    def _get_namespace(self, root):
-        # Extract namespace from root tag: {namespace}HamQTH
-        if root.tag.startswith('{'):
-            return root.tag.split('}')[0].strip('{')
-        return ''
-
-    def get_session(self, force_new=False):
-        """Get or renew session ID (reuse if valid, else request new)"""
-        try:
-            current_time = time.time()
-            if not self.username or not self.password:
-                return False, "HAMQTH credentials not configured"
-            if self.session_id and self.session_expires > current_time and not force_new:
-                return True, "Session reused"
-            # Request new session
-            params = {'u': self.username, 'p': self.password}
-            response = requests.get(self.base_url, params=params, timeout=10)
-            response.raise_for_status()
-            root = ET.fromstring(response.content)
-            self.namespace = self._get_namespace(root)
-            ns = {'ns': self.namespace} if self.namespace else {}
-            session_elem = root.find('ns:session' if ns else 'session', ns)
-            if session_elem is not None:
-                error_elem = session_elem.find('ns:error' if ns else 'error', ns)
-                if error_elem is not None and error_elem.text:
-                    return False, f"HAMQTH error: {error_elem.text}"
-                session_id_elem = session_elem.find('ns:session_id' if ns else 'session_id', ns)
-                if session_id_elem is not None and session_id_elem.text:
-                    self.session_id = session_id_elem.text
-                    self.session_expires = current_time + 3500  # 58 min
-                    return True, "Session established"
-                return False, "No session ID in response"
-            return False, "No <session> element in response"
-        except requests.RequestException as e:
-            return False, f"Network error: {str(e)}"
-        except ET.ParseError as e:
-            return False, f"XML parse error: {str(e)}"
-        except Exception as e:
-            return False, f"Session error: {str(e)}"
-
-    def lookup_callsign(self, callsign):
-        """Lookup callsign information with strict HAMQTH protocol compliance and debug logging"""
-        max_retries = 2
-        for attempt in range(max_retries):
-            session_ok, message = self.get_session(force_new=(attempt > 0))
-            if not session_ok:
-                return None, message
-            try:
-                session_id = self.session_id
-                program_name = "W5XY_QSL_Card_Creator"
-                url = f"https://www.hamqth.com/xml.php?id={session_id}&callsign={callsign.lower()}&prg={program_name}"
-                response = requests.get(url, timeout=10)
-                response.raise_for_status()
-                # Debug: log raw XML response
-                logging.warning(f"HAMQTH raw XML for {callsign}:\n{response.text}")
-                root = ET.fromstring(response.content)
-                ns_uri = self._get_namespace(root)
-                ns = {'ns': ns_uri} if ns_uri else {}
-                session_elem = root.find('ns:session' if ns else 'session', ns)
-                if session_elem is not None:
-                    error_elem = session_elem.find('ns:error' if ns else 'error', ns)
-                    if error_elem is not None and error_elem.text:
-                        # Session expired or invalid, force new session and retry
-                        if ("session" in error_elem.text.lower() or "expired" in error_elem.text.lower() or "invalid" in error_elem.text.lower()) and attempt < max_retries - 1:
-                            self.session_id = None
-                            self.session_expires = 0
-                            continue
-                        return None, f"HAMQTH error: {error_elem.text}"
-                # Find <search> node (with or without namespace)
-                search_elem = root.find('ns:search' if ns else 'search', ns)
-                if search_elem is None and ns_uri:
-                    search_elem = root.find(f'.//{{{ns_uri}}}search')
-                if search_elem is not None:
-                    data = {child.tag.split('}', 1)[-1]: child.text for child in search_elem}
-                    # Debug: log parsed data
-                    logging.warning(f"HAMQTH parsed data for {callsign}: {data}")
-                    return data, "Success"
-                logging.warning(f"HAMQTH: No <search> node found for {callsign}")
-                return None, "No data found for callsign"
-            except requests.RequestException as e:
-                if attempt < max_retries - 1:
-                    continue
-                return None, f"Network error: {str(e)}"
-            except ET.ParseError as e:
-                logging.warning(f"HAMQTH: XML parse error for {callsign}: {str(e)}")
-                return None, f"XML parse error: {str(e)}"
-            except Exception as e:
-                logging.warning(f"HAMQTH: Lookup error for {callsign}: {str(e)}")
-                return None, f"Lookup error: {str(e)}"
-        return None, "Max retries exceeded"
-
-    def lookup_bio(self, callsign: str, strip_html: bool = True):
-        """Lookup callsign bio text using xml_bio.php. Returns (data, message) where data is {'bio': str}.
-
-        Requires a valid session. Will attempt one session refresh on error, then fail gracefully.
-        """
-        max_retries = 2
-        strip = '1' if strip_html else '0'
-        for attempt in range(max_retries):
-            session_ok, message = self.get_session(force_new=(attempt > 0))
-            if not session_ok:
-                return None, message
-            try:
-                session_id = self.session_id
-                url = f"{self.base_bio_url}?id={session_id}&callsign={callsign.lower()}&strip_html={strip}"
-                response = requests.get(url, timeout=10)
-                response.raise_for_status()
-                root = ET.fromstring(response.content)
-                ns_uri = self._get_namespace(root)
-                ns = {'ns': ns_uri} if ns_uri else {}
-                session_elem = root.find('ns:session' if ns else 'session', ns)
-                if session_elem is not None:
-                    error_elem = session_elem.find('ns:error' if ns else 'error', ns)
-                    if error_elem is not None:
-                        err_text = (error_elem.text or '').strip()
-                        if err_text:
-                            # Session expired or invalid: retry once
-                            err_lower = err_text.lower()
-                            if ("session" in err_lower or "expired" in err_lower or "invalid" in err_lower) and attempt < max_retries - 1:
-                                self.session_id = None
-                                self.session_expires = 0
-                                continue
-                            return None, f"HAMQTH error: {err_text}"
-                # Extract <search>/<bio>
-                search_elem = root.find('ns:search' if ns else 'search', ns)
-                if search_elem is None and ns_uri:
-                    search_elem = root.find(f'.//{{{ns_uri}}}search')
-                if search_elem is not None:
-                    # Locate bio element (with or without namespace)
-                    bio_elem = search_elem.find('ns:bio' if ns else 'bio', ns)
-                    if bio_elem is None and ns_uri:
-                        bio_elem = search_elem.find(f'.//{{{ns_uri}}}bio')
-                    bio_text = bio_elem.text if bio_elem is not None else ''
-                    return {'bio': bio_text or ''}, "Success"
-                return None, "No bio found for callsign"
-            except requests.RequestException as e:
-                if attempt < max_retries - 1:
-                    continue
-                return None, f"Network error: {str(e)}"
-            except ET.ParseError as e:
-                return None, f"XML parse error: {str(e)}"
-            except Exception as e:
-                return None, f"Lookup error: {str(e)}"
-        return None, "Max retries exceeded"
+# Global HAMQTH API instance (client lives in hamqth.py)
+try:
+    _hamqth_cache = HamQTHCache()
+except (OSError, sqlite3.Error) as e:
+    print(f"Error opening HAMQTH lookup cache, lookups will not be cached: {e}")
+    _hamqth_cache = None
+hamqth_api = HamQTHXMLAPI(cache=_hamqth_cache)
 
-# Global HAMQTH API instance
-hamqth_api = HamQTHXMLAPI()
+# State of the background cache warm-up started from /api/hamqth-prefetch
+hamqth_prefetch_status = {'running': False}
+_hamqth_prefetch_lock = threading.Lock()
 
 def load_hamqth_credentials():
     """Load HAMQTH credentials from environment (preferred) or settings file.
@@ -1090,6 +737,17 @@ def connector_health(timeout: float = 3.0) -> Optional[Dict[str, Any]]:
         pass
     return None
 
+CONNECTOR_HEALTH_TTL = float(os.environ.get('CONNECTOR_HEALTH_TTL', '30'))
+_connector_health_cache = {'checked_at': None, 'info': None}
+
+def connector_health_cached() -> Optional[Dict[str, Any]]:
+    """connector_health(), re-checked at most every CONNECTOR_HEALTH_TTL seconds."""
+    checked_at = _connector_health_cache['checked_at']
+    if checked_at is None or time.monotonic() - checked_at >= CONNECTOR_HEALTH_TTL:
+        _connector_health_cache['info'] = connector_health()
+        _connector_health_cache['checked_at'] = time.monotonic()
+    return _connector_health_cache['info']
+
 def connector_get_qsos(limit: int = 100, since: Optional[str] = None, timeout: float = 5.0, retries: int = 2) -> Optional[List[Dict[str, Any]]]:
     """Fetch QSOs from connector with simple retry/backoff. Returns list of items or None on failure."""
     query_params: Dict[str, Any] = {'limit': max(1, int(limit))}
@@ -1173,19 +831,10 @@ def _map_connector_item_to_gui(item: Dict[str, Any]) -> Dict[str, Any]:
 
 def check_poppler():
     """Check if Poppler is available for PDF generation"""
-    try:
-        # Try to run pdftoppm to check if poppler is available
-        result = subprocess.run(['pdftoppm', '-h'], 
-                              capture_output=True, 
-                              text=True, 
-                              timeout=5)
+    # A PATH lookup is enough; spawning pdftoppm -h cost a process per status check
+    if shutil.which('pdftoppm'):
         return True, "Poppler available for PDF generation"
-    except (subprocess.TimeoutExpired, subprocess.CalledProcessError):
-        return False, "Poppler installed but not accessible"
-    except FileNotFoundError:
-        return False, "Poppler not installed - PDF generation unavailable"
-    except Exception as e:
-        return False, f"Poppler check failed: {str(e)}"
+    return False, "Poppler not installed - PDF generation unavailable"
 
 def get_save_filename(callsign, date):
     return f"QSL_{callsign}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
@@ -1401,18 +1050,15 @@ def preview_qsl():
             })
         
         # Generate preview
-        preview_file_path = preview_qsl_card(
+        png = preview_qsl_card(
             template_path, callsign, datetime_str, freq, mode, rst, qsltype
         )
         
-        if preview_file_path and os.path.exists(preview_file_path):
-            # Read the PNG file and convert to base64 for web display
-            with open(preview_file_path, 'rb') as img_file:
-                img_str = base64.b64encode(img_file.read()).decode()
-                return jsonify({
-                    'success': True, 
-                    'preview': f"data:image/png;base64,{img_str}"
-                })
+        if png:
+            return jsonify({
+                'success': True, 
+                'preview': f"data:image/png;base64,{base64.b64encode(png).decode()}"
+            })
         else:
             return jsonify({'success': False, 'error': 'Failed to generate preview'})
             
@@ -1570,13 +1216,66 @@ def generate_qsl():
         flash(f'Generation error: {str(e)}', 'error')
         return redirect(url_for('create_qsl'))
 
+def _batch_card(qso, default_qsltype):
+    """qsl_engine.Card from a QSO dict as returned by /api/qsos (or create-form field names)"""
+    date = str(qso.get('date') or qso.get('qsodate') or '').replace('Z', '')
+    time_part = str(qso.get('time') or '').strip()
+    if time_part and ' ' not in date:
+        date = f"{date} {time_part if 'UTC' in time_part else time_part + ' UTC'}"
+    return qsl_engine.Card(
+        str(qso.get('callsign') or '').upper(),
+        date,
+        qso.get('frequency') or qso.get('freq') or '',
+        qso.get('mode') or '',
+        qso.get('rst_sent') or qso.get('rst') or '59',
+        qso.get('qsltype') or default_qsltype
+    )
+
+@app.route('/api/generate-batch', methods=['POST'])
+def generate_qsl_batch():
+    """Generate QSL cards for many QSOs: one merged print sheet PDF, or a ZIP of individual PDFs"""
+    if not REPORTLAB_AVAILABLE:
+        return jsonify({'success': False, 'error': 'PDF libraries not available'}), 503
+    payload = request.get_json(silent=True) or {}
+    qsos = payload.get('qsos') or []
+    if not isinstance(qsos, list):
+        return jsonify({'success': False, 'error': 'No QSOs provided'}), 400
+    cards = [_batch_card(qso, payload.get('qsltype', 'TNX')) for qso in qsos if isinstance(qso, dict)]
+    cards = [card for card in cards if card.callsign]
+    if not cards:
+        return jsonify({'success': False, 'error': 'No valid QSOs provided'}), 400
+    template_path, searched = resolve_template_path(DEFAULT_TEMPLATE_NAME)
+    if not template_path:
+        return jsonify({'success': False, 'error': 'Template file not found', 'searched_paths': searched}), 404
+    try:
+        engine = qsl_engine.CardEngine(template_path)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        if payload.get('output', 'merged') == 'merged':
+            return send_file(BytesIO(engine.merged_pdf(cards)), mimetype='application/pdf',
+                             as_attachment=True, download_name=f"QSL_cards_{stamp}.pdf")
+        import zipfile
+        archive = BytesIO()
+        with tempfile.TemporaryDirectory() as out_dir:
+            paths = engine.write_cards(cards, out_dir)
+            # PDFs are already compressed
+            with zipfile.ZipFile(archive, 'w', zipfile.ZIP_STORED) as zf:
+                for path in paths:
+                    zf.write(path, os.path.basename(path))
+        archive.seek(0)
+        return send_file(archive, mimetype='application/zip',
+                         as_attachment=True, download_name=f"QSL_cards_{stamp}.zip")
+    except Exception as e:
+        print(f"Error generating QSL batch: {e}")
+        return jsonify({'success': False, 'error': f'Batch generation error: {str(e)}'}), 500
+
 @app.route('/qsos')
 def list_qsos():
-    """List QSOs from database using safe database access"""
+    """List QSOs from the Log4OM database, filtered and paginated in SQL"""
+    filters = filter_from_args(request.args)
+    page = request.args.get('page', 1, type=int)
     try:
-        # Prefer connector if available and authorized
-        connector_info = connector_health()
-        if connector_info:
+        # Connector only serves the latest QSOs; use it when there is no local database
+        if not os.path.exists(DATABASE_PATH) and connector_health_cached():
             items = connector_get_qsos(limit=100)
             if items is not None:
                 mapped = [_map_connector_item_to_gui(it) for it in items]
@@ -1584,86 +1283,11 @@ def list_qsos():
                     return render_template('qsos.html', qsos=[], error="No QSOs found via connector")
                 return render_template('qsos.html', qsos=mapped)
 
-        # Fallback to direct DB access - include QSL confirmation data
-        rows = safe_db.execute_query("""
-            SELECT callsign, qsodate, freq, mode, rstsent, rstrcvd, email, qsoconfirmations
-            FROM Log 
-            ORDER BY qsodate DESC 
-            LIMIT 100
-        """, read_only=True)
-        
-        if rows is None:
-            return render_template('qsos.html', qsos=[], error="Database access error - please try again")
-        
-        # Handle case where rows might be an integer (should not happen for SELECT, but defensive coding)
-        if isinstance(rows, int):
-            return render_template('qsos.html', qsos=[], error="Unexpected database response - please try again")
-        
-        qsos = []
-        for row in rows:
-            # Parse datetime from qsodate field
-            qso_datetime = row[1] if len(row) > 1 else None
-            
-            # Split date and time
-            if qso_datetime:
-                try:
-                    # Remove 'Z' and split date and time
-                    dt_clean = qso_datetime.replace('Z', '')
-                    if ' ' in dt_clean:
-                        date_part, time_part = dt_clean.split(' ')
-                        # Ensure time is shown as UTC
-                        if not time_part.endswith(' UTC'):
-                            time_part = time_part + ' UTC'
-                    else:
-                        date_part = dt_clean
-                        time_part = ''
-                except Exception:
-                    date_part = qso_datetime
-                    time_part = ''
-            else:
-                date_part = ''
-                time_part = ''
-            
-            # Parse QSL confirmation data
-            qsl_sent = "No"
-            qsl_received = "No"
-            qso_confirmations = row[7] if len(row) > 7 and row[7] else ""
-            
-            if qso_confirmations:
-                try:
-                    import json
-                    confirmations = json.loads(qso_confirmations)
-                    # Look for QSL card confirmations (not eQSL or LOTW)
-                    for conf in confirmations:
-                        if conf.get('CT') == 'QSL':  # QSL card (not eQSL)
-                            # Only show "Yes" if actually sent/received, ignore "Requested"
-                            sent_status = conf.get('S', 'No')
-                            received_status = conf.get('R', 'No')
-                            qsl_sent = "Yes" if sent_status == "Yes" else "No"
-                            qsl_received = "Yes" if received_status == "Yes" else "No"
-                            break
-                except:
-                    pass  # If JSON parsing fails, default to "No"
-            
-            qso_data = {
-                'callsign': row[0],
-                'date': date_part,
-                'time': time_part,
-                'frequency': str(row[2]) if row[2] else '',
-                'mode': row[3] if row[3] else '',
-                'rst_sent': row[4] if row[4] else '59',
-                'rst_received': row[5] if row[5] else '59',
-                'email': row[6] if len(row) > 6 and row[6] else '',
-                'qsl_sent': qsl_sent,
-                'qsl_received': qsl_received,
-                'qso_datetime': qso_datetime  # Include full datetime for unique identification
-            }
-            qsos.append(qso_data)
-        
-        if len(qsos) == 0:
-            return render_template('qsos.html', qsos=[], error="No QSOs found")
-        
-        return render_template('qsos.html', qsos=qsos)
+        result = qso_repo.page(filters, page, request.args.get('per_page', 100, type=int))
+        return render_template('qsos.html', qsos=result.items, page=result, filters=filters,
+                               bands=qso_repo.distinct_values('band'), modes=qso_repo.distinct_values('mode'),
+                               qsl_states=QSL_STATES,
+                               error=None if result.total or any(filters) else "No QSOs found")
             
     except Exception as e:
         return render_template('qsos.html', qsos=[], error=f"Database error: {str(e)}")
@@ -2278,6 +1902,57 @@ def api_hamqth_bio(callsign):
     except Exception as e:
         return jsonify({'success': False, 'error': f'Lookup error: {str(e)}', 'fallback_url': f"https://www.hamqth.com/{callsign.upper()}"}), 500
 
+@app.route('/api/hamqth-prefetch', methods=['GET', 'POST'])
+def api_hamqth_prefetch():
+    """Warm the HAMQTH cache in the background (POST) or report progress (GET).
+
+    POST body may list {"callsigns": [...]}; by default every logged callsign without an email is looked up.
+    """
+    if request.method == 'GET':
+        return jsonify(dict(hamqth_prefetch_status, success=True))
+    if not hamqth_api.username or not hamqth_api.password:
+        return jsonify({'success': False, 'error': 'HAMQTH credentials not configured'}), 400
+    data = request.get_json(silent=True) or {}
+    include_bio = bool(data.get('include_bio', False))
+    callsigns = data.get('callsigns')
+    if callsigns is not None and (not isinstance(callsigns, list)
+                                  or not all(isinstance(c, str) for c in callsigns)):
+        return jsonify({'success': False, 'error': '"callsigns" must be a list of strings'}), 400
+    callsigns = [c.strip() for c in callsigns or [] if c.strip()]
+    try:
+        if not callsigns:
+            with safe_db.get_connection() as conn:
+                rows = conn.execute(
+                    "SELECT DISTINCT UPPER(callsign) FROM Log "
+                    "WHERE callsign IS NOT NULL AND callsign != '' AND (email IS NULL OR email = '')"
+                ).fetchall()
+            callsigns = [row[0] for row in rows]
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Database error: {str(e)}'}), 500
+
+    with _hamqth_prefetch_lock:
+        if hamqth_prefetch_status.get('running'):
+            return jsonify(dict(hamqth_prefetch_status, success=False, error='Prefetch already running')), 409
+        hamqth_prefetch_status.clear()
+        hamqth_prefetch_status.update({'running': True, 'done': 0, 'total': len(callsigns), 'started': time.time()})
+
+    def progress(done, total):
+        hamqth_prefetch_status.update({'done': done, 'total': total})
+
+    def run():
+        try:
+            stats = hamqth_api.prefetch(callsigns, include_bio=include_bio, progress=progress)
+            hamqth_prefetch_status.update(stats)
+        except Exception as e:
+            print(f"Error prefetching HAMQTH lookups: {e}")
+            hamqth_prefetch_status['error'] = str(e)
+        finally:
+            hamqth_prefetch_status['running'] = False
+            hamqth_prefetch_status['finished'] = time.time()
+
+    threading.Thread(target=run, name='hamqth-prefetch', daemon=True).start()
+    return jsonify(dict(hamqth_prefetch_status, success=True)), 202
+
 @app.route('/api/hamqth-credentials', methods=['POST'])
 def set_hamqth_credentials():
     """Set HAMQTH credentials"""
@@ -2562,6 +2237,8 @@ def update_qso_qsl_status(callsign, qso_date, qsl_sent, qsl_received, sent_via,
         conn.commit()
         print(f"[DEBUG QSL UPDATE] Database update committed for QSO ID: {qso_id}")
         conn.close()
+        if safe_db.replica is not None:
+            safe_db.replica.mark_stale()
         
         status_msg = []
         if qsl_sent:
@@ -2756,95 +2433,24 @@ def api_settings():
 
 @app.route('/api/qsos')
 def api_qsos():
-    """API endpoint to get QSOs data as JSON"""
+    """API endpoint to get QSOs data as JSON, streamed.
+
+    Accepts the /qsos filters (callsign, from, to, band, mode, qsl) and
+    limit (default 100, 0 for every matching QSO).
+    """
     try:
-        # Prefer connector if reachable
-        info = connector_health()
-        if info:
-            items = connector_get_qsos(limit=100)
+        limit = request.args.get('limit', 100, type=int)
+        if not os.path.exists(DATABASE_PATH) and connector_health_cached():
+            items = connector_get_qsos(limit=limit or 100)
             if items is not None:
                 mapped = [_map_connector_item_to_gui(it) for it in items]
                 return jsonify({'count': len(mapped), 'qsos': mapped})
 
-        # Fallback to safe database access - include QSL confirmation data
-        rows = safe_db.execute_query("""
-            SELECT callsign, qsodate, freq, mode, rstsent, rstrcvd, email, qsoconfirmations
-            FROM Log 
-            ORDER BY qsodate DESC 
-            LIMIT 100
-        """, read_only=True)
-        
-        if rows is None:
-            return jsonify({'error': 'Database access error - please try again'})
-        
-        # Handle case where rows might be an integer (should not happen for SELECT, but defensive coding)
-        if isinstance(rows, int):
-            return jsonify({'error': 'Unexpected database response - please try again'})
-        
-        qsos = []
-        for row in rows:
-            # Parse datetime from qsodate field
-            qso_datetime = row[1] if len(row) > 1 else None
-            
-            # Split date and time
-            if qso_datetime:
-                try:
-                    # Remove 'Z' and split date and time
-                    dt_clean = qso_datetime.replace('Z', '')
-                    if ' ' in dt_clean:
-                        date_part, time_part = dt_clean.split(' ')
-                        # Ensure time is shown as UTC
-                        if not time_part.endswith(' UTC'):
-                            time_part = time_part + ' UTC'
-                    else:
-                        date_part = dt_clean
-                        time_part = ''
-                except Exception:
-                    date_part = qso_datetime
-                    time_part = ''
-            else:
-                date_part = ''
-                time_part = ''
-            
-            # Parse QSL confirmation data
-            qsl_sent = "No"
-            qsl_received = "No"
-            qso_confirmations = row[7] if len(row) > 7 and row[7] else ""
-            
-            if qso_confirmations:
-                try:
-                    import json
-                    confirmations = json.loads(qso_confirmations)
-                    # Look for QSL card confirmations (not eQSL or LOTW)
-                    for conf in confirmations:
-                        if conf.get('CT') == 'QSL':  # QSL card (not eQSL)
-                            # Only show "Yes" if actually sent/received, ignore "Requested"
-                            sent_status = conf.get('S', 'No')
-                            received_status = conf.get('R', 'No')
-                            qsl_sent = "Yes" if sent_status == "Yes" else "No"
-                            qsl_received = "Yes" if received_status == "Yes" else "No"
-                            break
-                except:
-                    pass  # If JSON parsing fails, default to "No"
-            
-            qso_data = {
-                'callsign': row[0],
-                'date': date_part,
-                'time': time_part,
-                'frequency': str(row[2]) if row[2] else '',
-                'mode': row[3] if row[3] else '',
-                'rst_sent': row[4] if row[4] else '59',
-                'rst_received': row[5] if row[5] else '59',
-                'email': row[6] if row[6] else '',
-                'qsl_sent': qsl_sent,
-                'qsl_received': qsl_received
-            }
-            qsos.append(qso_data)
-        
-        return jsonify({
-            'count': len(qsos),
-            'qsos': qsos
-        })
+        qsos = qso_repo.iter_qsos(filter_from_args(request.args), limit=limit if limit > 0 else None)
+        # Fetch the first batch now so database errors still produce a JSON error response
+        first = next(qsos, None)
+        rows = itertools.chain([first], qsos) if first is not None else []
+        return Response(stream_with_context(stream_json(rows)), mimetype='application/json')
         
     except Exception as e:
         return jsonify({'error': f"Database error: {str(e)}"})
@@ -2854,87 +2460,10 @@ def get_qso_by_callsign(callsign):
     """Get QSO data for a specific callsign"""
     try:
         callsign = callsign.upper()
-        
-        # Query database for QSOs with this callsign
-        rows = safe_db.execute_query("""
-            SELECT callsign, qsodate, freq, mode, rstsent, rstrcvd, email, qsoconfirmations
-            FROM Log 
-            WHERE UPPER(callsign) = ?
-            ORDER BY qsodate DESC
-        """, (callsign,), read_only=True)
-        
-        if not rows:
+        qsos = qso_repo.by_callsign(callsign)
+        if not qsos:
             return jsonify({'error': f'No QSOs found for {callsign}', 'count': 0})
         
-        qsos = []
-        for row in rows:
-            # Parse datetime - handle Log4OM format
-            qso_datetime = row[1]
-            
-            if isinstance(qso_datetime, str):
-                # Use the same parsing logic as QSL generation and email system
-                try:
-                    # Remove 'Z' and split date and time
-                    dt_clean = qso_datetime.replace('Z', '')
-                    if ' ' in dt_clean:
-                        date_part, time_part = dt_clean.split(' ')
-                        # Convert to HTML date format if needed
-                        if '/' in date_part:
-                            # Handle MM/DD/YYYY format
-                            try:
-                                dt = datetime.strptime(date_part, '%m/%d/%Y')
-                                date_part = dt.strftime('%Y-%m-%d')
-                            except ValueError:
-                                pass
-                    else:
-                        date_part = dt_clean
-                        time_part = ''
-                except Exception:
-                    # Fallback: try original parsing methods
-                    try:
-                        # Log4OM format: MM/DD/YYYY HH:MM:SS
-                        dt = datetime.strptime(qso_datetime, '%m/%d/%Y %H:%M:%S')
-                        date_part = dt.strftime('%Y-%m-%d')  # HTML date input format
-                        time_part = dt.strftime('%H:%M')     # HTML time format
-                    except ValueError:
-                        try:
-                            # Alternative format: YYYY-MM-DD HH:MM:SS
-                            dt = datetime.strptime(qso_datetime, '%Y-%m-%d %H:%M:%S')
-                            date_part = dt.strftime('%Y-%m-%d')
-                            time_part = dt.strftime('%H:%M')
-                        except ValueError:
-                            # If parsing fails, try to extract just date
-                            date_part = qso_datetime.split(' ')[0] if ' ' in qso_datetime else qso_datetime
-                            time_part = ''
-            else:
-                date_part = str(qso_datetime)
-                time_part = ''
-            
-            # Parse QSL confirmations
-            qsl_sent = "No"
-            qsl_received = "No"
-            if row[7]:  # qsoconfirmations field
-                try:
-                    confirmations = json.loads(row[7])
-                    qsl_sent = confirmations.get('eqsl_sent', 'No')
-                    qsl_received = confirmations.get('eqsl_received', 'No')
-                except:
-                    pass
-            
-            qso_data = {
-                'callsign': row[0],
-                'date': date_part,
-                'time': time_part,
-                'frequency': str(row[2]) if row[2] else '',
-                'mode': row[3] if row[3] else '',
-                'rst_sent': row[4] if row[4] else '59',
-                'rst_received': row[5] if row[5] else '59',
-                'email': row[6] if row[6] else '',
-                'qsl_sent': qsl_sent,
-                'qsl_received': qsl_received
-            }
-            qsos.append(qso_data)
-        
         return jsonify({
             'count': len(qsos),
             'qsos': qsos
@@ -10,7 +10,7 @@ from discord import app_commands
 import sys
 
 import config
-from logging_config import setup_logging, get_logger, log_performance
+from logging_config import setup_logging, get_logger, log_performance, log_command
 from utils_email import send_crash_email
 
 # Determine environment (development or production)
@@ -126,6 +126,15 @@ async def on_ready():
     except Exception as e:
         logger.error(f"Failed in on_ready: {e}", exc_info=True)
 
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    log_command(get_logger("commands"), interaction)
+
+
+@bot.tree.error
+async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    log_command(get_logger("commands"), interaction, error=error)
+
 async def main():
     try:
         if not config.DISCORD_BOT_TOKEN:
@@ -6,6 +6,7 @@ from discord.ext import commands
 
 import config
 import database_optimized as database
+import war_analytics
 from config import is_leader_or_admin
 # import bonus_weights  # Import the new weighted algorithm (DISABLED: file missing)
 from logging_config import get_logger
@@ -358,6 +359,17 @@ class BonusesCog(commands.Cog):
             
             new_members.sort(key=newbie_sort_key)
 
+            # All-time attack analytics (cached; recomputed only when new attacks land)
+            try:
+                attack_metrics = war_analytics.get_player_metrics()
+            except Exception as e:
+                logger.warning(f"War analytics unavailable for on_deck: {e}")
+                attack_metrics = {}
+
+            def efficiency_text(p):
+                m = attack_metrics.get(str(p.get("tag") or "").upper())
+                return f", {m['star_efficiency']:.1f}★/atk" if m else ""
+
             # Get the groups
             top_5_eligible = eligible_players[:5]
             next_eligible = eligible_players[5:10]  # Next 5 eligible players
@@ -375,7 +387,7 @@ class BonusesCog(commands.Cog):
                     bonus_count = p.get("bonus_count", 0)
                     last_bonus = format_last_bonus(str(p.get("last_bonus_date", "")))
                     missed_attacks = p.get("missed_attacks", 0)
-                    top_5_text.append(f"• **{p['name']}** - {bonus_count} bonuses, Last: {last_bonus}, Missed: {missed_attacks}")
+                    top_5_text.append(f"• **{p['name']}** - {bonus_count} bonuses, Last: {last_bonus}, Missed: {missed_attacks}{efficiency_text(p)}")
                 
                 embed.add_field(
                     name="🏆 Top 5 On Deck",
@@ -390,7 +402,7 @@ class BonusesCog(commands.Cog):
                     bonus_count = p.get("bonus_count", 0)
                     last_bonus = format_last_bonus(str(p.get("last_bonus_date", "")))
                     missed_attacks = p.get("missed_attacks", 0)
-                    next_text.append(f"• **{p['name']}** - {bonus_count} bonuses, Last: {last_bonus}, Missed: {missed_attacks}")
+                    next_text.append(f"• **{p['name']}** - {bonus_count} bonuses, Last: {last_bonus}, Missed: {missed_attacks}{efficiency_text(p)}")
                 
                 embed.add_field(
                     name="⏳ Next in Line",
@@ -6,6 +6,7 @@ from typing import Optional, List
 
 import config
 import database_optimized as database
+import war_analytics
 from logging_config import get_logger
 from utils import (
     has_any_role_id, 
@@ -268,6 +269,20 @@ class CWLCog(commands.Cog):
                     value=rating,
                     inline=False
                 )
+
+                # Attack-level analytics for this season, if recorded
+                metrics = war_analytics.metrics_for_tag(target_player.get("tag"), war_analytics.current_season())
+                if metrics:
+                    timing = metrics['median_hours_into_war']
+                    embed.add_field(
+                        name="Attack Analytics",
+                        value=f"**Stars/Attack:** {metrics['star_efficiency']:.2f}\n"
+                              f"**3★ Rate:** {metrics['three_star_rate']:.0%}\n"
+                              f"**Avg Destruction:** {metrics['avg_destruction']:.1f}%\n"
+                              f"**Hit Up / Down:** {metrics['hit_up_rate']:.0%} / {metrics['hit_down_rate']:.0%}"
+                              + (f"\n**Typical Attack Time:** {timing:.1f}h into war" if timing is not None else ""),
+                        inline=False
+                    )
                 
             else:
                 # Show leaderboard
@@ -291,6 +306,11 @@ class CWLCog(commands.Cog):
                     cwl_players.sort(key=lambda p: (-p.get("cwl_stars", 0), p.get("missed_attacks", 0)))
                     
                     # Top 15 players
+                    season_metrics = {}
+                    try:
+                        season_metrics = war_analytics.get_player_metrics(war_analytics.current_season())
+                    except Exception as e:
+                        logger.warning(f"War analytics unavailable for leaderboard: {e}")
                     leaderboard = []
                     for i, player in enumerate(cwl_players[:15], 1):
                         name = player.get("name", "Unknown")
@@ -307,7 +327,11 @@ class CWLCog(commands.Cog):
                         else:
                             indicator = "⚪"
                         
-                        leaderboard.append(f"{i:2d}. {indicator} {name} - {stars} ⭐ ({missed} missed)")
+                        line = f"{i:2d}. {indicator} {name} - {stars} ⭐ ({missed} missed)"
+                        metrics = season_metrics.get(str(player.get("tag") or "").upper())
+                        if metrics:
+                            line += f" · {metrics['star_efficiency']:.1f}★/atk, {metrics['three_star_rate']:.0%} 3★"
+                        leaderboard.append(line)
                     
                     embed.add_field(
                         name="🏆 Top Performers",
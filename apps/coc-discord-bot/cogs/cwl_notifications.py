@@ -9,6 +9,8 @@ from typing import Optional
 import os
 from utils_supercell import get_current_cwl_war, get_cwl_round_schedule
 import config
+import war_analytics
+from leader_election import get_elector, INSTANCE_ID
 
 ADMIN_DISCORD_ID = config.ADMIN_DISCORD_ID
 logger = logging.getLogger("cwl_notifications")
@@ -32,7 +34,9 @@ def save_cache(cache):
     except Exception as e:
         logger.error(f"Failed to save CWL notification cache: {e}")
 
-from database_optimized import get_optimized_connection as _db_conn
+from database_optimized import get_optimized_connection as _db_conn, claim_event, prune_processed_events
+
+LEADER_ROLE = "cwl_polling"
 
 class CWLNotifications(commands.Cog):
     def __init__(self, bot):
@@ -42,7 +46,10 @@ class CWLNotifications(commands.Cog):
         self.last_player_stars = cache.get("last_player_stars", {})
         # Track which ON DECK intervals have been announced per warTag, e.g., {"#WAR123": [60,30,15]}
         self.on_deck_sent = cache.get("on_deck_sent", {})
+        # Attacks seen by this replica's previous poll, {warTag: {(player_tag, order)}}
+        self.seen_attacks = {}
         self.cwl_polling_task.start()
+        self.prune_events_task.start()
 
     def _get_discord_ids_for_coc(self, tag: str, name: Optional[str] = None):
         ids = set()
@@ -70,12 +77,36 @@ class CWLNotifications(commands.Cog):
             return []
         return list(ids)
 
+    async def _claim(self, event_key: str) -> bool:
+        """True if this replica should send the notification identified by event_key"""
+        return await asyncio.to_thread(claim_event, event_key, INSTANCE_ID)
+
     async def cog_unload(self):
         self.cwl_polling_task.cancel()
+        self.prune_events_task.cancel()
+        await get_elector().release(LEADER_ROLE)
+
+    @tasks.loop(hours=24)
+    async def prune_events_task(self):
+        """Drop old notification claims so processed_events stays small (leader only)"""
+        await self.bot.wait_until_ready()
+        if not await get_elector().is_leader(LEADER_ROLE):
+            return
+        try:
+            removed = await asyncio.to_thread(prune_processed_events)
+            logger.info(f"Pruned {removed} old processed event claims")
+        except Exception as e:
+            logger.warning(f"Could not prune processed events: {e}")
 
     @tasks.loop(minutes=5)
     async def cwl_polling_task(self):
         await self.bot.wait_until_ready()
+        # Only the elected replica polls; standbys keep checking each tick
+        if not await get_elector().is_leader(LEADER_ROLE):
+            logger.debug("Not the CWL polling leader, skipping poll")
+            # Polls missed while standing by leave gaps, so don't time attacks against them later
+            self.seen_attacks = {}
+            return
         try:
             clan_tag = config.CLAN_TAG or ""
             if not clan_tag:
@@ -94,15 +125,32 @@ class CWLNotifications(commands.Cog):
             if war_state != self.last_war_state and self.last_war_state is not None:
                 logger.info(f"War state changed from {self.last_war_state} to {war_state}")
                 # Delay state change announcements by 5 minutes to reduce instant pings
-                asyncio.create_task(self.delayed_war_state_notification(war_state, war_tag, delay_seconds=300))
+                if await self._claim(f"cwl_state:{war_tag}:{war_state}"):
+                    asyncio.create_task(self.delayed_war_state_notification(war_state, war_tag, delay_seconds=300))
             elif self.last_war_state is None:
                 logger.info(f"Initial war state detected: {war_state} (no notification sent)")
             
             # Update war state
             self.last_war_state = war_state
             
+            if war_state == "preparation":
+                # No attacks yet, so every attack the next poll finds is new
+                self.seen_attacks = {war_tag: set()}
+
             # Detect new stars for each player
             if war_state in ["inWar", "warEnded"]:  # Only track stars during war
+                # Attacks new since the previous poll of a running war are stamped with
+                # the time they were first observed so analytics get attack timing
+                try:
+                    rows = war_analytics.rows_from_live_war(
+                        war_data, clan_tag,
+                        observed_at=datetime.now(timezone.utc) if war_state == "inWar" else None,
+                        previously_seen=self.seen_attacks.get(war_tag),
+                    )
+                    self.seen_attacks = {war_tag: war_analytics.attack_keys(rows)}
+                    await asyncio.to_thread(war_analytics.record_attacks, rows)
+                except Exception as e:
+                    logger.warning(f"Could not record live war attacks: {e}")
                 clan_members = war_data.get('clan', {}).get('members', [])
                 for member in clan_members:
                     tag = member.get('tag')
@@ -114,7 +162,7 @@ class CWLNotifications(commands.Cog):
                     prev_stars = self.last_player_stars.get(tag, 0)
                     
                     # Send notification for star increases (including 8+ star achievements)
-                    if total_stars > prev_stars:
+                    if total_stars > prev_stars and await self._claim(f"cwl_star:{war_tag}:{tag}:{total_stars}"):
                         logger.info(f"{name} increased stars from {prev_stars} to {total_stars}")
                         await self.send_star_notification(name, tag, total_stars, prev_stars)
                     
@@ -135,7 +183,8 @@ class CWLNotifications(commands.Cog):
                         if remaining_minutes <= threshold and remaining_minutes >= 0:
                             sent_set = set(self.on_deck_sent.get(war_tag, []))
                             if threshold not in sent_set:
-                                await self.send_on_deck_alert(war_data, threshold)
+                                if await self._claim(f"cwl_on_deck:{war_tag}:{threshold}"):
+                                    await self.send_on_deck_alert(war_data, threshold)
                                 sent_set.add(threshold)
                                 self.on_deck_sent[war_tag] = sorted(list(sent_set))
             except Exception:
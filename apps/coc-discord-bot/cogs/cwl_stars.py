@@ -15,6 +15,7 @@ from discord import app_commands
 from discord.ext import commands, tasks
 import config
 import database_optimized as database
+import war_analytics
 import logging
 import asyncio
 
@@ -379,6 +380,18 @@ class CWLStarsCog(commands.Cog):
                 await interaction.followup.send("❌ Failed to fetch CWL wars. Check if clan is in CWL or try again later.")
                 return
             
+            # Keep every attack for analytics (already stored attacks are skipped)
+            try:
+                rows = []
+                for war in wars:
+                    rows.extend(war_analytics.attack_rows(
+                        war.get('war_tag'), war.get('round'), war.get('start_time'),
+                        war.get('clan_data', {}), war.get('opponent_data', {})
+                    ))
+                await asyncio.to_thread(war_analytics.record_attacks, rows)
+            except Exception as e:
+                logger.warning(f"Could not record war attacks for analytics: {e}")
+
             # Check which wars are new (not processed yet)
             new_wars = []
             already_processed = []
@@ -406,45 +419,27 @@ class CWLStarsCog(commands.Cog):
                 await interaction.followup.send("❌ No player data found in new CWL wars.")
                 return
             
-            # Get current database values to add to (not replace)
-            current_players = database.get_player_data()
-            current_cwl_data = {p.get('tag'): {
-                'cwl_stars': p.get('cwl_stars', 0),
-                'missed_attacks': p.get('missed_attacks', 0)
-            } for p in current_players}
-            
-            # Update database with incremental data
-            updated_count = 0
+            # Ensure a row exists for each player tag (create minimal if missing)
             for tag, player_data in player_stars.items():
                 try:
-                    # Ensure a row exists for this player tag (create minimal if missing)
-                    try:
-                        database.ensure_player_exists_by_tag(tag, player_data.get('name'))
-                    except Exception as ensure_err:
-                        logger.warning(f"Could not ensure player exists for {tag}: {ensure_err}")
-
-                    # Add new stars and missed attacks to existing totals
-                    current_stars = current_cwl_data.get(tag, {}).get('cwl_stars', 0)
-                    current_missed = current_cwl_data.get(tag, {}).get('missed_attacks', 0)
-                    
-                    new_total_stars = current_stars + player_data['total_stars']
-                    new_total_missed = current_missed + player_data['missed_attacks']
-                    
-                    # Update player's CWL data in database
-                    database.update_player_cwl_data(tag, new_total_stars, new_total_missed, player_name=player_data.get('name'))
-                    updated_count += 1
-                    
-                    logger.info(f"Updated {player_data['name']} ({tag}): "
-                              f"{new_total_stars} total stars (+{player_data['total_stars']}), "
-                              f"{new_total_missed} total missed (+{player_data['missed_attacks']})")
-                except Exception as e:
-                    logger.error(f"Failed to update player {tag}: {e}")
+                    database.ensure_player_exists_by_tag(tag, player_data.get('name'))
+                except Exception as ensure_err:
+                    logger.warning(f"Could not ensure player exists for {tag}: {ensure_err}")
+            
+            # Mark the wars processed and add their stars in one transaction, so a
+            # failure leaves them unprocessed and concurrent runs never add them twice
+            totals = database.apply_cwl_war_stars([w['war_tag'] for w in new_wars], player_stars)
+            if totals is None:
+                await interaction.followup.send(
+                    "⚠️ These wars were just processed by another run. No stars were added; run the command again to refresh."
+                )
+                return
             
-            # Mark wars as processed
-            for war in new_wars:
-                war_tag = war.get('war_tag', '')
-                if war_tag:
-                    database.mark_war_processed(war_tag)
+            updated_count = len(totals)
+            for tag, player_data in player_stars.items():
+                logger.info(f"Updated {player_data['name']} ({tag}): "
+                          f"{totals[tag]['cwl_stars']} total stars (+{player_data['total_stars']}), "
+                          f"{totals[tag]['missed_attacks']} total missed (+{player_data['missed_attacks']})")
             
             # Send detailed war-by-war results for new wars only
             if new_wars:
@@ -7,6 +7,7 @@ from typing import Dict, Set, Optional, List
 
 import config
 import database_optimized as database
+from leader_election import get_elector, INSTANCE_ID
 from cogs.roster import fetch_clan_members
 import requests
 
@@ -17,6 +18,8 @@ ANNOUNCE_CHANNEL_ID: Optional[int] = getattr(config, 'CWL_REWARDS_CHANNEL_ID', N
 # Simple in-memory cache of last seen member tags
 _last_seen: Set[str] = set()
 
+LEADER_ROLE = "new_member_watcher"
+
 class NewMemberWatcher(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
@@ -29,10 +32,14 @@ class NewMemberWatcher(commands.Cog):
             self._task.cancel()
         except Exception:
             pass
+        await get_elector().release(LEADER_ROLE)
 
     @tasks.loop(minutes=5)
     async def poll_for_new_members(self):
         await self.bot.wait_until_ready()
+        # Only the elected replica announces joins
+        if not await get_elector().is_leader(LEADER_ROLE):
+            return
         # Load current members from API
         members: List[Dict] = fetch_clan_members()
         if not members:
@@ -61,6 +68,9 @@ class NewMemberWatcher(commands.Cog):
                 m = next((mm for mm in members if str(mm.get('tag','')).upper() == tag), None)
                 if not m:
                     continue
+                # Guard against a previous leader having announced this join already
+                if not await asyncio.to_thread(database.claim_event, f"member_join:{tag}", INSTANCE_ID):
+                    continue
                 await self.announce_new_member(m)
             except Exception as e:
                 logger.warning(f"Failed to announce new member {tag}: {e}")
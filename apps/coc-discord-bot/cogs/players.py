@@ -9,7 +9,7 @@ import config
 import database_optimized as database
 from config import is_leader_or_admin
 from utils import has_any_role_id, is_admin, is_admin_leader_co_leader, is_newbie, format_last_bonus, days_ago
-from utils_supercell import get_player_clan_history, get_player_profile
+import profile_store
 
 MAX_MESSAGE_CHUNK_LENGTH = 1900
 
@@ -84,7 +84,9 @@ class PlayersCog(commands.Cog):
         clean_tag = tag.replace('#','') if tag else ''
         cos_url = f"https://www.clashofstats.com/players/{name}-{clean_tag}" if clean_tag else None
 
-        profile = get_player_profile(tag) if tag else None
+        # Served from the profile snapshot store; stale entries refresh in the background
+        snapshot = await profile_store.get_snapshot(tag) if tag else None
+        summary = snapshot['summary'] if snapshot else None
 
         # Top line: Name (link to COS)
         title_name = f"[{name} {tag}]({cos_url})" if cos_url else f"{name} {tag or ''}"
@@ -93,9 +95,9 @@ class PlayersCog(commands.Cog):
 
         # Role, League, TH with weapon
         role = player.get('role') or 'Member'
-        league = profile.get('league', {}).get('name') if profile else None
-        town_hall = profile.get('townHallLevel') if profile else None
-        th_weapon = profile.get('townHallWeaponLevel') if profile else None
+        league = summary.get('league') if summary else None
+        town_hall = summary.get('town_hall') if summary else None
+        th_weapon = summary.get('th_weapon') if summary else None
         line2 = f"{role}"
         if league:
             line2 += f" | {league}"
@@ -104,39 +106,25 @@ class PlayersCog(commands.Cog):
         embed.add_field(name="Role · League · Town Hall", value=line2, inline=False)
 
         # Heroes current|max
-        def hero_level(name_key: str):
-            if not profile:
-                return None, None
-            for h in profile.get('heroes', []) or []:
-                if h.get('name') == name_key:
-                    return h.get('level'), h.get('maxLevel')
-            return None, None
-        hero_names = ["Barbarian King","Archer Queen","Grand Warden","Royal Champion","Battle Machine"]
+        hero_emojis = {
+            "Barbarian King":"🛡️",
+            "Archer Queen":"🏹",
+            "Grand Warden":"🧙",
+            "Royal Champion":"🏇",
+            "Battle Machine":"🤖",
+        }
         hero_lines = []
-        for hn in hero_names:
-            cur, mx = hero_level(hn)
-            if cur is not None:
-                emoji = {
-                    "Barbarian King":"🛡️",
-                    "Archer Queen":"🏹",
-                    "Grand Warden":"🧙",
-                    "Royal Champion":"🏇",
-                    "Battle Machine":"🤖",
-                }.get(hn, "⭐")
-                hero_lines.append(f"{emoji} {hn}: {cur}{'|'+str(mx) if mx else ''}")
+        for h in (summary.get('heroes', []) if summary else []):
+            mx = h.get('max_level')
+            hero_lines.append(f"{hero_emojis.get(h['name'], '⭐')} {h['name']}: {h['level']}{'|'+str(mx) if mx else ''}")
         if hero_lines:
             embed.add_field(name="Heroes (current|max)", value=" | ".join(hero_lines), inline=False)
 
         # Progress metrics (counts based on profiles arrays lengths)
-        def count_progress(key: str):
-            if not profile:
-                return None
-            items = profile.get(key, []) or []
-            maxed = sum(1 for it in items if it.get('level') == it.get('maxLevel'))
-            return maxed, len(items)
-        heroes_prog = (sum(1 for h in (profile.get('heroes', []) or []) if h.get('level')==h.get('maxLevel')), len(profile.get('heroes', []) or [])) if profile else (None,None)
-        troops_prog = count_progress('troops')
-        spells_prog = count_progress('spells')
+        progress = summary.get('progress', {}) if summary else {}
+        heroes_prog = progress.get('heroes') or (None, None)
+        troops_prog = progress.get('troops')
+        spells_prog = progress.get('spells')
         def fmt_prog(t):
             if not t or t[0] is None:
                 return "N/A"
@@ -153,8 +141,8 @@ class PlayersCog(commands.Cog):
         embed.add_field(name="Progress", value=" | ".join(pm_lines), inline=False)
 
         # XP and War Stars
-        xp = profile.get('expLevel') if profile else player.get('xp_level')
-        stars = profile.get('warStars') if profile else player.get('war_stars')
+        xp = summary.get('xp') if summary else player.get('xp_level')
+        stars = summary.get('war_stars') if summary else player.get('war_stars')
         embed.add_field(name="XP · War Stars", value=f"{xp or 'N/A'} · {stars or 'N/A'}", inline=False)
 
         # Notes and Join Date
@@ -165,12 +153,14 @@ class PlayersCog(commands.Cog):
             footer_bits.append(f"Joined: {join_date}")
         if notes:
             footer_bits.append(f"Notes: {notes}")
+        if snapshot:
+            footer_bits.append(f"Profile: {profile_store.snapshot_age_text(snapshot)}")
         if footer_bits:
             embed.set_footer(text=" | ".join(footer_bits))
 
         # Last 5 clans and avg days
         avg_days = 0
-        history = get_player_clan_history(tag) if tag else []
+        history = summary.get('clan_history', []) if summary else []
         if history:
             days_list = [c['days_in_clan'] for c in history if c['days_in_clan'] > 0]
             if days_list:
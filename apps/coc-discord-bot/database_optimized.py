@@ -22,7 +22,7 @@ DB_FILE = getattr(config, 'DB_PATH', None)
 # Set up logger
 logger = logging.getLogger(__name__)
 
-print(f"[DATABASE] Using PostgreSQL database: {DB_FILE}")
+logger.debug("Using PostgreSQL database")
 
 # Initialize performance optimizer
 _perf_optimizer = None
@@ -34,7 +34,7 @@ def get_optimized_connection():
         _perf_optimizer = get_performance_optimizer()
     # If performance optimizer is still None or doesn't have db_pool, fall back to regular connection
     if _perf_optimizer is None or not hasattr(_perf_optimizer, 'db_pool') or _perf_optimizer.db_pool is None:
-        print(f"[DATABASE] Performance optimizer not available, using regular Postgres connection")
+        logger.debug("Performance optimizer not available, using regular Postgres connection")
         return psycopg2.connect(config.DB_PATH, cursor_factory=psycopg2.extras.RealDictCursor)
     return _perf_optimizer.db_pool.get_connection()
 
@@ -1251,7 +1251,7 @@ def clear_missed_attacks_history_for_month(year, month):
 @performance_decorator("database.initialize_database")
 def initialize_database():
     """Initialize database and create all required tables"""
-    print("[DATABASE] Initializing database and creating tables...")
+    logger.info("Initializing database and creating tables...")
     with get_optimized_connection() as conn:
         cur = conn.cursor()
         
@@ -1268,7 +1268,7 @@ def initialize_database():
             )
         """)
         conn.commit()
-        print("[DATABASE] Database initialization complete")
+        logger.info("Database initialization complete")
 
 def save_cwl_season_snapshot(season_year=None, season_month=None):
     """Save current CWL stats as historical snapshot before reset"""
@@ -1304,11 +1304,11 @@ def save_cwl_season_snapshot(season_year=None, season_month=None):
             WHERE (inactive IS FALSE OR inactive IS NULL) 
             AND (COALESCE(cwl_stars, 0) > 0 OR COALESCE(missed_attacks, 0) > 0)
         """
-        print(f"DEBUG: Executing query: {query}")
+        logger.debug(f"Executing query: {query}")
         cur.execute(query)
         
         fetched_rows = cur.fetchall()
-        print(f"DEBUG: Found {len(fetched_rows)} players with CWL data")
+        logger.debug(f"Found {len(fetched_rows)} players with CWL data")
         # Normalize rows to dictionaries regardless of cursor type
         cols = [desc[0] for desc in cur.description] if cur.description else []
         players_data: List[Dict[str, Any]] = []
@@ -1327,30 +1327,30 @@ def save_cwl_season_snapshot(season_year=None, season_month=None):
         # Save each player's season stats to history
         for i, player in enumerate(players_data):
             try:
-                print(f"DEBUG: Processing player {i+1}: {player}")
+                logger.debug(f"Processing player {i+1}: {player}")
                 name = player.get('name')
                 tag = player.get('tag')
                 stars = player.get('cwl_stars', 0) or 0
                 missed = player.get('missed_attacks', 0) or 0
-                print(f"DEBUG: Player data: name={name}, tag={tag}, stars={stars}, missed={missed}")
+                logger.debug(f"Player data: name={name}, tag={tag}, stars={stars}, missed={missed}")
                 cur.execute("""
                     INSERT INTO cwl_history 
                     (season_year, season_month, reset_date, player_name, player_tag, cwl_stars, missed_attacks)
                     VALUES (%s, %s, NOW(), %s, %s, %s, %s)
                 """, (season_year, season_month, name, tag, stars, missed))
                 saved_count += 1
-                print(f"DEBUG: Successfully saved player {name}")
+                logger.debug(f"Successfully saved player {name}")
             except Exception as insert_error:
-                print(f"DEBUG: Error saving player {i+1}: {insert_error}")
+                logger.error(f"Error saving player {i+1}: {insert_error}")
                 raise insert_error
         
-    print(f"DEBUG: About to commit with saved_count = {saved_count}")
+    logger.debug(f"About to commit with saved_count = {saved_count}")
     conn.commit()
         
-    print(f"DEBUG: Building return dict...")
+    logger.debug("Building return dict...")
     total_stars = sum(int(p.get('cwl_stars', 0) or 0) for p in players_data) if players_data else 0
     total_missed = sum(int(p.get('missed_attacks', 0) or 0) for p in players_data) if players_data else 0
-    print(f"DEBUG: total_stars={total_stars}, total_missed={total_missed}")
+    logger.debug(f"total_stars={total_stars}, total_missed={total_missed}")
         
     return {
             'season_year': season_year,
@@ -1531,6 +1531,37 @@ def update_player_cwl_data(player_tag, total_stars, missed_attacks, player_name:
         conn.commit()
         logger.info(f"Updated player {norm_tag or player_name}: {total_stars} CWL stars, {missed_attacks} missed attacks")
 
+def _add_cwl_data(cur, norm_tag, stars: int, missed_attacks: int, player_name: Optional[str] = None) -> Dict[str, int]:
+    """Increment one player's CWL totals on an open cursor; returns the new totals (zeros if no match)."""
+    cur.execute(
+        """
+        UPDATE players
+        SET cwl_stars = COALESCE(cwl_stars, 0) + %s,
+            missed_attacks = COALESCE(missed_attacks, 0) + %s
+        WHERE LOWER(tag) = LOWER(%s)
+        RETURNING cwl_stars, missed_attacks
+        """,
+        (stars, missed_attacks, norm_tag)
+    )
+    row = cur.fetchone()
+    if row is None and player_name:
+        cur.execute(
+            """
+            UPDATE players
+            SET cwl_stars = COALESCE(cwl_stars, 0) + %s,
+                missed_attacks = COALESCE(missed_attacks, 0) + %s
+            WHERE LOWER(name) = LOWER(%s)
+            RETURNING cwl_stars, missed_attacks
+            """,
+            (stars, missed_attacks, player_name)
+        )
+        row = cur.fetchone()
+    if row is None:
+        return {'cwl_stars': 0, 'missed_attacks': 0}
+    if isinstance(row, dict):
+        return {'cwl_stars': int(row['cwl_stars']), 'missed_attacks': int(row['missed_attacks'])}
+    return {'cwl_stars': int(row[0]), 'missed_attacks': int(row[1])}
+
 @performance_decorator("database.increment_player_missed_by_tag")
 def increment_player_missed_by_tag(tag: str, by: int = 1) -> int:
     """Increment missed_attacks for a player by tag, returning new count."""
@@ -1658,3 +1689,101 @@ def count_processed_wars(season_id: Optional[str] = None) -> int:
         logger.error(f"Error counting processed wars: {e}")
         return 0
 
+
+
+def apply_cwl_war_stars(war_tags, player_stars, season_id=None) -> Optional[Dict[str, Dict[str, int]]]:
+    """Mark wars processed and add their players' stars in one transaction.
+
+    player_stars maps tag -> {'name', 'total_stars', 'missed_attacks'} summed
+    over war_tags. If any war was already processed (by an earlier run or
+    another replica) nothing is changed and None is returned; if an update
+    fails the claims roll back with it, so the wars can be retried.
+    Returns the new totals per tag otherwise.
+    """
+    create_processed_wars_table()
+    with get_optimized_connection() as conn:
+        cur = conn.cursor()
+        try:
+            for war_tag in war_tags:
+                # Concurrent claimers block on the unique index until this transaction ends
+                cur.execute("""
+                    INSERT INTO processed_wars (war_tag, season_id, processed_at)
+                    VALUES (%s, %s, NOW())
+                    ON CONFLICT (war_tag, COALESCE(season_id, '')) DO NOTHING
+                    RETURNING war_tag
+                """, (war_tag, season_id))
+                if cur.fetchone() is None:
+                    conn.rollback()
+                    logger.info(f"War {war_tag} was already processed; no stars added")
+                    return None
+            totals = {}
+            for tag, data in player_stars.items():
+                totals[tag] = _add_cwl_data(cur, _normalize_tag(tag), data['total_stars'],
+                                            data['missed_attacks'], data.get('name'))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    logger.info(f"Processed wars {', '.join(war_tags)}: updated {len(totals)} players")
+    return totals
+
+
+_processed_events_ready = False
+
+
+def create_processed_events_table():
+    """Create the processed_events table if it doesn't exist"""
+    global _processed_events_ready
+    if _processed_events_ready:
+        return
+    with get_optimized_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS processed_events (
+                event_key TEXT PRIMARY KEY,
+                claimed_by TEXT,
+                claimed_at TIMESTAMP DEFAULT NOW()
+            )
+        """)
+        conn.commit()
+    _processed_events_ready = True
+
+
+def claim_event(event_key: str, claimed_by: Optional[str] = None) -> bool:
+    """Record a one-off side effect (notification, announcement) by key.
+
+    Returns True if this call claimed the key and the caller should perform
+    the side effect, False if it was already claimed by any replica.
+    """
+    try:
+        create_processed_events_table()
+        with get_optimized_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO processed_events (event_key, claimed_by)
+                VALUES (%s, %s)
+                ON CONFLICT (event_key) DO NOTHING
+                RETURNING event_key
+            """, (event_key, claimed_by))
+            claimed = cur.fetchone() is not None
+            conn.commit()
+            return claimed
+    except Exception as e:
+        # Prefer a possible duplicate message over silently dropping one
+        logger.error(f"Error claiming event {event_key}: {e}")
+        return True
+
+
+@performance_decorator("database.prune_processed_events")
+def prune_processed_events(older_than_days: int = 60) -> int:
+    """Delete old event claims; returns the number of rows removed"""
+    create_processed_events_table()
+    with get_optimized_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "DELETE FROM processed_events WHERE claimed_at < NOW() - (%s * INTERVAL '1 day')",
+            (older_than_days,),
+        )
+        deleted = cur.rowcount
+        conn.commit()
+        return deleted
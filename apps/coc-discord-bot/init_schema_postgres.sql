@@ -49,7 +49,14 @@ CREATE TABLE IF NOT EXISTS war_attacks (
     stars INTEGER,
     destruction_percentage DOUBLE PRECISION,
     attack_time TIMESTAMP,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    season TEXT,
+    round_num INTEGER,
+    war_start TIMESTAMP,
+    attacker_position INTEGER,
+    attacker_th INTEGER,
+    defender_position INTEGER,
+    defender_th INTEGER
 );
 
 CREATE TABLE IF NOT EXISTS bonus_history (
@@ -93,6 +100,29 @@ CREATE TABLE IF NOT EXISTS discord_coc_links (
     linked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE TABLE IF NOT EXISTS processed_wars (
+    id SERIAL PRIMARY KEY,
+    war_tag VARCHAR(50) NOT NULL,
+    season_id VARCHAR(50),
+    processed_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Idempotency keys for notifications sent by whichever replica is leader
+CREATE TABLE IF NOT EXISTS processed_events (
+    event_key TEXT PRIMARY KEY,
+    claimed_by TEXT,
+    claimed_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Last fetched Supercell profile per player (see profile_store.py)
+CREATE TABLE IF NOT EXISTS player_profiles (
+    tag TEXT PRIMARY KEY,
+    profile JSONB NOT NULL,
+    summary JSONB NOT NULL,
+    profile_hash TEXT NOT NULL,
+    fetched_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
 -- Indexes for performance
 CREATE INDEX IF NOT EXISTS idx_players_name ON players(name);
 CREATE INDEX IF NOT EXISTS idx_players_tag ON players(tag);
@@ -112,3 +142,7 @@ CREATE INDEX IF NOT EXISTS idx_cwl_history_player_name ON cwl_history(player_nam
 CREATE INDEX IF NOT EXISTS idx_cwl_stars_history_player_name ON cwl_stars_history(player_name);
 CREATE INDEX IF NOT EXISTS idx_cwl_stars_history_war_date ON cwl_stars_history(war_date);
 CREATE INDEX IF NOT EXISTS idx_discord_links_discord_id ON discord_coc_links(discord_id);
+CREATE UNIQUE INDEX IF NOT EXISTS processed_wars_unique_idx ON processed_wars (war_tag, COALESCE(season_id, ''));
+CREATE INDEX IF NOT EXISTS idx_processed_events_claimed_at ON processed_events(claimed_at);
+CREATE UNIQUE INDEX IF NOT EXISTS war_attacks_unique_idx ON war_attacks (war_tag, player_tag, attack_order);
+CREATE INDEX IF NOT EXISTS idx_war_attacks_season ON war_attacks(season);
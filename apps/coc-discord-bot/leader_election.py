@@ -0,0 +1,144 @@
+"""
+Leader Election
+Postgres advisory-lock based leader election so several bot replicas can run
+side by side (e.g. during zero-downtime deploys) while only one of them drives
+the periodic pollers. No extra service is needed: the locks live in the same
+Postgres database the bot already uses.
+
+Each named role (``"cwl_polling"``, ``"new_member_watcher"`` ...) maps to a
+session-level advisory lock held on one dedicated connection. If the leader
+process dies its connection drops, Postgres releases the locks, and a standby
+picks them up on its next heartbeat.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+import threading
+from typing import Optional, Set
+
+import psycopg2
+
+import config
+
+logger = logging.getLogger("leader_election")
+
+# How often standbys retry the locks and the leader checks its connection
+HEARTBEAT_SECONDS = float(os.getenv("LEADER_HEARTBEAT_SECONDS", "5"))
+# Identifies this replica in logs and in pg_stat_activity
+INSTANCE_ID = os.getenv("BOT_INSTANCE_ID") or f"{socket.gethostname()}:{os.getpid()}"
+
+
+def lock_key(name: str) -> int:
+    """Stable signed 64-bit advisory lock key for a role name"""
+    digest = hashlib.sha1(f"coc-discord-bot:{name}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+class LeaderElector:
+    """Holds advisory locks for the roles this replica is leader of"""
+
+    def __init__(self, dsn: Optional[str] = None, heartbeat_seconds: float = HEARTBEAT_SECONDS):
+        self.dsn = dsn or config.DB_PATH
+        self.heartbeat_seconds = heartbeat_seconds
+        self._conn = None
+        self._io_lock = threading.Lock()
+        self._roles: Set[str] = set()
+        self._held: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def _connect(self):
+        conn = psycopg2.connect(
+            self.dsn,
+            application_name=f"coc-bot-leader {INSTANCE_ID}"[:63],
+            connect_timeout=5,
+            # Detect a dead peer quickly so a hung leader loses its locks
+            keepalives=1,
+            keepalives_idle=10,
+            keepalives_interval=5,
+            keepalives_count=3,
+        )
+        conn.autocommit = True
+        return conn
+
+    def _close(self):
+        try:
+            if self._conn is not None:
+                self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+    def _heartbeat(self):
+        """One election round: verify the session, then try any unheld locks"""
+        with self._io_lock:
+            try:
+                if self._conn is None or self._conn.closed:
+                    self._held.clear()
+                    self._conn = self._connect()
+                cur = self._conn.cursor()
+                cur.execute("SELECT 1")
+                for role in sorted(self._roles - self._held):
+                    cur.execute("SELECT pg_try_advisory_lock(%s)", (lock_key(role),))
+                    row = cur.fetchone()
+                    if row and row[0]:
+                        self._held.add(role)
+                        logger.info(f"{INSTANCE_ID} is now leader for '{role}'")
+            except psycopg2.Error as e:
+                if self._held:
+                    logger.warning(f"{INSTANCE_ID} lost leadership for {sorted(self._held)}: {e}")
+                else:
+                    logger.debug(f"Leader heartbeat failed: {e}")
+                self._held.clear()
+                self._close()
+
+    async def _run(self):
+        while True:
+            await asyncio.to_thread(self._heartbeat)
+            await asyncio.sleep(self.heartbeat_seconds)
+
+    def start(self):
+        """Start the background heartbeat on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def is_leader(self, role: str) -> bool:
+        """Return True if this replica currently leads ``role``.
+
+        The first call for a role registers it and runs an election round
+        immediately, so a poller's first tick does not have to wait for the
+        heartbeat.
+        """
+        if role not in self._roles:
+            self._roles.add(role)
+            await asyncio.to_thread(self._heartbeat)
+        self.start()
+        return role in self._held
+
+    async def release(self, role: Optional[str] = None):
+        """Give up one role (or all of them) so a standby can take over"""
+        def _release():
+            with self._io_lock:
+                roles = [role] if role else list(self._held)
+                for r in roles:
+                    self._roles.discard(r)
+                    if r in self._held and self._conn is not None and not self._conn.closed:
+                        try:
+                            self._conn.cursor().execute("SELECT pg_advisory_unlock(%s)", (lock_key(r),))
+                        except psycopg2.Error:
+                            pass
+                    self._held.discard(r)
+        await asyncio.to_thread(_release)
+
+
+_elector: Optional[LeaderElector] = None
+
+
+def get_elector() -> LeaderElector:
+    """Process-wide elector shared by all cogs"""
+    global _elector
+    if _elector is None:
+        _elector = LeaderElector()
+    return _elector
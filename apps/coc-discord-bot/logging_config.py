@@ -1,44 +1,152 @@
 import logging
+import logging.handlers
 import sys
-from datetime import datetime
+from datetime import datetime, timezone
 import os
 import time
+import json
+import gzip
+import glob
+import queue
+import atexit
+import shutil
 import functools
 
+# Tunables (override via environment)
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # 'text' or 'json' for the console
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "14"))
+
+# Fields that callers may attach via ``extra=`` and that end up as JSON keys
+STRUCTURED_FIELDS = ("command", "cog", "duration_ms", "guild_id", "user_id", "task")
+
+# The single listener that owns all blocking handlers (console + file)
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Render a record as one JSON object per line"""
+
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                payload[field] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotate on size or at local midnight, gzip-compressing rolled files.
+
+    Rolled files are named ``<base>.<YYYYmmdd-HHMMSS>.gz`` and only the newest
+    ``backupCount`` archives are kept.
+    """
+
+    def __init__(self, filename, maxBytes=0, backupCount=0, encoding="utf-8"):
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount, encoding=encoding, delay=True)
+        self._current_day = datetime.now().date()
+
+    def shouldRollover(self, record):
+        if datetime.now().date() != self._current_day:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            target = f"{self.baseFilename}.{stamp}.gz"
+            seq = 1
+            while os.path.exists(target):
+                target = f"{self.baseFilename}.{stamp}-{seq}.gz"
+                seq += 1
+            with open(self.baseFilename, "rb") as src, gzip.open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(self.baseFilename)
+        if self.backupCount > 0:
+            archives = sorted(glob.glob(f"{self.baseFilename}.*.gz"))
+            for old in archives[:-self.backupCount]:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+        self._current_day = datetime.now().date()
+        self.stream = self._open()
+
+
 def setup_logging():
-    """Set up logging configuration"""
+    """Set up logging configuration.
+
+    All records go through a ``QueueHandler`` on the root logger; a background
+    ``QueueListener`` thread does the actual console/file I/O so logging never
+    blocks the event loop. Safe to call more than once.
+    """
+    global _listener
+    logger = logging.getLogger()
+    if _listener is not None:
+        return logger
+
     # Create logs directory if it doesn't exist
     try:
-        os.makedirs("logs", exist_ok=True)
+        os.makedirs(LOG_DIR, exist_ok=True)
         log_to_file = True
     except PermissionError:
         print("Warning: Cannot create logs directory, logging to console only")
         log_to_file = False
-    
-    # Create formatter
-    formatter = logging.Formatter(
+
+    # Create formatters
+    text_formatter = logging.Formatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
-    
-    # Set up root logger
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
-    
+    json_formatter = JsonFormatter()
+
     # Console handler
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-    
-    # File handler (only if we can write to logs directory)
+    console_handler.setFormatter(json_formatter if LOG_FORMAT == "json" else text_formatter)
+    handlers = [console_handler]
+
+    # File handler (only if we can write to logs directory); always structured
     if log_to_file:
-        file_handler = logging.FileHandler(
-            f"logs/bot_{datetime.now().strftime('%Y%m%d')}.log"
+        file_handler = CompressingRotatingFileHandler(
+            os.path.join(LOG_DIR, "bot.log"),
+            maxBytes=LOG_MAX_BYTES,
+            backupCount=LOG_BACKUP_COUNT,
         )
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-    
+        file_handler.setFormatter(json_formatter)
+        handlers.append(file_handler)
+
+    # Set up root logger with a single non-blocking queue handler
+    log_queue = queue.SimpleQueue()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
     return logger
 
+def shutdown_logging():
+    """Flush queued records and stop the background listener"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
 def get_logger(name):
     """Get a logger with the specified name"""
     return logging.getLogger(name)
@@ -47,15 +155,37 @@ def log_exception(logger, message, exception):
     """Log an exception with details"""
     logger.error(f"{message}: {exception}", exc_info=True)
 
+def log_command(logger, interaction, duration_ms=None, error=None):
+    """Log a finished app command with structured command/cog/duration fields"""
+    command = getattr(interaction, "command", None)
+    binding = getattr(command, "binding", None)
+    cog = binding.__class__.__name__ if binding is not None else None
+    name = getattr(command, "qualified_name", None)
+    if duration_ms is None and getattr(interaction, "created_at", None):
+        duration_ms = round((datetime.now(timezone.utc) - interaction.created_at).total_seconds() * 1000, 1)
+    extra = {
+        "command": name,
+        "cog": cog,
+        "duration_ms": duration_ms,
+        "guild_id": getattr(interaction, "guild_id", None),
+        "user_id": getattr(getattr(interaction, "user", None), "id", None),
+    }
+    if error is not None:
+        logger.error(f"/{name} failed after {duration_ms}ms: {error}", extra=extra,
+                     exc_info=(type(error), error, error.__traceback__))
+    else:
+        logger.info(f"/{name} completed in {duration_ms}ms", extra=extra)
+
 def log_performance(func):
     """Decorator to log function performance"""
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.time()
+        start_time = time.perf_counter()
         result = func(*args, **kwargs)
-        end_time = time.time()
+        duration_ms = round((time.perf_counter() - start_time) * 1000, 1)
         logger = get_logger(func.__module__)
-        logger.info(f"{func.__name__} executed in {end_time - start_time:.2f} seconds")
+        logger.info(f"{func.__name__} executed in {duration_ms / 1000:.2f} seconds",
+                    extra={"task": func.__qualname__, "duration_ms": duration_ms})
         return result
     return wrapper
 
@@ -63,10 +193,11 @@ def log_performance_async(func):
     """Decorator to log async function performance"""
     @functools.wraps(func)
     async def wrapper(*args, **kwargs):
-        start_time = time.time()
+        start_time = time.perf_counter()
         result = await func(*args, **kwargs)
-        end_time = time.time()
+        duration_ms = round((time.perf_counter() - start_time) * 1000, 1)
         logger = get_logger(func.__module__)
-        logger.info(f"{func.__name__} executed in {end_time - start_time:.2f} seconds")
+        logger.info(f"{func.__name__} executed in {duration_ms / 1000:.2f} seconds",
+                    extra={"task": func.__qualname__, "duration_ms": duration_ms})
         return result
     return wrapper
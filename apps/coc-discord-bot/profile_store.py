@@ -0,0 +1,214 @@
+"""
+Player Profile Store
+Snapshot cache of Supercell player profiles for /who_is and friends.
+
+The last fetched profile per tag is persisted in Postgres together with its
+fetch time and a precomputed summary (hero levels, progress counts, clan
+history). Lookups are served from the snapshot immediately; stale snapshots
+are refreshed in the background so repeated lookups cost no API quota.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Set
+
+import psycopg2.extras
+
+from database_optimized import get_optimized_connection
+from utils_supercell import get_player_profile, clan_history_from_profile
+
+logger = logging.getLogger("profile_store")
+
+# Snapshots younger than this are served without a background refresh
+PROFILE_TTL_SECONDS = int(os.getenv("PROFILE_TTL_SECONDS", str(30 * 60)))
+
+HERO_NAMES = ["Barbarian King", "Archer Queen", "Grand Warden", "Royal Champion", "Battle Machine"]
+
+# In-process layer in front of the table: tag -> snapshot dict
+_memory: Dict[str, Dict[str, Any]] = {}
+_refreshing: Set[str] = set()
+_background: Set[asyncio.Task] = set()
+_table_ready = False
+
+
+def _norm(tag: str) -> str:
+    tag = (tag or "").strip().upper()
+    return tag if tag.startswith("#") or not tag else f"#{tag}"
+
+
+def _progress(items) -> list:
+    items = items or []
+    maxed = sum(1 for it in items if it.get('level') == it.get('maxLevel'))
+    return [maxed, len(items)]
+
+
+def summarize_profile(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Derive everything /who_is displays from a raw profile in one pass"""
+    heroes = {h.get('name'): h for h in profile.get('heroes', []) or []}
+    return {
+        'league': (profile.get('league') or {}).get('name'),
+        'town_hall': profile.get('townHallLevel'),
+        'th_weapon': profile.get('townHallWeaponLevel'),
+        'xp': profile.get('expLevel'),
+        'war_stars': profile.get('warStars'),
+        'heroes': [
+            {'name': name, 'level': heroes[name].get('level'), 'max_level': heroes[name].get('maxLevel')}
+            for name in HERO_NAMES if name in heroes and heroes[name].get('level') is not None
+        ],
+        'progress': {
+            'heroes': _progress(profile.get('heroes')),
+            'troops': _progress(profile.get('troops')),
+            'spells': _progress(profile.get('spells')),
+        },
+        'clan_history': clan_history_from_profile(profile),
+    }
+
+
+def _hash(profile: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(profile, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _ensure_table():
+    global _table_ready
+    if _table_ready:
+        return
+    with get_optimized_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS player_profiles (
+                tag TEXT PRIMARY KEY,
+                profile JSONB NOT NULL,
+                summary JSONB NOT NULL,
+                profile_hash TEXT NOT NULL,
+                fetched_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+        """)
+        conn.commit()
+    _table_ready = True
+
+
+def _load(tag: str) -> Optional[Dict[str, Any]]:
+    _ensure_table()
+    with get_optimized_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT profile, summary, profile_hash, fetched_at FROM player_profiles WHERE tag = %s",
+            (tag,),
+        )
+        row = cur.fetchone()
+    if not row:
+        return None
+    if not isinstance(row, dict):
+        row = dict(zip(("profile", "summary", "profile_hash", "fetched_at"), row))
+    return {
+        'profile': row['profile'],
+        'summary': row['summary'],
+        'profile_hash': row['profile_hash'],
+        'fetched_at': row['fetched_at'].timestamp(),
+    }
+
+
+def _store(tag: str, profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Persist a freshly fetched profile; summary is only recomputed when it changed"""
+    digest = _hash(profile)
+    previous = _memory.get(tag)
+    if previous and previous['profile_hash'] == digest:
+        summary = previous['summary']
+    else:
+        summary = summarize_profile(profile)
+    _ensure_table()
+    with get_optimized_connection() as conn:
+        cur = conn.cursor()
+        if previous and previous['profile_hash'] == digest:
+            cur.execute("UPDATE player_profiles SET fetched_at = NOW() WHERE tag = %s", (tag,))
+        else:
+            cur.execute("""
+                INSERT INTO player_profiles (tag, profile, summary, profile_hash, fetched_at)
+                VALUES (%s, %s, %s, %s, NOW())
+                ON CONFLICT (tag) DO UPDATE SET
+                    profile = EXCLUDED.profile,
+                    summary = EXCLUDED.summary,
+                    profile_hash = EXCLUDED.profile_hash,
+                    fetched_at = EXCLUDED.fetched_at
+            """, (tag, psycopg2.extras.Json(profile), psycopg2.extras.Json(summary), digest))
+        conn.commit()
+    snapshot = {'profile': profile, 'summary': summary, 'profile_hash': digest, 'fetched_at': time.time()}
+    _memory[tag] = snapshot
+    return snapshot
+
+
+def _fetch_and_store(tag: str) -> Optional[Dict[str, Any]]:
+    profile = get_player_profile(tag)
+    if not profile:
+        return None
+    try:
+        return _store(tag, profile)
+    except Exception as e:
+        logger.warning(f"Could not persist profile snapshot for {tag}: {e}")
+        snapshot = {'profile': profile, 'summary': summarize_profile(profile),
+                    'profile_hash': _hash(profile), 'fetched_at': time.time()}
+        _memory[tag] = snapshot
+        return snapshot
+
+
+async def _refresh(tag: str):
+    try:
+        await asyncio.to_thread(_fetch_and_store, tag)
+    except Exception as e:
+        logger.warning(f"Background profile refresh failed for {tag}: {e}")
+    finally:
+        _refreshing.discard(tag)
+
+
+def schedule_refresh(tag: str):
+    """Refresh a tag in the background unless a refresh is already running"""
+    tag = _norm(tag)
+    if not tag or tag in _refreshing:
+        return
+    _refreshing.add(tag)
+    task = asyncio.get_running_loop().create_task(_refresh(tag))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def get_snapshot(tag: str) -> Optional[Dict[str, Any]]:
+    """Return the latest snapshot for a tag, fetching only if none exists.
+
+    The returned dict has ``profile``, ``summary`` and ``fetched_at`` (epoch
+    seconds). A stale snapshot is returned as-is and refreshed in the
+    background.
+    """
+    tag = _norm(tag)
+    if not tag:
+        return None
+    snapshot = _memory.get(tag)
+    if snapshot is None:
+        try:
+            snapshot = await asyncio.to_thread(_load, tag)
+        except Exception as e:
+            logger.warning(f"Could not load profile snapshot for {tag}: {e}")
+            snapshot = None
+        if snapshot is not None:
+            _memory[tag] = snapshot
+    if snapshot is None:
+        return await asyncio.to_thread(_fetch_and_store, tag)
+    if time.time() - snapshot['fetched_at'] > PROFILE_TTL_SECONDS:
+        schedule_refresh(tag)
+    return snapshot
+
+
+def snapshot_age_text(snapshot: Dict[str, Any]) -> str:
+    """Human readable age of a snapshot, e.g. '3m ago'"""
+    age = max(0, int(time.time() - snapshot['fetched_at']))
+    if age < 60:
+        return "just now"
+    if age < 3600:
+        return f"{age // 60}m ago"
+    if age < 86400:
+        return f"{age // 3600}h ago"
+    return datetime.fromtimestamp(snapshot['fetched_at'], tz=timezone.utc).strftime("%Y-%m-%d")
@@ -0,0 +1,364 @@
+"""
+War Analytics
+Columnar store and vectorised metrics over every CWL attack.
+
+Each attack is stored as one row in ``war_attacks`` (war, season, round,
+attacker, defender, map positions, town halls, stars, destruction, order and
+the time the attack was first observed). Per-player and per-season metrics
+are computed from those columns with NumPy in a single pass and cached per
+season against the season's (max id, row count), so leaderboard and bonus
+commands never recompute them per invocation and every replica notices the
+rows the polling leader inserts.
+"""
+
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import psycopg2.extras
+
+from database_optimized import get_optimized_connection
+
+logger = logging.getLogger("war_analytics")
+
+# Column order used for inserts and for the arrays returned by load_attack_columns
+COLUMNS = (
+    "war_tag", "season", "round_num", "war_start",
+    "player_tag", "player_name", "attacker_position", "attacker_th",
+    "defender_tag", "defender_position", "defender_th",
+    "stars", "destruction_percentage", "attack_order", "attack_time",
+)
+
+# Hours-into-battle-day buckets for the timing distribution
+TIMING_BINS = np.array([0, 4, 8, 12, 16, 20, 24], dtype=float)
+
+_table_ready = False
+_cache_lock = threading.Lock()
+_metrics_cache: Dict[Optional[str], Dict[str, Any]] = {}
+
+
+def _parse_coc_time(value: Optional[str]) -> Optional[datetime]:
+    """Parse CoC API timestamps like 20250105T123456.000Z"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value[:15], "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def ensure_attack_table():
+    """Create/extend war_attacks with the analytics columns and idempotency key"""
+    global _table_ready
+    if _table_ready:
+        return
+    with get_optimized_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS war_attacks (
+                id SERIAL PRIMARY KEY,
+                player_tag TEXT NOT NULL,
+                player_name TEXT NOT NULL,
+                war_tag TEXT NOT NULL,
+                attack_order INTEGER,
+                defender_tag TEXT,
+                stars INTEGER,
+                destruction_percentage DOUBLE PRECISION,
+                attack_time TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        for column, ddl in (
+            ("season", "TEXT"),
+            ("round_num", "INTEGER"),
+            ("war_start", "TIMESTAMP"),
+            ("attacker_position", "INTEGER"),
+            ("attacker_th", "INTEGER"),
+            ("defender_position", "INTEGER"),
+            ("defender_th", "INTEGER"),
+        ):
+            cur.execute(f"ALTER TABLE war_attacks ADD COLUMN IF NOT EXISTS {column} {ddl}")
+        cur.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS war_attacks_unique_idx
+            ON war_attacks (war_tag, player_tag, attack_order)
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_war_attacks_season ON war_attacks(season)")
+        conn.commit()
+    _table_ready = True
+
+
+def attack_rows(war_tag: str, round_num: Optional[int], start_time: Optional[str],
+                clan_data: Dict[str, Any], opponent_data: Dict[str, Any],
+                observed_at: Optional[datetime] = None) -> List[Tuple]:
+    """Flatten one war's attacks by our clan into rows in COLUMNS order.
+
+    ``observed_at`` is stored as attack_time; pass it from live polling so the
+    first time an attack is seen approximates when it happened. Backfills from
+    ended wars pass None.
+    """
+    war_start = _parse_coc_time(start_time)
+    season = war_start.strftime("%Y-%m") if war_start else None
+    defenders = {m.get('tag'): m for m in (opponent_data or {}).get('members', []) or []}
+    attack_time = observed_at.replace(tzinfo=None) if observed_at else None
+    rows = []
+    for member in (clan_data or {}).get('members', []) or []:
+        for attack in member.get('attacks', []) or []:
+            defender = defenders.get(attack.get('defenderTag'), {})
+            rows.append((
+                war_tag, season, round_num, war_start.replace(tzinfo=None) if war_start else None,
+                member.get('tag'), member.get('name', 'Unknown'),
+                member.get('mapPosition'), member.get('townhallLevel'),
+                attack.get('defenderTag'), defender.get('mapPosition'), defender.get('townhallLevel'),
+                attack.get('stars', 0), attack.get('destructionPercentage', 0), attack.get('order'),
+                attack_time,
+            ))
+    return rows
+
+
+def attack_keys(rows: Iterable[Tuple]) -> set:
+    """(player_tag, attack_order) of each row; what the poller remembers between polls"""
+    return {(r[4], r[13]) for r in rows}
+
+
+def rows_from_live_war(war_data: Dict[str, Any], clan_tag: str,
+                       observed_at: Optional[datetime] = None,
+                       previously_seen: Optional[set] = None) -> List[Tuple]:
+    """Rows for a raw /clanwarleagues/wars payload as seen by the CWL poller.
+
+    Only attacks missing from ``previously_seen`` (attack_keys of the previous
+    poll) are stamped with ``observed_at``. Without a previous poll (after a
+    restart or failover) nothing is stamped, since those attacks may be hours
+    old; the caller passes observed_at only while the war is in progress.
+    """
+    ours, theirs = war_data.get('clan', {}), war_data.get('opponent', {})
+    if theirs.get('tag') == clan_tag:
+        ours, theirs = theirs, ours
+    rows = attack_rows(war_data.get('warTag'), war_data.get('round'), war_data.get('startTime'),
+                       ours, theirs)
+    if observed_at is None or previously_seen is None:
+        return rows
+    stamp = observed_at.replace(tzinfo=None)
+    return [r[:-1] + (stamp,) if (r[4], r[13]) not in previously_seen else r for r in rows]
+
+
+def record_attacks(rows: Iterable[Tuple]) -> int:
+    """Insert attack rows, ignoring ones already stored. Returns rows inserted."""
+    rows = [r for r in rows if r[0] and r[4] and r[13] is not None]
+    if not rows:
+        return 0
+    ensure_attack_table()
+    with get_optimized_connection() as conn:
+        cur = conn.cursor()
+        inserted = psycopg2.extras.execute_values(
+            cur,
+            f"""
+            INSERT INTO war_attacks ({", ".join(COLUMNS)}) VALUES %s
+            ON CONFLICT (war_tag, player_tag, attack_order) DO NOTHING
+            RETURNING id
+            """,
+            rows,
+            fetch=True,
+        )
+        conn.commit()
+    count = len(inserted)
+    if count:
+        invalidate()
+        logger.info(f"Recorded {count} new war attacks")
+    return count
+
+
+def invalidate():
+    """Drop cached metrics; the next read recomputes them"""
+    with _cache_lock:
+        _metrics_cache.clear()
+
+
+def load_attack_columns(season: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """Load stored attacks as a dict of NumPy column arrays"""
+    ensure_attack_table()
+    query = f"SELECT {', '.join(COLUMNS)} FROM war_attacks"
+    params: Tuple = ()
+    if season:
+        query += " WHERE season = %s"
+        params = (season,)
+    with get_optimized_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        fetched = cur.fetchall()
+    records = [tuple(r[c] for c in COLUMNS) if isinstance(r, dict) else tuple(r) for r in fetched]
+    return columns_from_rows(records)
+
+
+def columns_from_rows(records: List[Tuple]) -> Dict[str, np.ndarray]:
+    """Transpose row tuples (COLUMNS order) into typed column arrays"""
+    transposed = list(zip(*records)) if records else [()] * len(COLUMNS)
+    raw = dict(zip(COLUMNS, transposed))
+
+    def ints(name):
+        return np.array([-1 if v is None else int(v) for v in raw[name]], dtype=np.int64)
+
+    def hours_into_war():
+        out = np.full(len(records), np.nan)
+        for i, (start, seen) in enumerate(zip(raw["war_start"], raw["attack_time"])):
+            if start is not None and seen is not None:
+                out[i] = (seen - start).total_seconds() / 3600.0
+        return out
+
+    return {
+        "war_tag": np.array(raw["war_tag"], dtype=object),
+        "season": np.array(raw["season"], dtype=object),
+        "player_tag": np.array(raw["player_tag"], dtype=object),
+        "player_name": np.array(raw["player_name"], dtype=object),
+        "round_num": ints("round_num"),
+        "attacker_position": ints("attacker_position"),
+        "attacker_th": ints("attacker_th"),
+        "defender_position": ints("defender_position"),
+        "defender_th": ints("defender_th"),
+        "stars": ints("stars"),
+        "destruction": np.array([v or 0.0 for v in raw["destruction_percentage"]], dtype=float),
+        "attack_order": ints("attack_order"),
+        "hours_into_war": hours_into_war(),
+    }
+
+
+def compute_player_metrics(cols: Dict[str, np.ndarray]) -> Dict[str, Dict[str, Any]]:
+    """Per-player metrics for the given attack columns, keyed by player tag.
+
+    All aggregates are grouped with one np.unique + np.bincount pass:
+    attacks, stars, star efficiency (stars/attack), average destruction,
+    three-star rate, hit-up/hit-down rates (by town hall, falling back to map
+    position) and median hours into the battle day.
+    """
+    n = len(cols["stars"])
+    if n == 0:
+        return {}
+    tags, idx = np.unique(cols["player_tag"], return_inverse=True)
+    k = len(tags)
+
+    att_th, def_th = cols["attacker_th"], cols["defender_th"]
+    att_pos, def_pos = cols["attacker_position"], cols["defender_position"]
+    have_th = (att_th > 0) & (def_th > 0)
+    have_pos = (att_pos > 0) & (def_pos > 0)
+    # Map position 1 is the strongest base, so a lower defender position is a hit up
+    hit_up = np.where(have_th, def_th > att_th, have_pos & (def_pos < att_pos))
+    hit_down = np.where(have_th, def_th < att_th, have_pos & (def_pos > att_pos))
+
+    attacks = np.bincount(idx, minlength=k)
+    stars = np.bincount(idx, weights=cols["stars"], minlength=k)
+    destruction = np.bincount(idx, weights=cols["destruction"], minlength=k)
+    three_stars = np.bincount(idx, weights=(cols["stars"] == 3), minlength=k)
+    ups = np.bincount(idx, weights=hit_up, minlength=k)
+    downs = np.bincount(idx, weights=hit_down, minlength=k)
+    war_ids, war_idx = np.unique(cols["war_tag"], return_inverse=True)
+    player_wars = np.unique(idx * len(war_ids) + war_idx)
+    wars = np.bincount(player_wars // len(war_ids), minlength=k)
+
+    # Median hours-into-war per player: sort by (player, hours) once and index the middles
+    hours = cols["hours_into_war"]
+    timed = ~np.isnan(hours)
+    median_hours = np.full(k, np.nan)
+    if timed.any():
+        t_idx, t_hours = idx[timed], hours[timed]
+        order = np.lexsort((t_hours, t_idx))
+        t_idx, t_hours = t_idx[order], t_hours[order]
+        counts = np.bincount(t_idx, minlength=k)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        has = counts > 0
+        lo = starts[has] + (counts[has] - 1) // 2
+        hi = starts[has] + counts[has] // 2
+        median_hours[has] = (t_hours[lo] + t_hours[hi]) / 2.0
+
+    # Latest name seen for each tag
+    names = np.empty(k, dtype=object)
+    names[idx] = cols["player_name"]
+
+    metrics = {}
+    for i, tag in enumerate(tags):
+        a = int(attacks[i])
+        metrics[tag] = {
+            'name': names[i],
+            'attacks': a,
+            'wars': int(wars[i]),
+            'stars': int(stars[i]),
+            'star_efficiency': round(float(stars[i]) / a, 2) if a else 0.0,
+            'avg_destruction': round(float(destruction[i]) / a, 1) if a else 0.0,
+            'three_star_rate': round(float(three_stars[i]) / a, 3) if a else 0.0,
+            'hit_up_rate': round(float(ups[i]) / a, 3) if a else 0.0,
+            'hit_down_rate': round(float(downs[i]) / a, 3) if a else 0.0,
+            'median_hours_into_war': None if np.isnan(median_hours[i]) else round(float(median_hours[i]), 1),
+        }
+    return metrics
+
+
+def compute_season_summary(cols: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """Clan-wide metrics for the given attack columns"""
+    n = len(cols["stars"])
+    if n == 0:
+        return {'attacks': 0, 'stars': 0, 'star_efficiency': 0.0, 'three_star_rate': 0.0,
+                'avg_destruction': 0.0, 'timing_histogram': [0] * (len(TIMING_BINS) - 1)}
+    hours = cols["hours_into_war"]
+    histogram, _ = np.histogram(hours[~np.isnan(hours)], bins=TIMING_BINS)
+    return {
+        'attacks': n,
+        'stars': int(cols["stars"].sum()),
+        'star_efficiency': round(float(cols["stars"].mean()), 2),
+        'three_star_rate': round(float((cols["stars"] == 3).mean()), 3),
+        'avg_destruction': round(float(cols["destruction"].mean()), 1),
+        'timing_histogram': histogram.tolist(),
+    }
+
+
+def _rows_version(season: Optional[str]) -> Tuple[int, int]:
+    """(max id, row count) of the stored attacks for a season; changes whenever any replica inserts"""
+    ensure_attack_table()
+    query = "SELECT COALESCE(MAX(id), 0) AS max_id, COUNT(*) AS n FROM war_attacks"
+    params: Tuple = ()
+    if season:
+        query += " WHERE season = %s"
+        params = (season,)
+    with get_optimized_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        row = cur.fetchone()
+    return (int(row['max_id']), int(row['n'])) if isinstance(row, dict) else (int(row[0]), int(row[1]))
+
+
+def _cached(season: Optional[str]) -> Dict[str, Any]:
+    version = _rows_version(season)
+    with _cache_lock:
+        entry = _metrics_cache.get(season)
+    if entry is not None and entry['version'] == version:
+        return entry
+    cols = load_attack_columns(season)
+    entry = {'players': compute_player_metrics(cols), 'summary': compute_season_summary(cols),
+             'version': version}
+    with _cache_lock:
+        _metrics_cache[season] = entry
+    return entry
+
+
+def current_season() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m")
+
+
+def get_player_metrics(season: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """Cached per-player metrics for a season ('YYYY-MM'), or all time if None"""
+    return _cached(season)['players']
+
+
+def get_season_summary(season: Optional[str] = None) -> Dict[str, Any]:
+    """Cached clan-wide metrics for a season ('YYYY-MM'), or all time if None"""
+    return _cached(season)['summary']
+
+
+def metrics_for_tag(tag: Optional[str], season: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Convenience lookup used by the leaderboard and bonus commands"""
+    if not tag:
+        return None
+    try:
+        return get_player_metrics(season).get(tag.upper())
+    except Exception as e:
+        logger.warning(f"War analytics unavailable: {e}")
+        return None